@@ -1,11 +1,133 @@
-from django.contrib import admin
-from .models import Product, Supplier, ConsumptionLog
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from . import ledger
+from .models import Product, Supplier, ConsumptionLog, StockMovement
+from .pagination import EstimatedCountPaginator
+
+# Same trade-off as the product list search (see INVENTORY_PRODUCT_SEARCH)
+PRODUCT_SEARCH_FIELDS = (
+    ("^name", "^sku")
+    if getattr(settings, "INVENTORY_PRODUCT_SEARCH", "contains") == "prefix"
+    else ("name", "sku")
+)
+
+
+class LargeTableChangeList(ChangeList):
+    def get_queryset(self, request, *args, **kwargs):
+        queryset = super().get_queryset(request, *args, **kwargs)
+        if self.model_admin.list_only:
+            queryset = queryset.only(*self.model_admin.list_only)
+        return queryset
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelists for tables too big to count or fetch whole rows from: the
+    total is estimated, and rows only load the ``list_only`` fields.
+    """
+
+    list_only = ()
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return LargeTableChangeList
+
+
+class ProductAutocompleteFilter(admin.SimpleListFilter):
+    """Product filter with a search box instead of a link per product."""
+
+    title = _("product")
+    parameter_name = "product__id__exact"
+    template = "admin/inventory/autocomplete_filter.html"
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        self.widget = AutocompleteSelect(
+            model._meta.get_field("product"),
+            model_admin.admin_site,
+            attrs={"class": "admin-autocomplete-filter", "data-width": "100%"},
+        )
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            return queryset.filter(product_id=int(self.value()))
+        except ValueError as e:
+            raise IncorrectLookupParameters(e)
+
+    def choices(self, changelist):
+        field = forms.ModelChoiceField(Product.objects.only("name", "sku"), widget=self.widget)
+        self.widget.attrs["data-filter-url"] = changelist.get_query_string(
+            remove=[self.parameter_name]
+        )
+        yield {
+            "selected": self.value() is None,
+            "query_string": changelist.get_query_string(remove=[self.parameter_name]),
+            "display": _("All"),
+        }
+        yield {
+            "selected": self.value() is not None,
+            "widget": field.widget.render(self.parameter_name, self.value()),
+        }
+
+
+class StockAdjustmentForm(ActionForm):
+    stock_adjustment = forms.IntegerField(
+        required=False, label=_("Stock adjustment"), help_text=_("Negative to remove stock")
+    )
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     list_display = ("name", "sku", "current_stock", "minimum_stock_level")
-    search_fields = ("name", "sku")
+    list_only = list_display
+    # Unique, so indexed; also orders the autocomplete results
+    ordering = ("sku",)
+    search_fields = PRODUCT_SEARCH_FIELDS
+    action_form = StockAdjustmentForm
+    actions = ["adjust_stock"]
+
+    @admin.action(description=_("Adjust stock of selected products"), permissions=["change"])
+    def adjust_stock(self, request, queryset):
+        try:
+            adjustment = int(request.POST.get("stock_adjustment", ""))
+        except ValueError:
+            adjustment = 0
+        if not adjustment:
+            self.message_user(request, _("Enter a non-zero stock adjustment."), messages.ERROR)
+            return
+        movements = ledger.adjust_stock(
+            queryset.values_list("pk", flat=True), adjustment, timezone.localdate(), "Bulk adjustment"
+        )
+        self.message_user(
+            request, _("Adjusted stock of %d products.") % len(movements), messages.SUCCESS
+        )
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(LargeTableAdmin):
+    list_display = ("product", "kind", "quantity", "date", "created_at")
+    list_select_related = ("product",)
+    list_only = ("kind", "quantity", "date", "created_at", "product__name", "product__sku")
+    list_filter = ("kind",)
+    date_hierarchy = "date"
+    autocomplete_fields = ("product",)
 
 
 @admin.register(Supplier)
@@ -14,6 +136,22 @@ class SupplierAdmin(admin.ModelAdmin):
 
 
 @admin.register(ConsumptionLog)
-class ConsumptionLogAdmin(admin.ModelAdmin):
+class ConsumptionLogAdmin(LargeTableAdmin):
     list_display = ("product", "quantity", "date")
-    list_filter = ("date", "product")
+    list_select_related = ("product",)
+    list_only = ("quantity", "date", "product__name", "product__sku")
+    list_filter = (ProductAutocompleteFilter,)
+    # Drill-down uses log_date_idx; replaces the date list_filter
+    date_hierarchy = "date"
+    autocomplete_fields = ("product",)
+
+    @property
+    def media(self):
+        widget_media = AutocompleteSelect(
+            ConsumptionLog._meta.get_field("product"), self.admin_site
+        ).media
+        return (
+            super().media
+            + widget_media
+            + forms.Media(js=["inventory/admin/autocomplete_filter.js"])
+        )
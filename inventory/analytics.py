@@ -0,0 +1,339 @@
+import logging
+import math
+from datetime import date, timedelta
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .columnar import (
+    bucket_means,
+    load_daily_usage,
+    load_stock_buckets,
+    load_stock_history,
+    load_usage_buckets,
+    logged_range,
+)
+from .instrumentation import span
+from .preprocessing import OUTLIER_METHODS, SMOOTHING_METHODS, preprocess
+from .trend_models import TREND_MODEL_REGISTRY, fit_cached, get_trend_model
+
+logger = logging.getLogger(__name__)
+
+TREND_MODELS = tuple(TREND_MODEL_REGISTRY)
+
+# Date windows of the detail page analysis, counted back from the last
+# logged day so they only move when the data does
+ANALYSIS_WINDOWS = [
+    ("30", "Last 30 days"),
+    ("90", "Last 90 days"),
+    ("365", "Last 365 days"),
+    ("all", "All history"),
+    ("custom", "Custom range"),
+]
+ANALYSIS_WINDOW_DAYS = {"30": 30, "90": 90, "365": 365}
+DEFAULT_ANALYSIS_WINDOW = getattr(settings, "INVENTORY_ANALYSIS_WINDOW", "365")
+# Trend models and depletion forecasts are fitted on at most this many
+# trailing days of the window
+FORECAST_WINDOW_DAYS = getattr(settings, "INVENTORY_FORECAST_WINDOW_DAYS", 365)
+# Longer windows are plotted as weekly, then monthly buckets
+MAX_CHART_POINTS = getattr(settings, "INVENTORY_CHART_MAX_POINTS", 400)
+# Largest smoothing window accepted from a query (the rolling median pads
+# every series by the window)
+MAX_SMOOTHING_WINDOW = 60
+
+
+def _smoothing_window(value):
+    window = int(value)
+    if not 1 <= window <= MAX_SMOOTHING_WINDOW:
+        raise ValueError(f"smoothing_window must be between 1 and {MAX_SMOOTHING_WINDOW}")
+    return window
+
+
+def _outlier_threshold(value):
+    threshold = float(value)
+    if not (math.isfinite(threshold) and threshold > 0):
+        raise ValueError("outlier_threshold must be a positive number")
+    return threshold
+
+
+def _query_number(query, name, parse, default, strict):
+    value = query.get(name)
+    if value is None:
+        return default
+    try:
+        return parse(value)
+    except ValueError:
+        if strict:
+            raise
+        return default
+
+
+def _query_date(query, name):
+    try:
+        return parse_date(query.get(name) or "")
+    except ValueError:
+        return None
+
+
+class AnalysisParams(NamedTuple):
+    """Settings from the product detail "Analysis" form."""
+
+    consumption_model: str = "p1"  # a TREND_MODEL_REGISTRY code
+    stock_model: str = "p1"
+    enable_smoothing: bool = False
+    smoothing_window: int = 3
+    remove_outliers: bool = False
+    outlier_threshold: float = 2.0
+    window: str = DEFAULT_ANALYSIS_WINDOW  # an ANALYSIS_WINDOWS code
+    start: date = None  # bounds of the "custom" window, either may be None
+    end: date = None
+    outlier_method: str = "zscore"  # an OUTLIER_METHODS code
+    smoothing_method: str = "sma"  # a SMOOTHING_METHODS code
+
+    @classmethod
+    def from_query(cls, query, strict=False):
+        """
+        Settings from ``query``. Invalid numbers fall back to the defaults,
+        or raise ValueError when ``strict``; unknown codes always fall back.
+        """
+        consumption_model = query.get("consumption_model", "p1")
+        stock_model = query.get("stock_model", "p1")
+        window = query.get("window", DEFAULT_ANALYSIS_WINDOW)
+        if window not in dict(ANALYSIS_WINDOWS):
+            window = DEFAULT_ANALYSIS_WINDOW
+        custom = window == "custom"
+        outlier_method = query.get("outlier_method", "zscore")
+        smoothing_method = query.get("smoothing_method", "sma")
+        return cls(
+            consumption_model=consumption_model if consumption_model in TREND_MODELS else "p1",
+            stock_model=stock_model if stock_model in TREND_MODELS else "p1",
+            enable_smoothing=query.get("enable_smoothing") == "on",
+            smoothing_window=_query_number(query, "smoothing_window", _smoothing_window, 3, strict),
+            remove_outliers=query.get("remove_outliers") == "on",
+            outlier_threshold=_query_number(
+                query, "outlier_threshold", _outlier_threshold, 2.0, strict
+            ),
+            window=window,
+            start=_query_date(query, "start") if custom else None,
+            end=_query_date(query, "end") if custom else None,
+            outlier_method=outlier_method if outlier_method in dict(OUTLIER_METHODS) else "zscore",
+            smoothing_method=smoothing_method if smoothing_method in dict(SMOOTHING_METHODS) else "sma",
+        )
+
+    def as_query(self):
+        """Inverse of ``from_query``, for links that must keep the settings."""
+        query = {
+            "consumption_model": self.consumption_model,
+            "stock_model": self.stock_model,
+            "smoothing_window": self.smoothing_window,
+            "outlier_threshold": self.outlier_threshold,
+            "outlier_method": self.outlier_method,
+            "smoothing_method": self.smoothing_method,
+            "window": self.window,
+        }
+        for name in ("start", "end"):
+            if getattr(self, name) is not None:
+                query[name] = getattr(self, name).isoformat()
+        if self.enable_smoothing:
+            query["enable_smoothing"] = "on"
+        if self.remove_outliers:
+            query["remove_outliers"] = "on"
+        return query
+
+
+def load_daily_frame(product, start=None, end=None):
+    """
+    Daily consumption for ``product`` as a DataFrame indexed by date with a
+    ``quantity`` column and no gaps, or ``None`` when there is no data.
+    ``start``/``end`` optionally limit it to a date window.
+    """
+    # Read the daily rollup (one row per day) into arrays, no model instances
+    with span("analytics.fetch"):
+        usage = load_daily_usage(product.pk, start, end)
+    if not len(usage):
+        return None
+
+    # Fill 0 for missing days
+    with span("analytics.resample"):
+        dates, quantities = usage.dense()
+
+    with span("analytics.frame"):
+        index = pd.DatetimeIndex(dates, name="date", freq="D")
+        return pd.DataFrame({"quantity": quantities}, index=index)
+
+
+def prepare_daily_frame(daily_df, params):
+    # Outlier replacement, then smoothing (see inventory.preprocessing)
+    if params.remove_outliers or params.enable_smoothing:
+        daily_df["quantity"] = preprocess(daily_df["quantity"].to_numpy(dtype=float), params)
+    return daily_df
+
+
+def predict_days_left(daily_df, current_stock, stock_model, state=None):
+    """
+    Days until stock runs out: where the stock trend model reaches zero,
+    else current stock over average daily usage. ``state`` is an already
+    fitted stock model state, if any.
+    """
+    # Calculate average daily consumption (Naive Baseline)
+    avg_daily_usage = daily_df["quantity"].mean()
+    days_left_naive = 0
+    if avg_daily_usage > 0:
+        days_left_naive = current_stock / avg_daily_usage
+
+    # Prediction logic using Stock Trend Model
+    days_left = days_left_naive  # Default to naive
+
+    if len(daily_df) > 1:
+        try:
+            model = get_trend_model(stock_model)
+            if state is None:
+                state = model.fit(daily_df["stock_level"].values)
+            depletion = model.days_to_zero(state)
+            # If no crossing in future (e.g. slope up or never crossing),
+            # keep naive if model fails to predict depletion
+            if depletion is not None:
+                days_left = depletion
+        except Exception:
+            logger.exception("Stock depletion prediction failed")
+    return days_left
+
+
+def trend_state_key(product_pk, series, model_code, params):
+    """
+    Cache key of a trend state for ``fit_cached``, or ``None`` when the
+    series can't be extended in place. The key doesn't depend on the
+    window's start: as it moves forward, models that can drop the leading
+    days keep their state and the others are refitted. Smoothing is
+    trailing and leaves earlier days alone as days are appended, but
+    outlier replacement depends on the whole series, so its prepared
+    consumption is refitted every time. The stock series isn't prepared;
+    its past days only move when current_stock is set directly or logs are
+    imported without a stock update (see inventory.ledger), and are then
+    refitted too.
+    """
+    prep = "raw"
+    if series == "consumption":
+        if params.remove_outliers:
+            return None
+        prep = "-".join(
+            str(value)
+            for value in (int(params.enable_smoothing), params.smoothing_window, params.smoothing_method)
+        )
+    return f"trend_state:{product_pk}:{series}:{model_code}:{prep}"
+
+
+def downsample_unit(first, last):
+    """The bucket ("day", "week" or "month") a window is plotted in."""
+    days = int((last - first).astype(np.int64)) + 1
+    if days <= MAX_CHART_POINTS:
+        return "day"
+    if days <= MAX_CHART_POINTS * 7:
+        return "week"
+    return "month"
+
+
+def analyse_product(product, params):
+    """
+    Run the consumption/stock analysis behind the product detail page.
+
+    Returns ``None`` when the product has no consumption data in the
+    ``params`` window, otherwise a dict with:
+
+    - ``daily_df``: the processed daily series (``quantity`` and
+      ``stock_level`` columns) of the window's last ``FORECAST_WINDOW_DAYS``
+      days, which the trend models and the forecast are fitted on
+    - ``dates``/``quantity``/``stock_level``: the window as plotted, per
+      ``unit`` (see ``downsample_unit``). Daily, these are ``daily_df``'s
+      columns when it covers the window, otherwise each bucket's average
+      daily consumption and closing stock, dated by its last day. Outlier
+      replacement and smoothing apply to the days before they are bucketed.
+    - trend lines over ``trend_dates`` and RMSEs for both series and, when
+      depletion is predicted, ``prediction_date``/``days_remaining``.
+      ``days_left`` is the raw prediction.
+
+    The database reads scale with the window's days or buckets (days when
+    the consumption is prepared), never with the whole history.
+    """
+    with span("analytics.fetch"):
+        logged = logged_range(
+            product.pk, params.start, params.end, ANALYSIS_WINDOW_DAYS.get(params.window)
+        )
+    if logged is None:
+        return None
+    first, last = logged
+    fit_first = max(first, last - (FORECAST_WINDOW_DAYS - 1))
+
+    daily_df = load_daily_frame(product, fit_first.item(), last.item())
+    with span("analytics.prepare"):
+        daily_df = prepare_daily_frame(daily_df, params)
+
+    # Recorded stock history (consumption, receipts and adjustments), so
+    # unaffected by the consumption smoothing/outlier settings
+    trend_dates = daily_df.index.values.astype("datetime64[D]")
+    with span("analytics.stock"):
+        daily_df["stock_level"] = load_stock_history(
+            product.pk, trend_dates[0], len(trend_dates), product.current_stock
+        )
+
+    unit = downsample_unit(first, last)
+    if unit == "day" and trend_dates[0] == first:
+        dates = trend_dates
+        quantity = daily_df["quantity"].to_numpy(dtype=float)
+        stock_level = daily_df["stock_level"].to_numpy(dtype=float)
+    else:
+        with span("analytics.downsample"):
+            if params.remove_outliers or params.enable_smoothing:
+                # The settings work on days: prepare the window's, then bucket them
+                window_df = prepare_daily_frame(load_daily_frame(product, first.item(), last.item()), params)
+                dates, quantity = bucket_means(
+                    window_df.index.values.astype("datetime64[D]"), window_df["quantity"].to_numpy(), unit
+                )
+            else:
+                dates, quantity = load_usage_buckets(product.pk, first, last, unit)
+            _, stock_level = load_stock_buckets(product.pk, first, last, unit, product.current_stock)
+
+    result = {
+        "daily_df": daily_df,
+        "unit": unit,
+        "dates": dates,
+        "quantity": quantity,
+        "stock_level": stock_level,
+        "trend_dates": trend_dates,
+        "consumption_trend": None,
+        "consumption_rmse": None,
+        "stock_trend": None,
+        "stock_rmse": None,
+    }
+
+    states = {}
+    first_day = int(trend_dates[0].astype(np.int64))
+    if len(daily_df) > 1:
+        for column, model_code, name in (
+            ("quantity", params.consumption_model, "consumption"),
+            ("stock_level", params.stock_model, "stock"),
+        ):
+            model = get_trend_model(model_code)
+            key = trend_state_key(product.pk, name, model.code, params)
+            with span("analytics.fit"):
+                try:
+                    y = daily_df[column].values
+                    states[name] = model.fit(y) if key is None else fit_cached(model, y, key, first_day)
+                except Exception:
+                    continue
+                result[f"{name}_trend"] = model.trend(states[name])
+                result[f"{name}_rmse"] = model.rmse(states[name])
+
+    with span("analytics.predict"):
+        days_left = predict_days_left(
+            daily_df, product.current_stock, params.stock_model, states.get("stock")
+        )
+    result["days_left"] = days_left
+    if days_left > 0:
+        result["prediction_date"] = timezone.now().date() + timedelta(days=days_left)
+        result["days_remaining"] = int(days_left)
+    return result
@@ -0,0 +1,199 @@
+"""
+Read API payloads: products with their stock status, forecast snapshot,
+analysis and plotted series as compact JSON.
+
+``fields=`` selects what is returned, so the status, analysis and series
+are only looked up when asked for. Response validators come from the
+products' data versions (see inventory.versioning) rather than from the
+payload, so a conditional request for unchanged data is answered without
+computing anything.
+"""
+import hashlib
+from datetime import datetime, time
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .forecast_cache import get_analysis
+from .models import Product
+from .status import attach_stock_status
+from .versioning import get_portfolio_version, get_product_versions, version_timestamp
+from .workers import get_detail_analysis
+
+API_FIELDS = (
+    "id",
+    "sku",
+    "name",
+    "current_stock",
+    "minimum_stock_level",
+    "suppliers",
+    "status",
+    "forecast",
+    "analysis",
+    "series",
+)
+# The analysis and series run the trend models, so they are opt-in
+DEFAULT_API_FIELDS = API_FIELDS[:-2]
+# Fields whose values depend on the AnalysisParams in the query
+ANALYSIS_FIELDS = {"analysis", "series"}
+
+MAX_BATCH_SKUS = getattr(settings, "INVENTORY_API_MAX_SKUS", 100)
+API_PAGE_SIZE = getattr(settings, "INVENTORY_API_PAGE_SIZE", 100)
+# Series values are rounded to keep payloads small
+SERIES_DECIMALS = 3
+# No whitespace between tokens
+JSON_DUMPS_PARAMS = {"separators": (",", ":")}
+
+
+def parse_fields(value):
+    """The ``fields=`` list (comma-separated) in ``API_FIELDS`` order."""
+    if not value:
+        return DEFAULT_API_FIELDS
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = requested.difference(API_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in API_FIELDS if name in requested)
+
+
+def parse_skus(query):
+    """SKUs from repeated and/or comma-separated ``sku=``, in request order."""
+    skus = []
+    for value in query.getlist("sku"):
+        skus.extend(sku.strip() for sku in value.split(",") if sku.strip())
+    skus = list(dict.fromkeys(skus))
+    if len(skus) > MAX_BATCH_SKUS:
+        raise ValueError(f"At most {MAX_BATCH_SKUS} SKUs per request")
+    return skus
+
+
+def api_queryset(fields):
+    queryset = Product.objects.order_by("sku", "id")
+    if "forecast" in fields:
+        queryset = queryset.select_related("forecast_snapshot")
+    if "suppliers" in fields:
+        queryset = queryset.prefetch_related("suppliers")
+    return queryset
+
+
+def _snapshot(product):
+    try:
+        return product.forecast_snapshot
+    except Product.forecast_snapshot.RelatedObjectDoesNotExist:
+        return None
+
+
+def _supplier_pks(product):
+    return [supplier.pk for supplier in product.suppliers.all()]
+
+
+def api_validators(products, fields, params, extra=(), today=None, listing=False):
+    """
+    ``(etag, last_modified)`` for the payload of ``products``, from their
+    data versions, the request and the loaded snapshot and supplier rows
+    (stale marks change without a version bump). The status is relative to
+    ``today``, so neither validator survives midnight. With ``listing``
+    which products are returned can change as well (a page or a batch
+    losing one), so Last-Modified also follows the portfolio version,
+    which every product write bumps.
+    """
+    today = today or timezone.now().date()
+    versions = get_product_versions([p.pk for p in products])
+    snapshots = [_snapshot(p) for p in products] if "forecast" in fields else []
+    key = (
+        tuple((p.pk, versions[p.pk]) for p in products),
+        tuple(snapshot and (snapshot.computed_at, snapshot.is_stale) for snapshot in snapshots),
+        tuple(_supplier_pks(p) for p in products) if "suppliers" in fields else None,
+        fields,
+        tuple(params) if ANALYSIS_FIELDS.intersection(fields) else None,
+        tuple(extra),
+        today,
+    )
+    etag = '"%s"' % hashlib.sha1(repr(key).encode()).hexdigest()
+    last_modified = max(
+        [datetime.combine(today, time.min, tzinfo=timezone.get_current_timezone())]
+        + [version_timestamp(version) for version in versions.values()]
+        + [snapshot.computed_at for snapshot in snapshots if snapshot is not None]
+        + ([version_timestamp(get_portfolio_version())] if listing else [])
+    )
+    return etag, last_modified
+
+
+def _rounded(values):
+    return None if values is None else np.round(np.asarray(values, dtype=float), SERIES_DECIMALS).tolist()
+
+
+def _dates(values):
+    return np.datetime_as_string(values).tolist()
+
+
+def forecast_payload(snapshot):
+    if snapshot is None:
+        return None
+    return {
+        "computed_at": snapshot.computed_at.isoformat(),
+        "avg_daily_usage": snapshot.avg_daily_usage,
+        "days_left": snapshot.days_left,
+        "depletion_date": snapshot.depletion_date and snapshot.depletion_date.isoformat(),
+        "lead_time_days": snapshot.lead_time_days,
+        "order_by_date": snapshot.order_by_date and snapshot.order_by_date.isoformat(),
+        "recommended_order_quantity": snapshot.recommended_order_quantity,
+        "is_stale": snapshot.is_stale,
+    }
+
+
+def analysis_payload(analysis):
+    if analysis is None:
+        return None
+    prediction_date = analysis.get("prediction_date")
+    return {
+        "consumption_rmse": analysis["consumption_rmse"],
+        "stock_rmse": analysis["stock_rmse"],
+        "days_left": float(analysis["days_left"]),
+        "prediction_date": prediction_date and prediction_date.isoformat(),
+    }
+
+
+def series_payload(analysis):
+    """The plotted series column-wise, one array per column."""
+    if analysis is None:
+        return None
+    return {
+        "unit": analysis["unit"],
+        "dates": _dates(analysis["dates"]),
+        "quantity": _rounded(analysis["quantity"]),
+        "stock_level": _rounded(analysis["stock_level"]),
+        "trend_dates": _dates(analysis["trend_dates"]),
+        "consumption_trend": _rounded(analysis["consumption_trend"]),
+        "stock_trend": _rounded(analysis["stock_trend"]),
+    }
+
+
+def product_payloads(products, fields, params):
+    """One dict per product in ``products`` with ``fields`` only."""
+    if "status" in fields:
+        attach_stock_status(products)
+    payloads = []
+    for product in products:
+        payload = {}
+        for name in ("id", "sku", "name", "current_stock", "minimum_stock_level"):
+            if name in fields:
+                payload[name] = getattr(product, name)
+        if "suppliers" in fields:
+            payload["suppliers"] = _supplier_pks(product)
+        if "status" in fields:
+            payload["status"] = product.status_alert
+            payload["days_left"] = product.days_left
+        if "forecast" in fields:
+            payload["forecast"] = forecast_payload(_snapshot(product))
+        if "series" in fields:
+            # The full result is needed anyway, so the analysis comes with it
+            analysis = get_analysis(product, params)
+            payload["series"] = series_payload(analysis)
+        elif "analysis" in fields:
+            analysis = get_detail_analysis(product, params)
+        if "analysis" in fields:
+            payload["analysis"] = analysis_payload(analysis)
+        payloads.append(payload)
+    return payloads
@@ -0,0 +1,234 @@
+"""
+Scripted performance scenarios for the list, detail, chart, admin and
+forecast paths, with latency percentiles, query counts and peak memory
+recorded to (and checked against) a JSON baseline. Run through the
+run_benchmarks management command.
+"""
+import functools
+import itertools
+import json
+import time
+import tracemalloc
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from . import charts, forecast_cache
+from .analytics import AnalysisParams
+from .forecasting import forecast_products, load_consumption_matrix
+from .models import PrecomputedAnalysis, Product
+from .preprocessing import preprocess
+
+# Allowed slowdown / memory growth over the baseline before failing
+DEFAULT_TOLERANCE = 0.25
+# Latency below this many milliseconds is treated as noise
+NOISE_FLOOR_MS = 5.0
+
+
+class Scenario:
+    def __init__(self, name, run, reset=None):
+        self.name = name
+        self.run = run
+        self.reset = reset
+
+
+def _get(client, url):
+    def run():
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+    return run
+
+
+def clear_caches():
+    """Empty every result cache, local and shared."""
+    cache.clear()
+    forecast_cache.local_cache.clear()
+    charts.render_cache.clear()
+
+
+def _cold(pk):
+    # Also skip the precomputed analysis so the page computes it
+    def reset():
+        clear_caches()
+        PrecomputedAnalysis.objects.filter(product_id=pk).update(is_stale=True)
+    return reset
+
+
+def build_scenarios(client):
+    """
+    Scenarios over the current database; needs at least one product with
+    logs. Each detail page is measured warm, served from the caches after
+    the first request, and cold, with every cache emptied before each
+    request. The cold ones run after the warm ones since they mark the
+    product's precomputed analysis stale.
+    """
+    by_volume = list(
+        Product.objects.annotate(days=Count("daily_consumption"))
+        .filter(days__gt=0)
+        .order_by("-days", "pk")
+        .values_list("pk", flat=True)
+    )
+    busiest, median = by_volume[0], by_volume[len(by_volume) // 2]
+    first_letters = Product.objects.order_by("name").values_list("name", flat=True).first()[:3]
+
+    scenarios = [
+        Scenario("list", _get(client, "/")),
+        Scenario("list_cold_cache", _get(client, "/"), reset=clear_caches),
+        Scenario("list_sort_status", _get(client, "/?sort=status")),
+        Scenario("list_filter_critical", _get(client, "/?status=critical")),
+        Scenario("list_search", _get(client, f"/?q={first_letters}")),
+        Scenario("reorder_dashboard", _get(client, "/reorder/")),
+        Scenario("admin_products", _get(client, "/admin/inventory/product/")),
+        Scenario("admin_logs", _get(client, "/admin/inventory/consumptionlog/")),
+        Scenario("admin_logs_by_product", _get(client, f"/admin/inventory/consumptionlog/?product__id__exact={busiest}")),
+    ]
+
+    for label, pk in (("busiest", busiest), ("median", median)):
+        cold = []
+        for consumption_model, stock_model, smoothing, outliers in itertools.product(
+            ("p1", "p2"), ("p1", "p2"), (False, True), (False, True)
+        ):
+            params = AnalysisParams(consumption_model, stock_model, smoothing, 3, outliers, 2.0)
+            query = "&".join(f"{k}={v}" for k, v in params.as_query().items())
+            name = f"detail_{label}_{consumption_model}_{stock_model}" + (
+                "_smooth" if smoothing else ""
+            ) + ("_outliers" if outliers else "")
+            scenarios.append(Scenario(name, _get(client, f"/product/{pk}/?{query}")))
+            cold.append(Scenario(f"{name}_cold", _get(client, f"/product/{pk}/?{query}"), reset=_cold(pk)))
+        scenarios.extend(cold)
+        scenarios.append(
+            Scenario(
+                f"chart_{label}_render",
+                _get(client, f"/product/{pk}/chart/consumption.png"),
+                reset=charts.render_cache.clear,
+            )
+        )
+
+    scenarios.append(Scenario("forecast_batch_all", lambda: forecast_products()))
+
+    # Preprocessing alone, on the whole matrix and row by row as the
+    # detail page does. The matrix is loaded by the first of these to run,
+    # outside the timing.
+    @functools.cache
+    def inputs():
+        matrix = load_consumption_matrix()
+        return matrix, [row[: int(n)] for row, n in zip(matrix.quantities, matrix.lengths)]
+
+    for outlier_method, smoothing_method in (("zscore", "sma"), ("mad", "ema"), ("iqr", "median")):
+        params = AnalysisParams(
+            enable_smoothing=True,
+            remove_outliers=True,
+            outlier_method=outlier_method,
+            smoothing_method=smoothing_method,
+        )
+        name = f"{outlier_method}_{smoothing_method}"
+        scenarios.append(
+            Scenario(
+                f"preprocess_batch_{name}",
+                lambda params=params: preprocess(inputs()[0].quantities, params, inputs()[0].mask),
+                reset=inputs,
+            )
+        )
+        scenarios.append(
+            Scenario(
+                f"preprocess_rows_{name}",
+                lambda params=params: [preprocess(row, params) for row in inputs()[1]],
+                reset=inputs,
+            )
+        )
+    return scenarios
+
+
+def measure(scenario, iterations, warmup=1):
+    for _ in range(warmup):
+        if scenario.reset:
+            scenario.reset()
+        scenario.run()
+
+    timings, queries = [], []
+    for _ in range(iterations):
+        if scenario.reset:
+            scenario.reset()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            scenario.run()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured))
+
+    # Separate pass: tracemalloc slows everything down
+    if scenario.reset:
+        scenario.reset()
+    tracemalloc.start()
+    try:
+        scenario.run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {
+        "iterations": iterations,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "queries": max(queries),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(iterations=20, only=None, progress=None):
+    User = get_user_model()
+    user, _ = User.objects.get_or_create(
+        username="benchmark", defaults={"is_staff": True, "is_superuser": True}
+    )
+    client = Client()
+    client.force_login(user)
+
+    results = {}
+    for scenario in build_scenarios(client):
+        if only and not any(pattern in scenario.name for pattern in only):
+            continue
+        results[scenario.name] = measure(scenario, iterations)
+        if progress:
+            progress(scenario.name, results[scenario.name])
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Return a list of human-readable regressions (empty when none). Scenarios
+    on only one side, new ones or those left out by ``--only``, are skipped.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        if current["queries"] > previous["queries"]:
+            regressions.append(f"{name}: queries {previous['queries']} -> {current['queries']}")
+        for metric in ("p50_ms", "p95_ms"):
+            limit = max(previous[metric] * (1 + tolerance), previous[metric] + NOISE_FLOOR_MS)
+            if current[metric] > limit:
+                regressions.append(f"{name}: {metric} {previous[metric]} -> {current[metric]}")
+        limit = previous["peak_memory_kb"] * (1 + tolerance) + 64
+        if current["peak_memory_kb"] > limit:
+            regressions.append(
+                f"{name}: peak_memory_kb {previous['peak_memory_kb']} -> {current['peak_memory_kb']}"
+            )
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results, dataset):
+    with open(path, "w") as f:
+        json.dump({"dataset": dataset, "scenarios": results}, f, indent=2, sort_keys=True)
@@ -0,0 +1,251 @@
+"""
+Chart rendering on ``Figure``/``FigureCanvasAgg`` objects, never pyplot.
+
+Each kind of chart is drawn on pooled figures whose axes, lines and labels
+are created once; a render only swaps the line data and legend labels, so
+most of the cost is rasterising. A figure is used by one thread at a time,
+which makes concurrent renders safe without a global lock.
+"""
+import hashlib
+import io
+import json
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from .analytics import AnalysisParams
+from .forecast_cache import get_analysis
+from .instrumentation import record_cache, span
+from .lru import BoundedLRUCache
+from .models import PrecomputedAnalysis
+
+CHART_KINDS = ("consumption", "stock")
+CHART_CONTENT_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    # Series data for client-side plotting
+    "json": "application/json",
+}
+# Format the background workers store for the default analysis settings
+PRECOMPUTED_CHART_FORMAT = "png"
+
+CHART_SIZE = tuple(getattr(settings, "INVENTORY_CHART_SIZE", (10, 5)))  # inches
+CHART_DPI = getattr(settings, "INVENTORY_CHART_DPI", 100)
+# Idle figures kept per kind, size and DPI; busier moments create extras
+CHART_POOL_SIZE = getattr(settings, "INVENTORY_CHART_POOL_SIZE", 4)
+
+# Rendered charts, keyed by product data version and analysis settings.
+# Bounded by total bytes so a burst of distinct settings can't exhaust memory.
+render_cache = BoundedLRUCache(
+    getattr(settings, "INVENTORY_CHART_CACHE_BYTES", 32 * 1024 * 1024)
+)
+
+CHART_STYLES = {
+    "consumption": {
+        "title": "Daily Consumption Trend",
+        "ylabel": "Quantity",
+        "series": "quantity",
+        "label": "Consumption",
+        "bucket_label": "Consumption ({}ly average)",
+        "line": {"marker": "o", "linestyle": "-"},
+        "min_level": True,
+    },
+    "stock": {
+        "title": "Stock Level History",
+        "ylabel": "Units Remaining",
+        "series": "stock_level",
+        "label": "Stock Level",
+        "bucket_label": "Stock Level (end of {})",
+        "line": {"marker": "s", "linestyle": "-", "color": "green"},
+        "min_level": False,
+    },
+}
+
+
+def chart_cache_key(product_pk, version, kind, fmt, params):
+    return (product_pk, version, kind, fmt) + tuple(params)
+
+
+def chart_etag(key):
+    return '"%s"' % hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+class ChartFigure:
+    """A figure for one kind of chart with its artists created up front."""
+
+    def __init__(self, kind, size=CHART_SIZE, dpi=CHART_DPI):
+        style = CHART_STYLES[kind]
+        self.style = style
+        self.figure = Figure(figsize=size, dpi=dpi)
+        FigureCanvasAgg(self.figure)
+        # Fixed margins instead of tight_layout, which re-measures every text
+        self.figure.subplots_adjust(left=0.08, right=0.97, bottom=0.1, top=0.92)
+        ax = self.axes = self.figure.add_subplot()
+        ax.xaxis_date()
+        ax.set_title(style["title"])
+        ax.set_xlabel("Date")
+        ax.set_ylabel(style["ylabel"])
+        ax.grid(True)
+        (self.data_line,) = ax.plot([], [], label=style["label"], **style["line"])
+        (self.trend_line,) = ax.plot([], [], "r--", linewidth=2)
+        self.min_line = None
+        if style["min_level"]:
+            self.min_line = ax.axhline(y=0, color="red", linestyle=":", linewidth=2)
+
+    def update(self, dates, values, trend, trend_label, min_level=None, label=None, trend_dates=None):
+        self.data_line.set_data(dates, values)
+        self.data_line.set_label(label or self.style["label"])
+        handles = [self.data_line]
+        self.trend_line.set_visible(trend is not None)
+        if trend is not None:
+            # Fitted on the trailing days, which may be plotted as buckets
+            self.trend_line.set_data(dates if trend_dates is None else trend_dates, trend)
+            self.trend_line.set_label(trend_label)
+            handles.append(self.trend_line)
+        else:
+            # Hidden lines still count towards the data limits
+            self.trend_line.set_data([], [])
+        if self.min_line is not None:
+            self.min_line.set_ydata([min_level, min_level])
+        self.axes.relim()
+        self.axes.autoscale_view()
+        self.axes.legend(handles=handles)
+
+    def save(self, fmt):
+        buf = io.BytesIO()
+        self.figure.savefig(buf, format=fmt)
+        return buf.getvalue()
+
+
+class FigurePool:
+    """Reusable ChartFigures per (kind, size, dpi), one borrower at a time."""
+
+    def __init__(self, max_idle=CHART_POOL_SIZE):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def figure(self, kind, size=CHART_SIZE, dpi=CHART_DPI):
+        key = (kind, tuple(size), dpi)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            chart = idle.pop() if idle else None
+        if chart is None:
+            chart = ChartFigure(kind, size, dpi)
+        yield chart
+        # Not returned if the render raised: its state is unknown
+        with self._lock:
+            if len(self._idle[key]) < self.max_idle:
+                self._idle[key].append(chart)
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+
+
+figure_pool = FigurePool()
+
+
+def chart_series(product, analysis, kind, params):
+    """The data behind a chart, as plotted."""
+    style = CHART_STYLES[kind]
+    trend = analysis[f"{kind}_trend"]
+    model = params.consumption_model if kind == "consumption" else params.stock_model
+    unit = analysis["unit"]
+    series = {
+        "unit": unit,
+        "label": style["label"] if unit == "day" else style["bucket_label"].format(unit),
+        "dates": analysis["dates"],
+        "values": analysis[style["series"]],
+        "trend_dates": analysis["trend_dates"],
+        "trend": None if trend is None else np.asarray(trend, dtype=float),
+        "trend_label": None,
+        "min_level": product.minimum_stock_level if style["min_level"] else None,
+    }
+    if trend is not None:
+        series["trend_label"] = f'Trend ({model}, RMSE={analysis[f"{kind}_rmse"]:.2f})'
+    return series
+
+
+def series_json(kind, series):
+    return json.dumps(
+        {
+            "kind": kind,
+            "unit": series["unit"],
+            "label": series["label"],
+            "dates": np.datetime_as_string(series["dates"]).tolist(),
+            "values": series["values"].tolist(),
+            "trend_dates": np.datetime_as_string(series["trend_dates"]).tolist(),
+            "trend": None if series["trend"] is None else series["trend"].tolist(),
+            "trend_label": series["trend_label"],
+            "min_level": series["min_level"],
+        }
+    ).encode()
+
+
+def render_chart(product, analysis, kind, params, fmt="png", size=CHART_SIZE, dpi=CHART_DPI):
+    series = chart_series(product, analysis, kind, params)
+    if fmt == "json":
+        return series_json(kind, series)
+
+    with span("chart.render"), figure_pool.figure(kind, size, dpi) as chart:
+        chart.update(
+            series["dates"],
+            series["values"],
+            series["trend"],
+            series["trend_label"],
+            series["min_level"],
+            series["label"],
+            series["trend_dates"],
+        )
+        with span("chart.savefig"):
+            return chart.save(fmt)
+
+
+def get_precomputed_chart(product, kind, fmt, params):
+    """
+    ``(found, content)`` for the chart stored by the background workers,
+    if it matches and is fresh. ``content`` is ``None`` for "no data".
+    """
+    if fmt != PRECOMPUTED_CHART_FORMAT or params != AnalysisParams():
+        return False, None
+    row = (
+        PrecomputedAnalysis.objects.filter(product=product, is_stale=False)
+        .values_list("has_data", f"{kind}_chart")
+        .first()
+    )
+    record_cache("precomputed_chart", row is not None, row is None)
+    if row is None:
+        return False, None
+    has_data, content = row
+    return True, bytes(content) if has_data else None
+
+
+def get_chart(product, version, kind, fmt, params):
+    """
+    Return the rendered chart bytes for ``product`` at data ``version``, or
+    ``None`` when there is not enough data. Renders only when neither the
+    cache nor the background workers have it.
+    """
+    key = chart_cache_key(product.pk, version, kind, fmt, params)
+    content = render_cache.get(key)
+    record_cache("chart", content is not None, content is None)
+    if content is not None:
+        return content
+    found, content = get_precomputed_chart(product, kind, fmt, params)
+    if found:
+        if content is not None:
+            render_cache.set(key, content)
+        return content
+
+    analysis = get_analysis(product, params)
+    if analysis is None:
+        return None
+    content = render_chart(product, analysis, kind, params, fmt)
+    render_cache.set(key, content)
+    return content
@@ -0,0 +1,309 @@
+"""
+Columnar reads: run a ``values_list()`` query on a raw cursor and return
+one typed ``numpy`` array per column, without model instances or per-row
+field converters. Daily usage is read from the rollup or, when asked,
+aggregated from raw logs with a database-side GROUP BY date. Stock history
+is read from the DailyStockBalance ledger (see inventory.ledger). Long
+ranges can be read as weekly or monthly buckets, summed in the database.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from typing import NamedTuple
+
+import numpy as np
+from django.db import connections
+from django.db.models import Case, DateField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, TruncMonth, TruncWeek
+
+from .models import ConsumptionLog, DailyConsumption, DailyStockBalance, Product
+
+# Products whose ledger windows load_stock_matrix reads per query, within
+# the bound parameters every supported database accepts
+STOCK_MATRIX_BATCH_SIZE = 250
+
+
+class DailyUsage(NamedTuple):
+    dates: np.ndarray  # datetime64[D], ascending, one entry per logged day
+    quantities: np.ndarray  # int64
+
+    def __len__(self):
+        return len(self.dates)
+
+    def dense(self):
+        """
+        ``(dates, quantities)`` covering every day from the first to the last
+        logged one, with 0 for days without logs.
+        """
+        if not len(self.dates):
+            return self
+        offsets = (self.dates - self.dates[0]).astype(np.int64)
+        quantities = np.zeros(offsets[-1] + 1, dtype=self.quantities.dtype)
+        quantities[offsets] = self.quantities
+        dates = self.dates[0] + np.arange(len(quantities))
+        return DailyUsage(dates, quantities)
+
+
+def fetch_columns(queryset, dtypes):
+    """
+    Evaluate ``queryset`` (a ``values_list()`` query whose model fields come
+    before any annotations) and return its columns as arrays of ``dtypes``.
+
+    Dates arrive as ISO strings (SQLite) or ``date`` objects (PostgreSQL);
+    both convert straight to ``datetime64[D]``.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    if not rows:
+        return [np.empty(0, dtype=dtype) for dtype in dtypes]
+    return [np.array(column, dtype=dtype) for column, dtype in zip(zip(*rows), dtypes)]
+
+
+def _window(queryset, start, end):
+    if start is not None:
+        queryset = queryset.filter(date__gte=start)
+    if end is not None:
+        queryset = queryset.filter(date__lte=end)
+    return queryset
+
+
+def load_daily_usage(product_id, start=None, end=None, from_logs=False):
+    """
+    Per-day consumption of one product between ``start`` and ``end``
+    (inclusive, either may be ``None``) as a ``DailyUsage``.
+
+    Reads the DailyConsumption rollup, or with ``from_logs`` sums raw
+    ConsumptionLog rows per day in the database. Either way the cost scales
+    with the number of days, not log rows.
+    """
+    if from_logs:
+        queryset = (
+            _window(ConsumptionLog.objects.filter(product_id=product_id), start, end)
+            .order_by("date")
+            .values_list("date")
+            .annotate(total=Sum("quantity"))
+        )
+    else:
+        queryset = _window(
+            DailyConsumption.objects.filter(product_id=product_id), start, end
+        ).order_by("date").values_list("date", "total_quantity")
+    dates, quantities = fetch_columns(queryset, ["datetime64[D]", np.int64])
+    return DailyUsage(dates, quantities)
+
+
+def logged_range(product_id, start=None, end=None, days=None):
+    """
+    ``(first, last)`` logged days (``datetime64[D]``) of one product between
+    ``start`` and ``end`` (inclusive, either may be ``None``), or ``None``
+    if there are none. With ``days`` the range is at most the last ``days``
+    days up to ``last``. Two index lookups, however long the history.
+    """
+    logged = DailyConsumption.objects.filter(product_id=product_id)
+    last = _window(logged, None, end).order_by("-date").values_list("date", flat=True).first()
+    if last is None:
+        return None
+    if days is not None:
+        earliest = last - timedelta(days=days - 1)
+        start = earliest if start is None else max(start, earliest)
+    first = _window(logged, start, last).order_by("date").values_list("date", flat=True).first()
+    if first is None:
+        return None
+    return np.datetime64(first, "D"), np.datetime64(last, "D")
+
+
+def bucket_bounds(first, last, unit):
+    """
+    ``(begins, ends)`` of the ``unit`` ("day", "week" or "month") buckets
+    covering ``first`` to ``last`` (``datetime64[D]``), clipped to them.
+    Weeks start on Monday, as ``TruncWeek``.
+    """
+    if unit == "month":
+        starts = np.arange(
+            first.astype("datetime64[M]"), last.astype("datetime64[M]") + 1
+        ).astype("datetime64[D]")
+    elif unit == "week":
+        # The epoch was a Thursday
+        starts = np.arange(first - (first.astype(np.int64) + 3) % 7, last + 1, 7)
+    else:
+        starts = np.arange(first, last + 1)
+    begins = starts.copy()
+    begins[0] = first
+    return begins, np.append(starts[1:] - 1, last)
+
+
+def _bucket_sums(queryset, field, first, last, unit):
+    # Sum ``field`` per bucket in the database; buckets without rows get 0
+    queryset = _window(queryset, first.item(), last.item())
+    if unit == "day":
+        sums = queryset.order_by("date").values_list("date", field)
+    else:
+        trunc = TruncMonth if unit == "month" else TruncWeek
+        sums = (
+            queryset.annotate(bucket=Cast(trunc("date"), DateField()))
+            .order_by("bucket")
+            .values_list("bucket")
+            .annotate(total=Sum(field))
+        )
+    dates, totals = fetch_columns(sums, ["datetime64[D]", np.int64])
+    begins, ends = bucket_bounds(first, last, unit)
+    values = np.zeros(len(begins), dtype=np.int64)
+    # The first bucket's truncated date can precede ``first``
+    values[np.searchsorted(begins, np.maximum(dates, first), side="right") - 1] = totals
+    return begins, ends, values
+
+
+def load_usage_buckets(product_id, first, last, unit):
+    """
+    Average daily consumption of one product per ``unit`` bucket between
+    ``first`` and ``last`` (``datetime64[D]``, inclusive) as ``(ends,
+    averages)``, each bucket dated by its last day.
+    """
+    begins, ends, totals = _bucket_sums(
+        DailyConsumption.objects.filter(product_id=product_id), "total_quantity", first, last, unit
+    )
+    return ends, totals / ((ends - begins).astype(np.int64) + 1)
+
+
+def bucket_means(dates, values, unit):
+    """
+    Average of daily ``values`` (on consecutive ``dates``) per ``unit``
+    bucket as ``(ends, averages)``, dated like ``load_usage_buckets``.
+    """
+    _, ends = bucket_bounds(dates[0], dates[-1], unit)
+    buckets = np.searchsorted(ends, dates)
+    totals = np.bincount(buckets, weights=values, minlength=len(ends))
+    return ends, totals / np.bincount(buckets, minlength=len(ends))
+
+
+def load_stock_buckets(product_id, first, last, unit, current_stock):
+    """
+    Stock of one product at the end of each ``unit`` bucket between
+    ``first`` and ``last`` as ``(ends, levels)``: the ledger's net changes
+    summed per bucket, on top of the running total before ``first``.
+    """
+    days = DailyStockBalance.objects.filter(product_id=product_id)
+    latest = days.order_by("-date").values_list("running_total", flat=True).first() or 0
+    before = (
+        days.filter(date__lt=first.item()).order_by("-date").values_list("running_total", flat=True).first()
+        or 0
+    )
+    _, ends, changes = _bucket_sums(days, "net_change", first, last, unit)
+    return ends, (current_stock - latest + before + np.cumsum(changes)).astype(float)
+
+
+def stock_grid(starts, lengths, offsets, rows, days, totals):
+    """
+    ``(P, D)`` stock levels from ledger entries: product ``i`` on day
+    ``starts[i] + j`` for ``j < lengths[i]``, NaN after. ``rows``, ``days``
+    and ``totals`` are DailyStockBalance entries (product row, epoch day,
+    running total) sorted by row then day; ``offsets`` is each product's
+    current stock less its latest running total. Days without an entry take
+    the last running total before them, or 0 before the first.
+    """
+    n_rows = len(starts)
+    width = int(lengths.max()) if n_rows else 0
+    cell_days = starts[:, None] + np.arange(width)
+    running = np.zeros(cell_days.shape)
+    if len(days) and width:
+        # (row, day) as one sortable key
+        low = min(days.min(), starts.min())
+        span = max(days.max(), cell_days.max()) - low + 1
+        keys = rows * span + (days - low)
+        cell_rows = np.arange(n_rows)[:, None]
+        idx = np.searchsorted(keys, cell_rows * span + (cell_days - low), side="right") - 1
+        idx_clipped = np.clip(idx, 0, None)
+        found = (idx >= 0) & (rows[idx_clipped] == cell_rows)
+        running = np.where(found, totals[idx_clipped], 0)
+    stock = offsets[:, None] + running
+    return np.where(np.arange(width) < lengths[:, None], stock, np.nan)
+
+
+def load_stock_history(product_id, start, length, current_stock):
+    """
+    Stock of one product on each of ``length`` days from ``start``
+    (``datetime64[D]``), read from the DailyStockBalance ledger: the rows in
+    the window plus the one before it and the latest, all by index range.
+    """
+    days = DailyStockBalance.objects.filter(product_id=product_id)
+    start_date = start.item()
+    end_date = (start + (length - 1)).item()
+    latest = days.order_by("-date").values_list("running_total", flat=True).first() or 0
+    before = days.filter(date__lt=start_date).order_by("-date").values_list("date", "running_total")[:1]
+    window = _window(days, start_date, end_date).order_by("date").values_list("date", "running_total")
+
+    dates, totals = fetch_columns(before, ["datetime64[D]", np.int64])
+    window_dates, window_totals = fetch_columns(window, ["datetime64[D]", np.int64])
+    dates = np.concatenate([dates, window_dates]).astype(np.int64)
+    totals = np.concatenate([totals, window_totals])
+    return stock_grid(
+        np.array([start.astype(np.int64)]),
+        np.array([length]),
+        np.array([current_stock - latest]),
+        np.zeros(len(dates), dtype=np.int64),
+        dates,
+        totals,
+    )[0]
+
+
+def _epoch_date(day):
+    return np.datetime64(int(day), "D").item()
+
+
+def load_stock_matrix(product_ids, starts, lengths, current_stock):
+    """
+    ``stock_grid`` for many products (``product_ids`` ascending, ``starts``
+    in epoch days), reading per batch of products what
+    ``load_stock_history`` reads for one: the ledger rows in each product's
+    own window, then the last running total before the window and the
+    latest one, in two queries.
+    """
+    n_rows = len(product_ids)
+    rows, days, totals, latest = [], [], [], []
+    for begin in range(0, n_rows, STOCK_MATRIX_BATCH_SIZE):
+        batch = slice(begin, begin + STOCK_MATRIX_BATCH_SIZE)
+        pks = product_ids[batch].tolist()
+        # Most products share a window, so one condition per distinct window
+        windows = defaultdict(list)
+        for pk, start, length in zip(pks, starts[batch].tolist(), lengths[batch].tolist()):
+            windows[start, length].append(pk)
+        in_window = Q()
+        window_start = []
+        for (start, length), window_pks in windows.items():
+            first, last = _epoch_date(start), _epoch_date(start + length - 1)
+            in_window |= Q(product_id__in=window_pks, date__gte=first, date__lte=last)
+            window_start.append(When(pk__in=window_pks, then=Value(_epoch_date(start))))
+
+        ledger = (
+            DailyStockBalance.objects.filter(in_window)
+            .order_by("product_id", "date")
+            .values_list("product_id", "date", "running_total")
+        )
+        ids, dates, window_totals = fetch_columns(ledger, [np.int64, "datetime64[D]", np.int64])
+
+        def last_total(**filters):
+            entries = DailyStockBalance.objects.filter(product=OuterRef("pk"), **filters).order_by("-date")
+            return Coalesce(Subquery(entries.values("running_total")[:1]), Value(0))
+
+        bounds = (
+            Product.objects.filter(pk__in=pks)
+            .annotate(window_start=Case(*window_start, output_field=DateField()))
+            .annotate(before=last_total(date__lt=OuterRef("window_start")), latest=last_total())
+            .order_by("pk")
+            .values_list("before", "latest")
+        )
+        before, batch_latest = fetch_columns(bounds, [np.int64, np.int64])
+
+        # The total before each window, as an entry on the day before it
+        batch_rows = np.arange(begin, begin + len(pks))
+        rows += [batch_rows, np.searchsorted(product_ids, ids)]
+        days += [starts[batch].astype(np.int64) - 1, dates.astype(np.int64)]
+        totals += [before, window_totals]
+        latest.append(batch_latest)
+
+    if not n_rows:
+        return stock_grid(starts, lengths, np.empty(0), *[np.empty(0, dtype=np.int64)] * 3)
+    rows, days, totals = np.concatenate(rows), np.concatenate(days), np.concatenate(totals)
+    order = np.lexsort((days, rows))
+    offsets = np.asarray(current_stock, dtype=float) - np.concatenate(latest)
+    return stock_grid(starts, lengths, offsets, rows[order], days[order], totals[order])
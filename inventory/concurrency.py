@@ -0,0 +1,49 @@
+"""
+Bounded thread pools for the blocking stages of the async views.
+
+ORM queries and cache lookups run on the database pool, pandas/matplotlib
+work on the smaller compute pool, so the event loop never runs blocking
+code and a burst of chart renders can't hold up other requests' queries.
+Stages run in a copy of the caller's context (instrumentation spans, with
+the stage's queries counted towards the request) and, like Django does
+around each request, drop connections that are too old or broken.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import instrumentation
+
+DB_STAGE_THREADS = getattr(settings, "INVENTORY_ASYNC_DB_THREADS", 8)
+COMPUTE_STAGE_THREADS = getattr(settings, "INVENTORY_ASYNC_COMPUTE_THREADS", 2)
+
+db_pool = ThreadPoolExecutor(DB_STAGE_THREADS, thread_name_prefix="inventory-db")
+compute_pool = ThreadPoolExecutor(COMPUTE_STAGE_THREADS, thread_name_prefix="inventory-compute")
+
+
+def _run_stage(func, args, kwargs):
+    close_old_connections()
+    try:
+        with instrumentation.record_queries():
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_stage(pool, func, *args, **kwargs):
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        pool, functools.partial(context.run, _run_stage, func, args, kwargs)
+    )
+
+
+async def db_stage(func, *args, **kwargs):
+    return await run_stage(db_pool, func, *args, **kwargs)
+
+
+async def compute_stage(func, *args, **kwargs):
+    return await run_stage(compute_pool, func, *args, **kwargs)
@@ -0,0 +1,234 @@
+"""
+Streaming export of consumption history and forecast snapshots as CSV or
+Parquet.
+
+Rows are read with ``iterator(chunk_size=...)`` (server-side cursors on
+PostgreSQL, ``fetchmany`` elsewhere) and encoded one chunk at a time, so
+memory stays flat however many rows are exported (under ASGI too, see
+``aiter_export``). CSV exports of
+consumption use the importer's columns and can be imported back.
+Parquet needs ``pyarrow``; each chunk becomes one row group.
+"""
+import csv
+import io
+from datetime import date
+
+from asgiref.sync import sync_to_async
+
+from .models import ConsumptionLog, ForecastSnapshot, Product
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+EXPORT_CHUNK_SIZE = 10000
+EXPORT_FORMATS = ("csv", "parquet")
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# (column, values_list() lookup, Arrow type) per export
+EXPORT_COLUMNS = {
+    "consumption": [
+        ("id", "id", "int64"),
+        ("sku", "product__sku", "string"),
+        ("date", "date", "date32"),
+        ("quantity", "quantity", "int64"),
+        ("notes", "notes", "string"),
+    ],
+    "forecasts": [
+        ("sku", "product__sku", "string"),
+        ("name", "product__name", "string"),
+        ("computed_at", "computed_at", "timestamp[us, tz=UTC]"),
+        ("avg_daily_usage", "avg_daily_usage", "float64"),
+        ("days_left", "days_left", "float64"),
+        ("depletion_date", "depletion_date", "date32"),
+        ("lead_time_days", "lead_time_days", "int64"),
+        ("order_by_date", "order_by_date", "date32"),
+        ("recommended_order_quantity", "recommended_order_quantity", "int64"),
+        ("is_stale", "is_stale", "bool"),
+    ],
+}
+
+
+class ExportFilters:
+    """
+    Product, supplier and date range filters shared by both exports. The
+    range applies to the log date of consumption and to the depletion
+    date of forecasts.
+    """
+
+    def __init__(self, skus=(), supplier_id=None, start=None, end=None):
+        self.skus = [sku for sku in skus if sku]
+        self.supplier_id = supplier_id
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def from_query(cls, query):
+        """Build from request GET parameters; raises ValueError if invalid."""
+        supplier = query.get("supplier")
+        return cls(
+            skus=query.getlist("sku"),
+            supplier_id=int(supplier) if supplier else None,
+            start=_parse_date(query.get("start"), "start"),
+            end=_parse_date(query.get("end"), "end"),
+        )
+
+    def products(self):
+        products = Product.objects.all()
+        if self.skus:
+            products = products.filter(sku__in=self.skus)
+        if self.supplier_id is not None:
+            products = products.filter(suppliers=self.supplier_id)
+        return products
+
+    def filter_products(self, queryset):
+        if self.skus or self.supplier_id is not None:
+            # A subquery, so products with several suppliers aren't repeated
+            queryset = queryset.filter(product__in=self.products().values("pk"))
+        return queryset
+
+
+def _parse_date(value, name):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} date: {value!r}") from None
+
+
+def consumption_queryset(filters):
+    logs = filters.filter_products(ConsumptionLog.objects.all())
+    if filters.start is not None:
+        logs = logs.filter(date__gte=filters.start)
+    if filters.end is not None:
+        logs = logs.filter(date__lte=filters.end)
+    # log_product_date_idx order, so no sort
+    return logs.order_by("product", "date", "id")
+
+
+def forecast_queryset(filters):
+    snapshots = filters.filter_products(ForecastSnapshot.objects.all())
+    if filters.start is not None:
+        snapshots = snapshots.filter(depletion_date__gte=filters.start)
+    if filters.end is not None:
+        snapshots = snapshots.filter(depletion_date__lte=filters.end)
+    return snapshots.order_by("product")
+
+
+EXPORT_QUERYSETS = {
+    "consumption": consumption_queryset,
+    "forecasts": forecast_queryset,
+}
+
+
+def iter_chunks(queryset, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of up to ``chunk_size`` row tuples."""
+    chunk = []
+    rows = queryset.values_list(*[lookup for _, lookup, _ in columns])
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_csv(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _, _ in columns])
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an empty export
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last ``take()``."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def arrow_schema(columns):
+    return pa.schema(
+        [(name, pa.type_for_alias(arrow_type)) for name, _, arrow_type in columns]
+    )
+
+
+def stream_parquet(chunks, columns):
+    schema = arrow_schema(columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for chunk in chunks:
+        columns_data = zip(*chunk)
+        arrays = [pa.array(values, type=field.type) for values, field in zip(columns_data, schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def stream_export(kind, fmt, filters, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Return an iterator of ``fmt`` bytes for the ``kind`` export
+    ("consumption" or "forecasts"). Raises ValueError up front, before
+    anything is streamed, for a format that can't be written.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    if fmt == "parquet" and pa is None:
+        raise ValueError("Parquet export requires pyarrow")
+    columns = EXPORT_COLUMNS[kind]
+    chunks = iter_chunks(EXPORT_QUERYSETS[kind](filters), columns, chunk_size)
+    if fmt == "parquet":
+        return stream_parquet(chunks, columns)
+    return stream_csv(chunks, columns)
+
+
+async def aiter_export(chunks):
+    """
+    ``chunks`` (from ``stream_export``) as an async iterator. Under ASGI,
+    StreamingHttpResponse reads a sync iterator into memory before sending
+    it; this hands it one chunk at a time instead. Every chunk is produced
+    on the same thread, so the rows' cursor stays on one connection.
+    """
+    chunks = iter(chunks)
+    done = object()
+    while True:
+        chunk = await sync_to_async(next, thread_sensitive=True)(chunks, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+def export_filename(kind, fmt, today):
+    return f"{kind}-{today.isoformat()}.{fmt}"
@@ -0,0 +1,140 @@
+"""
+Two-tier cache of per-product analysis results.
+
+Results are keyed by the product's data version (see inventory.versioning,
+changed by every log insert, edit and delete), its current stock and the
+analysis parameters, so a key never needs invalidating. A byte-bounded
+in-process LRU sits in front of Django's cache backend; a hit on either
+returns the processed series, trend lines, RMSEs and depletion forecast
+without touching pandas.
+"""
+from datetime import timedelta
+from typing import NamedTuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .analytics import analyse_product
+from .instrumentation import record_cache
+from .lru import BoundedLRUCache
+from .versioning import get_product_version
+
+FORECAST_CACHE_TIMEOUT = 60 * 60 * 24
+# Fixed cost counted per cached result on top of its arrays
+RESULT_OVERHEAD_BYTES = 512
+
+
+class ForecastResult(NamedTuple):
+    dates: np.ndarray  # plotted days (see analytics.analyse_product)
+    unit: str  # "day", "week" or "month"
+    quantity: np.ndarray  # processed daily consumption or bucket averages
+    stock_level: np.ndarray  # stock history from the ledger
+    trend_dates: np.ndarray  # days the trends were fitted on
+    consumption_trend: np.ndarray  # None when the model could not be fitted
+    stock_trend: np.ndarray
+    consumption_rmse: float
+    stock_rmse: float
+    days_left: float
+
+    @classmethod
+    def from_analysis(cls, analysis):
+        if analysis is None:
+            return NO_DATA
+        return cls(
+            analysis["dates"],
+            analysis["unit"],
+            analysis["quantity"],
+            analysis["stock_level"],
+            analysis["trend_dates"],
+            analysis["consumption_trend"],
+            analysis["stock_trend"],
+            analysis["consumption_rmse"],
+            analysis["stock_rmse"],
+            float(analysis["days_left"]),
+        )
+
+    def nbytes(self):
+        arrays = (
+            self.dates,
+            self.quantity,
+            self.stock_level,
+            self.trend_dates,
+            self.consumption_trend,
+            self.stock_trend,
+        )
+        return RESULT_OVERHEAD_BYTES + sum(a.nbytes for a in arrays if a is not None)
+
+    def as_analysis(self, today=None):
+        """The result in the shape returned by ``analyse_product``, without ``daily_df``."""
+        if not len(self.quantity):
+            return None
+        result = {
+            "unit": self.unit,
+            "dates": self.dates,
+            "quantity": self.quantity,
+            "stock_level": self.stock_level,
+            "trend_dates": self.trend_dates,
+            "consumption_trend": self.consumption_trend,
+            "consumption_rmse": self.consumption_rmse,
+            "stock_trend": self.stock_trend,
+            "stock_rmse": self.stock_rmse,
+            "days_left": self.days_left,
+        }
+        if self.days_left > 0:
+            today = today or timezone.now().date()
+            result["prediction_date"] = today + timedelta(days=self.days_left)
+            result["days_remaining"] = int(self.days_left)
+        return result
+
+
+# Products without consumption data
+NO_DATA = ForecastResult(
+    np.empty(0, dtype="datetime64[D]"),
+    None,
+    np.empty(0),
+    np.empty(0),
+    np.empty(0, dtype="datetime64[D]"),
+    None,
+    None,
+    None,
+    None,
+    0.0,
+)
+
+local_cache = BoundedLRUCache(
+    getattr(settings, "INVENTORY_FORECAST_CACHE_BYTES", 16 * 1024 * 1024),
+    sizeof=ForecastResult.nbytes,
+)
+
+
+def forecast_cache_key(product_pk, version, current_stock, params):
+    # Django cache keys must be plain strings without spaces
+    return "forecast:{}:{}:{}:{}".format(
+        product_pk, version, current_stock, "-".join(str(value) for value in params)
+    )
+
+
+def get_forecast_result(product, params):
+    key = forecast_cache_key(product.pk, get_product_version(product.pk), product.current_stock, params)
+    result = local_cache.get(key)
+    record_cache("forecast.local", result is not None, result is None)
+    if result is not None:
+        return result
+
+    result = cache.get(key)
+    record_cache("forecast.shared", result is not None, result is None)
+    if result is None:
+        result = ForecastResult.from_analysis(analyse_product(product, params))
+        cache.set(key, result, FORECAST_CACHE_TIMEOUT)
+    local_cache.set(key, result)
+    return result
+
+
+def get_analysis(product, params):
+    """
+    ``analyse_product(product, params)`` served from the result cache,
+    without ``daily_df``. Only computes on a miss in both tiers.
+    """
+    return get_forecast_result(product, params).as_analysis()
@@ -0,0 +1,235 @@
+"""
+Vectorised depletion forecasting for many products at once.
+
+Daily consumption is laid out as a products x days matrix. Each row is
+left-aligned on the product's first logged day and padded with NaN after
+its last one, so column ``j`` of a row is day index ``j`` of that product's
+``daily_df`` in ``inventory.analytics`` and every fit below reproduces the
+per-product results (up to floating point rounding).
+"""
+from datetime import date, timedelta
+from typing import NamedTuple
+
+import numpy as np
+from django.db.models import DateField, OuterRef, Subquery
+from django.db.models.functions import Cast
+
+from .analytics import FORECAST_WINDOW_DAYS, AnalysisParams
+from .columnar import fetch_columns, load_stock_matrix
+from .models import DailyConsumption, Product
+from .preprocessing import preprocess
+from .trend_models import get_trend_model
+
+# date.toordinal() of the datetime64 epoch
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class ConsumptionMatrix(NamedTuple):
+    product_ids: np.ndarray  # (P,)
+    start_ordinals: np.ndarray  # (P,) date.toordinal() of each row's day 0
+    lengths: np.ndarray  # (P,) days covered by each row
+    quantities: np.ndarray  # (P, D) float, NaN past each row's length
+
+    @property
+    def mask(self):
+        return np.arange(self.quantities.shape[1]) < self.lengths[:, None]
+
+
+class BatchForecast(NamedTuple):
+    product_ids: np.ndarray
+    quantities: np.ndarray  # processed daily consumption, NaN padded
+    stock_levels: np.ndarray  # recorded stock history, NaN padded
+    consumption_coefs: np.ndarray  # (P, 3) lowest order first, NaN if no fit
+    consumption_rmse: np.ndarray
+    stock_coefs: np.ndarray
+    stock_rmse: np.ndarray
+    days_left: np.ndarray  # same meaning as in analytics.predict_days_left
+
+
+def build_consumption_matrix(product_ids, dates, quantities):
+    """
+    Build a ``ConsumptionMatrix`` from parallel ``(product_id, date,
+    quantity)`` sequences with at most one entry per product and day.
+    ``dates`` may be ``date`` objects or a ``datetime64[D]`` array.
+    """
+    product_ids = np.asarray(product_ids, dtype=np.int64)
+    ordinals = np.asarray(dates, dtype="datetime64[D]").astype(np.int64) + EPOCH_ORDINAL
+    quantities = np.asarray(quantities, dtype=float)
+
+    ids, row = np.unique(product_ids, return_inverse=True)
+    starts = np.full(len(ids), np.iinfo(np.int64).max)
+    ends = np.full(len(ids), np.iinfo(np.int64).min)
+    np.minimum.at(starts, row, ordinals)
+    np.maximum.at(ends, row, ordinals)
+    lengths = ends - starts + 1
+
+    matrix = np.full((len(ids), int(lengths.max()) if len(ids) else 0), np.nan)
+    matrix[np.arange(matrix.shape[1]) < lengths[:, None]] = 0.0  # missing days
+    matrix[row, ordinals - starts[row]] = quantities
+    return ConsumptionMatrix(ids, starts, lengths, matrix)
+
+
+def load_consumption_matrix(product_ids=None, window_days=FORECAST_WINDOW_DAYS):
+    rows = DailyConsumption.objects.order_by()
+    if product_ids is not None:
+        rows = rows.filter(product_id__in=product_ids)
+    if window_days is not None:
+        # Each product's trailing days, as analytics.analyse_product fits on
+        latest = (
+            DailyConsumption.objects.filter(product_id=OuterRef("product_id"))
+            .order_by("-date")
+            .values("date")[:1]
+        )
+        rows = rows.filter(
+            date__gt=Cast(Subquery(latest) - timedelta(days=window_days), DateField())
+        )
+    return build_consumption_matrix(
+        *fetch_columns(
+            rows.values_list("product_id", "date", "total_quantity"),
+            [np.int64, "datetime64[D]", float],
+        )
+    )
+
+
+def fit_polynomials(y, mask, lengths, deg):
+    """
+    Least-squares polynomial fit of every row against its day index.
+
+    Returns ``(coefs, fitted, rmse)`` with ``coefs`` shaped (P, 3), lowest
+    order first. Rows with fewer than two days get NaN.
+    """
+    n_rows, n_days = y.shape
+    k = deg + 1
+    # Fit on t = x / (n - 1) in [0, 1] to keep the normal equations well
+    # conditioned, then rescale the coefficients back to day units.
+    scale = np.maximum(lengths - 1, 1).astype(float)
+    t = np.arange(n_days)[None, :] / scale[:, None]
+    weight = mask.astype(float)
+    yz = np.where(mask, y, 0.0)
+
+    moments = np.empty((n_rows, 2 * k - 1))
+    rhs = np.empty((n_rows, k))
+    power = weight
+    for m in range(2 * k - 1):
+        moments[:, m] = power.sum(axis=1)
+        if m < k:
+            rhs[:, m] = (power * yz).sum(axis=1)
+        power = power * t
+    normal = moments[:, np.add.outer(np.arange(k), np.arange(k))]
+    # pinv also covers rows with fewer points than coefficients
+    scaled = (np.linalg.pinv(normal) @ rhs[..., None])[..., 0]
+
+    coefs = np.zeros((n_rows, 3))
+    coefs[:, :k] = scaled / scale[:, None] ** np.arange(k)
+    x = np.arange(n_days, dtype=float)
+    fitted = coefs[:, [0]] + coefs[:, [1]] * x + coefs[:, [2]] * x ** 2
+    rmse = np.sqrt(np.where(mask, (yz - fitted) ** 2, 0.0).sum(axis=1) / lengths)
+
+    no_fit = lengths < 2
+    coefs[no_fit] = np.nan
+    rmse[no_fit] = np.nan
+    return coefs, np.where(mask, fitted, np.nan), rmse
+
+
+def first_root_after(coefs, after):
+    """
+    Smallest real root of ``c0 + c1*x + c2*x**2`` greater than ``after`` for
+    every row, or NaN when the curve never crosses zero there.
+    """
+    c0, c1, c2 = coefs[:, 0], coefs[:, 1], coefs[:, 2]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        linear = -c0 / c1
+        disc = c1 ** 2 - 4 * c2 * c0
+        # Numerically stable quadratic roots
+        q = -0.5 * (c1 + np.copysign(np.sqrt(np.maximum(disc, 0.0)), c1))
+        r1, r2 = q / c2, c0 / q
+
+    quadratic = c2 != 0
+    real = ~quadratic | (disc >= 0)
+    candidates = np.stack(
+        [np.where(quadratic, r1, linear), np.where(quadratic, r2, np.nan)], axis=1
+    )
+    candidates[~real] = np.nan
+    # NaN (no root) compares False and drops out as +inf
+    candidates = np.where(candidates > after[:, None], candidates, np.inf)
+    first = candidates.min(axis=1)
+    return np.where(np.isinf(first), np.nan, first)
+
+
+def fit_trend_rows(y, mask, lengths, model):
+    """
+    Fit ``model`` to every row. Returns ``(coefs, rmse, days_to_zero)``;
+    polynomial models are solved for all rows at once, other registered
+    models row by row (``coefs`` is then NaN).
+    """
+    if model.degree is not None:
+        coefs, _, rmse = fit_polynomials(y, mask, lengths, model.degree)
+        last_day_idx = (lengths - 1).astype(float)
+        return coefs, rmse, first_root_after(coefs, last_day_idx) - last_day_idx
+
+    n_rows = len(lengths)
+    coefs = np.full((n_rows, 3), np.nan)
+    rmse = np.full(n_rows, np.nan)
+    depletion = np.full(n_rows, np.nan)
+    for row in np.flatnonzero(lengths > 1):
+        state = model.fit(y[row, : lengths[row]])
+        rmse[row] = model.rmse(state)
+        days = model.days_to_zero(state)
+        if days is not None:
+            depletion[row] = days
+    return coefs, rmse, depletion
+
+
+def forecast_matrix(matrix, current_stock, stock, params=AnalysisParams()):
+    """
+    Run the whole per-product pipeline of ``analytics.analyse_product`` on a
+    ``ConsumptionMatrix`` in one pass. ``current_stock`` is aligned with
+    ``matrix.product_ids`` and ``stock`` is the matching stock history
+    matrix (see ``columnar.load_stock_matrix``).
+    """
+    mask = matrix.mask
+    lengths = matrix.lengths
+    current_stock = np.asarray(current_stock, dtype=float)
+    y = matrix.quantities
+
+    y = preprocess(y, params, mask)
+
+    total_consumed = np.where(mask, y, 0.0).sum(axis=1)
+
+    consumption_coefs, consumption_rmse, _ = fit_trend_rows(
+        y, mask, lengths, get_trend_model(params.consumption_model)
+    )
+    stock_coefs, stock_rmse, depletion = fit_trend_rows(
+        stock, mask, lengths, get_trend_model(params.stock_model)
+    )
+
+    # Naive baseline: current stock over average daily usage
+    avg_daily_usage = total_consumed / lengths
+    with np.errstate(invalid="ignore", divide="ignore"):
+        days_left = np.where(avg_daily_usage > 0, current_stock / avg_daily_usage, 0.0)
+    use_model = (lengths > 1) & ~np.isnan(depletion)
+    days_left = np.where(use_model, depletion, days_left)
+
+    return BatchForecast(
+        product_ids=matrix.product_ids,
+        quantities=np.where(mask, y, np.nan),
+        stock_levels=stock,
+        consumption_coefs=consumption_coefs,
+        consumption_rmse=consumption_rmse,
+        stock_coefs=stock_coefs,
+        stock_rmse=stock_rmse,
+        days_left=days_left,
+    )
+
+
+def forecast_products(product_ids=None, params=AnalysisParams()):
+    """Forecast every product with consumption data (or only ``product_ids``)."""
+    matrix = load_consumption_matrix(product_ids)
+    stock = dict(
+        Product.objects.filter(pk__in=matrix.product_ids.tolist()).values_list("pk", "current_stock")
+    )
+    current_stock = [stock[pk] for pk in matrix.product_ids.tolist()]
+    stock_levels = load_stock_matrix(
+        matrix.product_ids, matrix.start_ordinals - EPOCH_ORDINAL, matrix.lengths, current_stock
+    )
+    return forecast_matrix(matrix, current_stock, stock_levels, params)
@@ -0,0 +1,148 @@
+"""
+Streaming bulk import of consumption logs from CSV or JSON Lines.
+
+Rows are validated against a preloaded sku -> product id map and written in
+fixed-size batches, one transaction per batch, so memory stays constant
+however large the input is. Each batch also updates the daily rollup and,
+like any other log write, ``current_stock`` (see ``inventory.ledger``).
+"""
+import csv
+import json
+import time
+from collections import defaultdict
+from datetime import date
+
+from django.db import transaction
+
+from .models import ConsumptionLog, Product
+from .rollups import apply_consumption_deltas
+
+IMPORT_BATCH_SIZE = 5000
+IMPORT_FORMATS = ("csv", "jsonl")
+# Rejected rows beyond this many are counted but not described
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": reason})
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+def iter_records(lines, fmt):
+    """Yield ``(line_number, record_dict)`` from an iterable of text lines."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "jsonl":
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = e
+            yield line_number, record
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def parse_record(record, sku_map):
+    """Return ``(product_id, date, quantity, notes)`` or raise ValueError."""
+    if isinstance(record, Exception):
+        raise ValueError(f"Invalid JSON: {record}")
+    if not isinstance(record, dict):
+        raise ValueError("Expected an object")
+    sku = str(record.get("sku") or "").strip()
+    try:
+        product_id = sku_map[sku]
+    except KeyError:
+        raise ValueError(f"Unknown SKU: {sku!r}") from None
+    try:
+        log_date = date.fromisoformat(str(record.get("date", "")).strip())
+    except ValueError:
+        raise ValueError(f"Invalid date: {record.get('date')!r}") from None
+    try:
+        quantity = int(record.get("quantity"))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid quantity: {record.get('quantity')!r}") from None
+    if quantity <= 0:
+        raise ValueError(f"Quantity must be positive: {quantity}")
+    return product_id, log_date, quantity, record.get("notes") or None
+
+
+def write_batch(batch, update_stock=True):
+    rollup_deltas = defaultdict(lambda: [0, 0])
+    for log in batch:
+        delta = rollup_deltas[(log.product_id, log.date)]
+        delta[0] += log.quantity
+        delta[1] += 1
+
+    with transaction.atomic():
+        ConsumptionLog.objects.bulk_create(batch)
+        apply_consumption_deltas(rollup_deltas, update_stock)
+
+
+def import_consumption(lines, fmt, batch_size=IMPORT_BATCH_SIZE, update_stock=True, report=None):
+    """
+    Import consumption logs from ``lines`` (an iterable of text lines in
+    ``fmt``). Invalid rows are skipped and reported. Returns an
+    ``ImportReport``, ``report`` if given: batches are committed as they
+    fill, so if reading ``lines`` raises it still counts what was imported.
+    """
+    report = report or ImportReport()
+    sku_map = dict(Product.objects.values_list("sku", "pk"))
+
+    batch = []
+    try:
+        for line_number, record in iter_records(lines, fmt):
+            report.rows += 1
+            try:
+                product_id, log_date, quantity, notes = parse_record(record, sku_map)
+            except ValueError as e:
+                report.reject(line_number, str(e))
+                continue
+            batch.append(
+                ConsumptionLog(product_id=product_id, date=log_date, quantity=quantity, notes=notes)
+            )
+            if len(batch) >= batch_size:
+                write_batch(batch, update_stock)
+                report.imported += len(batch)
+                batch = []
+        if batch:
+            write_batch(batch, update_stock)
+            report.imported += len(batch)
+    finally:
+        report.elapsed = time.perf_counter() - report.started
+    return report
+
+
+def guess_format(name, content_type=""):
+    if name.endswith((".jsonl", ".ndjson")) or "ndjson" in content_type or "jsonl" in content_type:
+        return "jsonl"
+    return "csv"
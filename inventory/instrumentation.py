@@ -0,0 +1,238 @@
+"""
+Opt-in request instrumentation (``INVENTORY_INSTRUMENTATION = True``).
+
+The middleware records per-request database query count and time, cache
+hits/misses and named spans around the analytics stages, then reports them
+as a ``Server-Timing`` header, one structured log line per request and
+in-process p50/p95 aggregates served by the stats endpoint.
+
+The middleware runs in either mode, so ASGI requests to the async views
+stay async end to end. When disabled it removes itself at startup and
+``span()``, ``record_cache()`` and ``record_queries()`` reduce to a context
+variable lookup.
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, asynccontextmanager, contextmanager, nullcontext
+from contextvars import ContextVar
+
+import numpy as np
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Samples kept per view and metric for the percentiles
+STATS_SAMPLE_SIZE = 1000
+
+_current = ContextVar("inventory_request_metrics", default=None)
+_null_span = nullcontext()
+
+
+def is_enabled():
+    return getattr(settings, "INVENTORY_INSTRUMENTATION", False)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.spans = defaultdict(float)
+        self.cache = defaultdict(lambda: [0, 0])
+        # Async views run queries, spans and cache lookups on several stage
+        # threads at once
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute_wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self._lock:
+                self.queries += 1
+                self.query_time += time.perf_counter() - start
+
+    def as_dict(self):
+        return {
+            "total_ms": round(self.elapsed * 1000, 3),
+            "db_ms": round(self.query_time * 1000, 3),
+            "queries": self.queries,
+            "spans": {name: round(seconds * 1000, 3) for name, seconds in self.spans.items()},
+            "cache": {name: {"hits": h, "misses": m} for name, (h, m) in self.cache.items()},
+        }
+
+    def server_timing(self):
+        entries = [
+            f"total;dur={self.elapsed * 1000:.1f}",
+            f'db;dur={self.query_time * 1000:.1f};desc="{self.queries} queries"',
+        ]
+        entries += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.spans.items()]
+        entries += [
+            f'cache.{name};desc="{hits} hits, {misses} misses"'
+            for name, (hits, misses) in self.cache.items()
+        ]
+        return ", ".join(entries)
+
+
+@contextmanager
+def _timed(metrics, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with metrics._lock:
+            metrics.spans[name] += elapsed
+
+
+def span(name):
+    """Time the enclosed block as ``name`` in the current request, if any."""
+    metrics = _current.get()
+    if metrics is None:
+        return _null_span
+    return _timed(metrics, name)
+
+
+@contextmanager
+def record_queries():
+    """
+    Count the queries made on this thread's connections in the current
+    request, if any. Connections are per thread, so work handed to another
+    thread (see inventory.concurrency) has to enter this there.
+    """
+    metrics = _current.get()
+    with ExitStack() as stack:
+        if metrics is not None:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(metrics))
+        yield
+
+
+@asynccontextmanager
+async def arecord_queries():
+    """
+    ``record_queries`` for async code: counts the queries run through
+    ``sync_to_async``, on the request's thread-sensitive thread, where
+    Django's middleware and sync views make them.
+    """
+    stack = ExitStack()
+    await sync_to_async(stack.enter_context)(record_queries())
+    try:
+        yield
+    finally:
+        await sync_to_async(stack.close)()
+
+
+def record_cache(name, hits, misses):
+    metrics = _current.get()
+    if metrics is not None:
+        with metrics._lock:
+            counts = metrics.cache[name]
+            counts[0] += hits
+            counts[1] += misses
+
+
+class StatsRegistry:
+    """Recent samples per view, summarised as p50/p95."""
+
+    def __init__(self, sample_size=STATS_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: defaultdict(lambda: deque(maxlen=self.sample_size)))
+
+    def record(self, view, metrics):
+        with self._lock:
+            samples = self._samples[view]
+            samples["total_ms"].append(metrics.elapsed * 1000)
+            samples["db_ms"].append(metrics.query_time * 1000)
+            samples["queries"].append(metrics.queries)
+            for name, seconds in metrics.spans.items():
+                samples[f"span:{name}"].append(seconds * 1000)
+
+    def summary(self):
+        with self._lock:
+            snapshot = {
+                view: {metric: list(values) for metric, values in samples.items()}
+                for view, samples in self._samples.items()
+            }
+        result = {}
+        for view, samples in snapshot.items():
+            summary = {"requests": len(samples["total_ms"]), "spans": {}}
+            for metric, values in samples.items():
+                p50, p95 = np.percentile(values, [50, 95])
+                stats = {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "count": len(values)}
+                if metric.startswith("span:"):
+                    summary["spans"][metric[5:]] = stats
+                else:
+                    summary[metric] = stats
+            result[view] = summary
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+stats = StatsRegistry()
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with record_queries():
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            async with arecord_queries():
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, metrics)
+
+    def report(self, request, response, metrics):
+        metrics.elapsed = time.perf_counter() - metrics.started
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        response["Server-Timing"] = metrics.server_timing()
+        stats.record(view, metrics)
+        logger.info(
+            json.dumps(
+                {
+                    "view": view,
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    **metrics.as_dict(),
+                }
+            )
+        )
+        return response
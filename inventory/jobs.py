@@ -0,0 +1,128 @@
+"""
+Database-backed queue of per-product analysis jobs.
+
+Writes that change a product's forecast inputs call ``enqueue_analysis``,
+which marks its precomputed analysis stale and, when background analysis
+is enabled, (re)queues its job. There is
+one job row per product, so any number of writes before a worker gets to it
+coalesce into one recomputation. Each enqueue bumps the job's
+``generation``; a worker only marks its results fresh if the generation it
+claimed is still current, otherwise the job stays pending and runs again.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AnalysisJob, PrecomputedAnalysis, Product
+
+ENQUEUE_BATCH_SIZE = 1000
+# Jobs running longer than this are assumed to belong to a dead worker
+JOB_TIMEOUT = timedelta(minutes=10)
+# A failing job is retried until it has run this many times, then left
+# failed until the product is written again
+MAX_JOB_ATTEMPTS = 3
+
+
+def is_enabled():
+    return getattr(settings, "INVENTORY_BACKGROUND_ANALYSIS", False)
+
+
+def _requeue(jobs, now):
+    # Pending jobs keep their place in the queue
+    return jobs.exclude(status=AnalysisJob.PENDING).update(
+        status=AnalysisJob.PENDING,
+        generation=F("generation") + 1,
+        requested_at=now,
+        attempts=0,
+        error="",
+    )
+
+
+def enqueue_analysis(product_ids):
+    """
+    Mark the results of ``product_ids`` stale and queue their recomputation.
+    Results are marked stale even with background analysis off, so rows
+    left from when it was on are never served again.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    now = timezone.now()
+    with transaction.atomic():
+        PrecomputedAnalysis.objects.filter(product_id__in=product_ids, is_stale=False).update(
+            is_stale=True
+        )
+        if not is_enabled():
+            return
+        _requeue(AnalysisJob.objects.filter(product_id__in=product_ids), now)
+        AnalysisJob.objects.bulk_create(
+            [AnalysisJob(product_id=pk, requested_at=now) for pk in product_ids],
+            batch_size=ENQUEUE_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def enqueue_all_analysis():
+    """``enqueue_analysis`` for every product, without listing them in queries."""
+    now = timezone.now()
+    with transaction.atomic():
+        PrecomputedAnalysis.objects.filter(is_stale=False).update(is_stale=True)
+        if not is_enabled():
+            return
+        _requeue(AnalysisJob.objects.all(), now)
+        missing = Product.objects.filter(analysis_job__isnull=True).values_list("pk", flat=True)
+        AnalysisJob.objects.bulk_create(
+            (AnalysisJob(product_id=pk, requested_at=now) for pk in missing.iterator()),
+            batch_size=ENQUEUE_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def requeue_stuck_jobs(timeout=JOB_TIMEOUT):
+    """Return jobs left running by a crashed worker to the queue."""
+    return AnalysisJob.objects.filter(
+        status=AnalysisJob.RUNNING, started_at__lt=timezone.now() - timeout
+    ).update(status=AnalysisJob.PENDING, generation=F("generation") + 1)
+
+
+def claim_jobs(limit):
+    """
+    Atomically move up to ``limit`` of the oldest pending jobs to running
+    and return ``[(job_id, product_id, generation)]``. Safe to call from
+    several worker processes: a job is only returned to the one whose
+    conditional UPDATE switched it.
+    """
+    claimed = []
+    candidates = AnalysisJob.objects.filter(status=AnalysisJob.PENDING).order_by("requested_at")
+    for job_id, product_id, generation in candidates.values_list(
+        "pk", "product_id", "generation"
+    )[:limit]:
+        updated = AnalysisJob.objects.filter(
+            pk=job_id, status=AnalysisJob.PENDING, generation=generation
+        ).update(status=AnalysisJob.RUNNING, started_at=timezone.now(), attempts=F("attempts") + 1)
+        if updated:
+            claimed.append((job_id, product_id, generation))
+    return claimed
+
+
+def finish_job(job_id, generation):
+    """
+    Mark a claimed job done. Returns ``False`` if it was requested again
+    while running, in which case it stays pending and its results must be
+    stored as stale. Call inside the transaction that stores the results.
+    """
+    return bool(
+        AnalysisJob.objects.filter(
+            pk=job_id, status=AnalysisJob.RUNNING, generation=generation
+        ).update(status=AnalysisJob.DONE, finished_at=timezone.now(), error="")
+    )
+
+
+def fail_job(job_id, generation, error):
+    jobs = AnalysisJob.objects.filter(pk=job_id, status=AnalysisJob.RUNNING, generation=generation)
+    # Retry straight away until the attempts run out
+    jobs.filter(attempts__lt=MAX_JOB_ATTEMPTS).update(status=AnalysisJob.PENDING, error=error)
+    jobs.update(status=AnalysisJob.FAILED, finished_at=timezone.now(), error=error)
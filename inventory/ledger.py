@@ -0,0 +1,337 @@
+"""
+Per product/day stock ledger.
+
+Stock changes are consumption (ConsumptionLog, applied through the rollup
+deltas in inventory.rollups) and StockMovement receipts and adjustments.
+DailyStockBalance holds one row per product and day with changes: the
+day's net change and the running total of net changes up to that day,
+maintained on write with F() updates. Stock on day d is
+
+    current_stock - latest running total + running total on d
+
+so stock history is a range read anchored at current_stock (see
+``columnar.load_stock_history``). Writes that set current_stock directly
+(the product form, bulk updates) shift the whole history instead of
+leaving it inconsistent. current_stock never goes below zero; when a change
+would take it there, the part it can't take is recorded as a compensating
+adjustment (``STOCK_FLOOR_NOTE``) so the ledger still sums to the stock.
+
+Every log and movement write moves current_stock along with the ledger,
+whether it comes from the importer, the admin, the API or the ORM: a new
+ConsumptionLog takes its quantity off the stock, an edit moves it by the
+difference and a delete puts it back. So stock on past days stays put as
+data arrives. The only exception is an import with ``update_stock`` off,
+for consumption the stock count already reflects, which raises the stock
+on the days before it instead.
+"""
+from collections import defaultdict
+from functools import reduce
+from heapq import merge
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, DateField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import DailyConsumption, DailyStockBalance, Product, StockMovement
+from .snapshots import mark_forecasts_stale
+from .versioning import bump_product_versions
+
+REBUILD_BATCH_SIZE = 5000
+# Delta sets larger than this rewrite the affected days in bulk
+BULK_DELTA_THRESHOLD = 20
+BULK_WRITE_BATCH_SIZE = 1000
+# Notes of the adjustments making up for changes clamped at zero stock
+STOCK_FLOOR_NOTE = "Stock floor at zero"
+
+
+def _lock_products(product_ids):
+    # Serializes ledger writes per product: a new day starts from the
+    # previous day's running total
+    return dict(
+        Product.objects.select_for_update()
+        .filter(pk__in=product_ids)
+        .order_by("pk")
+        .values_list("pk", "current_stock")
+    )
+
+
+def _previous_total(days, date):
+    total = days.filter(date__lt=date).order_by("-date").values_list("running_total", flat=True)
+    return total.first() or 0
+
+
+def _apply_delta(product_id, date, change):
+    days = DailyStockBalance.objects.filter(product_id=product_id)
+    days.filter(date__gt=date).update(running_total=F("running_total") + change)
+    updated = days.filter(date=date).update(
+        net_change=F("net_change") + change,
+        running_total=F("running_total") + change,
+    )
+    if updated:
+        # A day that nets to zero reads the same as no row
+        days.filter(date=date, net_change=0).delete()
+    else:
+        DailyStockBalance.objects.create(
+            product_id=product_id,
+            date=date,
+            net_change=change,
+            running_total=_previous_total(days, date) + change,
+        )
+
+
+def _apply_deltas_in_bulk(deltas):
+    # Rewrite each product's days from its earliest change onwards. Per
+    # batch of products: one read of those days, one of the running totals
+    # before them, one DELETE and a bulk INSERT, however many products
+    by_product = defaultdict(dict)
+    for (product_id, date), change in deltas.items():
+        by_product[product_id][date] = change
+
+    product_ids = sorted(by_product)
+    for begin in range(0, len(product_ids), BULK_WRITE_BATCH_SIZE):
+        pks = product_ids[begin : begin + BULK_WRITE_BATCH_SIZE]
+        # Usually one condition: the changes share their first day
+        by_first = defaultdict(list)
+        for pk in pks:
+            by_first[min(by_product[pk])].append(pk)
+        later = DailyStockBalance.objects.filter(
+            reduce(or_, (Q(product_id__in=firsts, date__gte=first) for first, firsts in by_first.items()))
+        )
+        first_change = Case(
+            *(When(pk__in=firsts, then=Value(first)) for first, firsts in by_first.items()),
+            output_field=DateField(),
+        )
+        previous = Subquery(
+            DailyStockBalance.objects.filter(product=OuterRef("pk"), date__lt=OuterRef("first_change"))
+            .order_by("-date")
+            .values("running_total")[:1]
+        )
+        running_totals = dict(
+            Product.objects.filter(pk__in=pks)
+            .annotate(first_change=first_change)
+            .annotate(previous=Coalesce(previous, Value(0)))
+            .values_list("pk", "previous")
+        )
+        net = defaultdict(dict)
+        for product_id, date, change in later.values_list("product_id", "date", "net_change"):
+            net[product_id][date] = change
+        later.delete()
+
+        to_create = []
+        for product_id in pks:
+            days = net[product_id]
+            for date, change in by_product[product_id].items():
+                days[date] = days.get(date, 0) + change
+            running_total = running_totals.get(product_id, 0)
+            for date in sorted(days):
+                if not days[date]:
+                    continue
+                running_total += days[date]
+                to_create.append(
+                    DailyStockBalance(
+                        product_id=product_id,
+                        date=date,
+                        net_change=days[date],
+                        running_total=running_total,
+                    )
+                )
+        DailyStockBalance.objects.bulk_create(to_create, batch_size=BULK_WRITE_BATCH_SIZE)
+
+
+def apply_stock_deltas(deltas):
+    """
+    Apply ``{(product_id, date): change}`` to the ledger (consumption is a
+    negative change). Doesn't touch current_stock or invalidate anything;
+    see ``apply_movement_deltas`` for that.
+    """
+    deltas = {key: change for key, change in deltas.items() if change}
+    if not deltas:
+        return
+    with transaction.atomic():
+        _lock_products({product_id for product_id, _ in deltas})
+        if len(deltas) > BULK_DELTA_THRESHOLD:
+            _apply_deltas_in_bulk(deltas)
+        else:
+            for (product_id, date), change in deltas.items():
+                _apply_delta(product_id, date, change)
+
+
+def update_current_stock(changes, dates):
+    """
+    Add ``{product_id: change}`` to current_stock, which stays at zero or
+    above. A change that would go below zero is clamped and the difference
+    recorded as a StockMovement adjustment, and in the ledger, dated
+    ``dates[product_id]``; so stock history, and a ledger rebuilt from the
+    movements, keep matching current_stock. Call inside the transaction
+    that applied the full changes to the ledger.
+    """
+    stock = _lock_products(changes)
+    changes = {product_id: change for product_id, change in changes.items() if product_id in stock}
+    floors = [
+        StockMovement(
+            product_id=product_id,
+            kind=StockMovement.ADJUSTMENT,
+            quantity=-(stock[product_id] + change),
+            date=dates[product_id],
+            notes=STOCK_FLOOR_NOTE,
+        )
+        for product_id, change in changes.items()
+        if stock[product_id] + change < 0
+    ]
+    if floors:
+        StockMovement.objects.bulk_create(floors)
+        apply_stock_deltas({(floor.product_id, floor.date): floor.quantity for floor in floors})
+        for floor in floors:
+            changes[floor.product_id] += floor.quantity
+
+    # One UPDATE per distinct change, so a bulk adjustment is one statement
+    products_by_change = defaultdict(list)
+    for product_id, change in changes.items():
+        if change:
+            products_by_change[change].append(product_id)
+    for change, product_ids in products_by_change.items():
+        Product.objects.filter(pk__in=product_ids).update(current_stock=F("current_stock") + change)
+
+
+def apply_movement_deltas(deltas):
+    """
+    Apply StockMovement changes ``{(product_id, date): change}``: the ledger
+    and current_stock (see ``update_current_stock``) move together in one
+    transaction, and the products' caches and forecasts are invalidated.
+    """
+    deltas = {key: change for key, change in deltas.items() if change}
+    stock_changes = defaultdict(int)
+    latest = {}
+    for (product_id, date), change in deltas.items():
+        stock_changes[product_id] += change
+        latest[product_id] = max(date, latest.get(product_id, date))
+
+    with transaction.atomic():
+        bump_product_versions(stock_changes)
+        apply_stock_deltas(deltas)
+        update_current_stock(stock_changes, latest)
+        mark_forecasts_stale(stock_changes)
+
+
+def adjust_stock(product_ids, change, date, notes=""):
+    """
+    Add ``change`` to the current_stock of ``product_ids`` in one UPDATE,
+    recorded as StockMovement adjustments dated ``date`` in one bulk INSERT
+    and in the ledger in bulk. Stock stops at zero as in
+    ``update_current_stock``. Returns the adjustments.
+    """
+    with transaction.atomic():
+        stock = _lock_products(product_ids)
+        movements = [
+            StockMovement(
+                product_id=product_id, kind=StockMovement.ADJUSTMENT, quantity=change, date=date, notes=notes
+            )
+            for product_id in stock
+        ]
+        floors = [
+            StockMovement(
+                product_id=product_id,
+                kind=StockMovement.ADJUSTMENT,
+                quantity=-(current + change),
+                date=date,
+                notes=STOCK_FLOOR_NOTE,
+            )
+            for product_id, current in stock.items()
+            if current + change < 0
+        ]
+        StockMovement.objects.bulk_create(movements + floors)
+        deltas = {(product_id, date): change for product_id in stock}
+        for floor in floors:
+            deltas[(floor.product_id, date)] += floor.quantity
+        bump_product_versions(stock)
+        _apply_deltas_in_bulk({key: delta for key, delta in deltas.items() if delta})
+        Product.objects.filter(pk__in=stock).update(current_stock=Greatest(F("current_stock") + change, 0))
+        mark_forecasts_stale(stock)
+    return movements
+
+
+def record_movement_change(old=None, new=None):
+    """
+    Update stock for one StockMovement write. ``old`` and ``new`` are
+    ``(product_id, date, quantity)`` tuples for the row before and after
+    the write; pass ``None`` for a create (old) or delete (new).
+    """
+    deltas = defaultdict(int)
+    if old is not None:
+        product_id, date, quantity = old
+        deltas[(product_id, date)] -= quantity
+    if new is not None:
+        product_id, date, quantity = new
+        deltas[(product_id, date)] += quantity
+    apply_movement_deltas(deltas)
+
+
+def create_movements(movements):
+    """``bulk_create`` StockMovement rows and apply them, which signals would skip."""
+    deltas = defaultdict(int)
+    for movement in movements:
+        deltas[(movement.product_id, movement.date)] += movement.quantity
+    with transaction.atomic():
+        movements = StockMovement.objects.bulk_create(movements)
+        apply_movement_deltas(deltas)
+    return movements
+
+
+def rebuild_stock_ledger(product_ids=None, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Recompute the ledger from the DailyConsumption rollup and StockMovement
+    rows, for every product or only ``product_ids``. Returns the number of
+    ledger rows written. Caches are invalidated by the caller
+    (``rollups.rebuild_daily_consumption``).
+    """
+    consumption = DailyConsumption.objects.all()
+    movements = StockMovement.objects.all()
+    ledger = DailyStockBalance.objects.all()
+    if product_ids is not None:
+        consumption = consumption.filter(product_id__in=product_ids)
+        movements = movements.filter(product_id__in=product_ids)
+        ledger = ledger.filter(product_id__in=product_ids)
+
+    consumed = (
+        (product_id, date, -quantity)
+        for product_id, date, quantity in consumption.order_by("product_id", "date")
+        .values_list("product_id", "date", "total_quantity")
+        .iterator(chunk_size=batch_size)
+    )
+    moved = (
+        movements.order_by("product_id", "date")
+        .values_list("product_id", "date")
+        .annotate(total=Sum("quantity"))
+        .iterator(chunk_size=batch_size)
+    )
+
+    written = 0
+    with transaction.atomic():
+        ledger.delete()
+        batch, row = [], None
+        for product_id, date, change in merge(consumed, moved, key=lambda entry: entry[:2]):
+            if row is not None and (row.product_id, row.date) == (product_id, date):
+                row.net_change += change
+                row.running_total += change
+                continue
+            running_total = row.running_total if row is not None and row.product_id == product_id else 0
+            row = DailyStockBalance(
+                product_id=product_id,
+                date=date,
+                net_change=change,
+                running_total=running_total + change,
+            )
+            batch.append(row)
+            if len(batch) > batch_size:
+                # Keep the last row, it may still take changes for its day
+                written += _create_nonzero(batch[:-1])
+                batch = batch[-1:]
+        written += _create_nonzero(batch)
+    return written
+
+
+def _create_nonzero(rows):
+    rows = [row for row in rows if row.net_change]
+    DailyStockBalance.objects.bulk_create(rows)
+    return len(rows)
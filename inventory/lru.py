@@ -0,0 +1,50 @@
+import threading
+from collections import OrderedDict
+
+
+class BoundedLRUCache:
+    """
+    Thread-safe in-process LRU cache bounded by total size rather than entry
+    count. ``sizeof`` returns the cost of a value (``len`` for bytes).
+    """
+
+    def __init__(self, max_size, sizeof=len):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, _ = self._entries[key]
+            except KeyError:
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        cost = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            if cost > self.max_size:
+                # Would evict everything else and still not fit
+                return
+            self._entries[key] = (value, cost)
+            self.size += cost
+            while self.size > self.max_size:
+                _, (_, evicted_cost) = self._entries.popitem(last=False)
+                self.size -= evicted_cost
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from inventory.snapshots import (
+    SNAPSHOT_BATCH_SIZE,
+    compute_forecast_snapshots,
+    products_to_recompute,
+)
+
+
+class Command(BaseCommand):
+    help = "Computes forecast snapshots for the reorder dashboard"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only recompute products without a snapshot or whose data changed",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=SNAPSHOT_BATCH_SIZE,
+            help="Products forecast per vectorised batch",
+        )
+
+    def handle(self, *args, **options):
+        product_ids = list(products_to_recompute(options["incremental"]))
+        self.stdout.write(f"Computing forecasts for {len(product_ids)} products...")
+        written = compute_forecast_snapshots(product_ids, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} forecast snapshots"))
@@ -0,0 +1,47 @@
+import sys
+from contextlib import nullcontext
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from inventory.export import EXPORT_CHUNK_SIZE, EXPORT_COLUMNS, EXPORT_FORMATS, ExportFilters, stream_export
+
+
+class Command(BaseCommand):
+    help = "Streams consumption history or forecast snapshots to a CSV or Parquet file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(EXPORT_COLUMNS))
+        parser.add_argument("path", help="File to write, or - for stdout")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, help="Defaults to the file extension, then csv")
+        parser.add_argument("--sku", action="append", default=[], help="Repeat for several products")
+        parser.add_argument("--supplier", type=int, help="Supplier id")
+        parser.add_argument(
+            "--start", type=date.fromisoformat, help="First log date (consumption) or depletion date (forecasts)"
+        )
+        parser.add_argument(
+            "--end", type=date.fromisoformat, help="Last log date (consumption) or depletion date (forecasts)"
+        )
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("parquet" if path.endswith(".parquet") else "csv")
+        filters = ExportFilters(
+            skus=options["sku"],
+            supplier_id=options["supplier"],
+            start=options["start"],
+            end=options["end"],
+        )
+        try:
+            chunks = stream_export(options["kind"], fmt, filters, max(1, options["chunk_size"]))
+            stream = nullcontext(sys.stdout.buffer) if path == "-" else open(path, "wb")
+        except (ValueError, OSError) as e:
+            raise CommandError(e)
+
+        written = 0
+        with stream as out:
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+        if path != "-":
+            self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {path}"))
@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from inventory.ingest import IMPORT_BATCH_SIZE, IMPORT_FORMATS, guess_format, import_consumption
+
+
+class Command(BaseCommand):
+    help = "Bulk imports consumption logs from a CSV or JSON Lines file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for stdin")
+        parser.add_argument("--format", choices=IMPORT_FORMATS, help="Defaults to the file extension")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument(
+            "--no-stock-update",
+            action="store_true",
+            help="Do not decrement current_stock for imported consumption",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or guess_format(path)
+        try:
+            stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        except OSError as e:
+            raise CommandError(e)
+
+        with stream:
+            report = import_consumption(
+                stream,
+                fmt,
+                batch_size=options["batch_size"],
+                update_stock=not options["no_stock_update"],
+            )
+
+        for error in report.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {report.imported} of {report.rows} rows "
+                f"({report.rejected} rejected) in {report.elapsed:.2f}s "
+                f"({report.rows_per_second:.0f} rows/s)"
+            )
+        )
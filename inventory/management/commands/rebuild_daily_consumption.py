@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from inventory.rollups import rebuild_daily_consumption
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the DailyConsumption rollup and stock ledger from raw consumption logs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product",
+            type=int,
+            action="append",
+            dest="product_ids",
+            help="Only rebuild this product id (may be repeated)",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rebuilding daily consumption...")
+        written = rebuild_daily_consumption(options["product_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} daily rows"))
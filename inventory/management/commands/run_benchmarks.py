@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from inventory.benchmarks import (
+    DEFAULT_TOLERANCE,
+    compare_to_baseline,
+    load_baseline,
+    run_benchmarks,
+    save_baseline,
+)
+from inventory.synthetic import generate_dataset
+
+
+class Command(BaseCommand):
+    help = "Runs the performance benchmarks against a throwaway synthetic database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=2000)
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument(
+            "--only", action="append", help="Run only scenarios whose name contains this (repeatable)"
+        )
+        parser.add_argument("--baseline", help="Baseline JSON to compare against; fails on regressions")
+        parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=DEFAULT_TOLERANCE,
+            help="Allowed latency/memory growth over the baseline (0.25 = 25%%)",
+        )
+        parser.add_argument(
+            "--keepdb", action="store_true", help="Reuse (and keep) the test database between runs"
+        )
+
+    def handle(self, *args, **options):
+        baseline = load_baseline(options["baseline"]) if options["baseline"] else None
+        dataset = {k: options[k] for k in ("products", "days", "seed")}
+        if baseline and baseline.get("dataset") != dataset:
+            self.stderr.write(
+                self.style.WARNING(f"Baseline was recorded on {baseline.get('dataset')}, not {dataset}")
+            )
+
+        creation = connection.creation
+        old_name = connection.settings_dict["NAME"]
+        creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            with override_settings(ALLOWED_HOSTS=["testserver"], DEBUG=False):
+                results = self.run(dataset, options)
+        finally:
+            creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+
+        if options["save_baseline"]:
+            save_baseline(options["save_baseline"], results, dataset)
+            self.stdout.write(f"Saved baseline to {options['save_baseline']}")
+
+        if baseline:
+            regressions = compare_to_baseline(results, baseline, options["tolerance"])
+            if regressions:
+                raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    def run(self, dataset, options):
+        from inventory.models import Product
+
+        if not Product.objects.exists():
+            self.stdout.write(f"Generating {dataset['products']} products x {dataset['days']} days...")
+            counts = generate_dataset(dataset["products"], dataset["days"], seed=dataset["seed"])
+            self.stdout.write(f"Generated {counts['logs']} logs in {counts['daily_rows']} daily rows")
+
+        self.stdout.write(f"{'scenario':<44} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8} {'peak KB':>10}")
+
+        def progress(name, result):
+            self.stdout.write(
+                f"{name:<44} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+                f"{result['p99_ms']:>9.2f} {result['queries']:>8} {result['peak_memory_kb']:>10.1f}"
+            )
+
+        return run_benchmarks(options["iterations"], options["only"], progress)
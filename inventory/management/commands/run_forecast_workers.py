@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from inventory.jobs import enqueue_all_analysis
+from inventory.workers import JOBS_PER_TASK, POLL_INTERVAL, process_jobs
+
+
+class Command(BaseCommand):
+    help = "Runs queued forecast and chart recomputation jobs in a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=2, help="Worker processes (0 runs jobs in this process)"
+        )
+        parser.add_argument(
+            "--jobs-per-task",
+            type=int,
+            default=JOBS_PER_TASK,
+            help="Products handed to a worker at a time",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=POLL_INTERVAL, help="Seconds between queue checks"
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once the queue is empty"
+        )
+        parser.add_argument(
+            "--enqueue-all", action="store_true", help="Queue every product before starting"
+        )
+
+    def handle(self, *args, **options):
+        if options["enqueue_all"]:
+            enqueue_all_analysis()
+        self.stdout.write(f"Processing analysis jobs with {options['workers']} workers...")
+        try:
+            completed = process_jobs(
+                workers=options["workers"],
+                jobs_per_task=options["jobs_per_task"],
+                poll_interval=options["poll_interval"],
+                once=options["once"],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Completed {completed} jobs"))
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_daily_consumption(apps, schema_editor):
+    ConsumptionLog = apps.get_model("inventory", "ConsumptionLog")
+    DailyConsumption = apps.get_model("inventory", "DailyConsumption")
+    grouped = (
+        ConsumptionLog.objects.order_by()
+        .values_list("product_id", "date")
+        .annotate(total=Sum("quantity"), entries=Count("id"))
+    )
+    DailyConsumption.objects.bulk_create(
+        (
+            DailyConsumption(
+                product_id=product_id,
+                date=date,
+                total_quantity=total,
+                entry_count=entries,
+            )
+            for product_id, date, total, entries in grouped.iterator()
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyConsumption",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("total_quantity", models.PositiveIntegerField(default=0)),
+                ("entry_count", models.PositiveIntegerField(default=0)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_consumption",
+                        to="inventory.product",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("product", "date"), name="unique_daily_consumption"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_daily_consumption, migrations.RunPython.noop),
+    ]
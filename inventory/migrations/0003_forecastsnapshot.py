@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0002_dailyconsumption"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ForecastSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("computed_at", models.DateTimeField()),
+                ("avg_daily_usage", models.FloatField(default=0)),
+                ("days_left", models.FloatField(blank=True, null=True)),
+                ("depletion_date", models.DateField(blank=True, null=True)),
+                (
+                    "lead_time_days",
+                    models.PositiveIntegerField(
+                        blank=True, help_text="Fastest supplier's lead time", null=True
+                    ),
+                ),
+                ("order_by_date", models.DateField(blank=True, null=True)),
+                ("recommended_order_quantity", models.PositiveIntegerField(default=0)),
+                (
+                    "is_stale",
+                    models.BooleanField(
+                        default=False,
+                        help_text="Consumption or stock changed since computed",
+                    ),
+                ),
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="forecast_snapshot",
+                        to="inventory.product",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["depletion_date"], name="forecast_depletion_idx"
+                    ),
+                    models.Index(
+                        condition=models.Q(("is_stale", True)),
+                        fields=["is_stale"],
+                        name="forecast_stale_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
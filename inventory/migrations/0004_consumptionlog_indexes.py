@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Product search (name/sku icontains or istartswith) indexes are vendor
+# specific, so they are created with raw SQL:
+# - PostgreSQL: trigram GIN indexes on UPPER(col), which is what Django's
+#   icontains/istartswith compare against.
+# - SQLite: NOCASE indexes, usable by case-insensitive prefix LIKE.
+SEARCH_INDEXES = {
+    "postgresql": [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS product_name_search_idx ON inventory_product "
+        "USING gin (UPPER(name::text) gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS product_sku_search_idx ON inventory_product "
+        "USING gin (UPPER(sku::text) gin_trgm_ops)",
+    ],
+    "sqlite": [
+        "CREATE INDEX IF NOT EXISTS product_name_search_idx ON inventory_product "
+        "(name COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS product_sku_search_idx ON inventory_product "
+        "(sku COLLATE NOCASE)",
+    ],
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    for sql in SEARCH_INDEXES.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor in SEARCH_INDEXES:
+        schema_editor.execute("DROP INDEX IF EXISTS product_name_search_idx")
+        schema_editor.execute("DROP INDEX IF EXISTS product_sku_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0003_forecastsnapshot"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="consumptionlog",
+            index=models.Index(
+                fields=["product", "date", "id"],
+                include=("quantity",),
+                name="log_product_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="consumptionlog",
+            index=models.Index(fields=["date"], name="log_date_idx"),
+        ),
+        migrations.AlterField(
+            model_name="consumptionlog",
+            name="product",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="consumption_logs",
+                to="inventory.product",
+            ),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_stock_balance(apps, schema_editor):
+    # Consumption is the only stock movement recorded so far
+    DailyConsumption = apps.get_model("inventory", "DailyConsumption")
+    DailyStockBalance = apps.get_model("inventory", "DailyStockBalance")
+
+    def rows():
+        product, running_total = None, 0
+        days = DailyConsumption.objects.order_by("product_id", "date").values_list(
+            "product_id", "date", "total_quantity"
+        )
+        for product_id, date, quantity in days.iterator(chunk_size=5000):
+            if product_id != product:
+                product, running_total = product_id, 0
+            running_total -= quantity
+            yield DailyStockBalance(
+                product_id=product_id,
+                date=date,
+                net_change=-quantity,
+                running_total=running_total,
+            )
+
+    DailyStockBalance.objects.bulk_create(rows(), batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0005_analysisjob_precomputedanalysis"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyStockBalance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("net_change", models.IntegerField(default=0)),
+                ("running_total", models.BigIntegerField(default=0)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_balance",
+                        to="inventory.product",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("product", "date"),
+                        include=("running_total",),
+                        name="unique_daily_stock_balance",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="StockMovement",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("receipt", "Receipt"), ("adjustment", "Adjustment")],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "quantity",
+                    models.IntegerField(
+                        help_text="Units added; negative adjustments remove stock"
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("notes", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_movements",
+                        to="inventory.product",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["product", "date"], name="movement_product_date_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_stock_balance, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 
 
@@ -25,11 +26,222 @@ class Product(models.Model):
 
 class ConsumptionLog(models.Model):
     product = models.ForeignKey(
-        Product, on_delete=models.CASCADE, related_name="consumption_logs"
+        Product,
+        on_delete=models.CASCADE,
+        related_name="consumption_logs",
+        db_index=False,  # covered by log_product_date_idx
     )
     quantity = models.PositiveIntegerField()
     date = models.DateField()
     notes = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Per-product date ranges and newest-first history; quantity is
+            # included (PostgreSQL) so usage sums are index-only scans
+            models.Index(
+                fields=["product", "date", "id"],
+                include=["quantity"],
+                name="log_product_date_idx",
+            ),
+            # Date filters across all products (admin changelist)
+            models.Index(fields=["date"], name="log_date_idx"),
+        ]
+
     def __str__(self):
         return f"{self.product.name} - {self.quantity} on {self.date}"
+
+
+class DailyConsumption(models.Model):
+    """
+    Per product/day rollup of ConsumptionLog, kept in sync on write by
+    inventory.rollups so analytics read one row per day instead of raw logs.
+    """
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="daily_consumption"
+    )
+    date = models.DateField()
+    total_quantity = models.PositiveIntegerField(default=0)
+    entry_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "date"], name="unique_daily_consumption"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} - {self.total_quantity} on {self.date}"
+
+
+class StockMovement(models.Model):
+    """
+    A delivery or manual correction of a product's stock. Saving or deleting
+    one moves current_stock and the DailyStockBalance ledger (see
+    inventory.ledger); consumption is recorded as ConsumptionLog rows, which
+    feed the same ledger.
+    """
+
+    RECEIPT = "receipt"
+    ADJUSTMENT = "adjustment"
+    KIND_CHOICES = [
+        (RECEIPT, "Receipt"),
+        (ADJUSTMENT, "Adjustment"),
+    ]
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="stock_movements",
+        db_index=False,  # covered by movement_product_date_idx
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    quantity = models.IntegerField(help_text="Units added; negative adjustments remove stock")
+    date = models.DateField()
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["product", "date"], name="movement_product_date_idx"),
+        ]
+
+    def clean(self):
+        if self.kind == self.RECEIPT and self.quantity is not None and self.quantity <= 0:
+            raise ValidationError({"quantity": "Receipts must add stock."})
+
+    def __str__(self):
+        return f"{self.product_id} {self.kind} {self.quantity:+d} on {self.date}"
+
+
+class DailyStockBalance(models.Model):
+    """
+    Per product/day stock ledger, kept in sync on write by inventory.ledger:
+    the day's net change (receipts and adjustments less consumption) and
+    the running total of net changes up to and including that day.
+    """
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="stock_balance"
+    )
+    date = models.DateField()
+    net_change = models.IntegerField(default=0)
+    running_total = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Range reads are index-only scans on PostgreSQL
+            models.UniqueConstraint(
+                fields=["product", "date"],
+                include=["running_total"],
+                name="unique_daily_stock_balance",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.net_change:+d} on {self.date}"
+
+
+class ForecastSnapshot(models.Model):
+    """
+    Latest precomputed depletion forecast and reorder hint for a product,
+    written by the compute_forecasts command (see inventory.snapshots).
+    """
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, related_name="forecast_snapshot"
+    )
+    computed_at = models.DateTimeField()
+    avg_daily_usage = models.FloatField(default=0)
+    days_left = models.FloatField(null=True, blank=True)
+    depletion_date = models.DateField(null=True, blank=True)
+    lead_time_days = models.PositiveIntegerField(
+        null=True, blank=True, help_text="Fastest supplier's lead time"
+    )
+    order_by_date = models.DateField(null=True, blank=True)
+    recommended_order_quantity = models.PositiveIntegerField(default=0)
+    is_stale = models.BooleanField(
+        default=False, help_text="Consumption or stock changed since computed"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["depletion_date"], name="forecast_depletion_idx"),
+            models.Index(
+                fields=["is_stale"],
+                name="forecast_stale_idx",
+                condition=models.Q(is_stale=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} runs out {self.depletion_date or 'never'}"
+
+
+class AnalysisJob(models.Model):
+    """
+    Queued recomputation of a product's forecast snapshot and precomputed
+    analysis, run by the run_forecast_workers command (see inventory.jobs).
+    One row per product, so repeated writes coalesce into a single job.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, related_name="analysis_job"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    generation = models.PositiveIntegerField(
+        default=0, help_text="Incremented each time the job is requested again"
+    )
+    requested_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["requested_at"],
+                name="analysis_job_pending_idx",
+                condition=models.Q(status="pending"),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.status}"
+
+
+class PrecomputedAnalysis(models.Model):
+    """
+    Product detail analysis and chart images for the default analysis
+    settings, written by the background workers and served instead of
+    computing them in the request while not stale.
+    """
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, related_name="precomputed_analysis"
+    )
+    computed_at = models.DateTimeField()
+    has_data = models.BooleanField(default=False)
+    consumption_rmse = models.FloatField(null=True, blank=True)
+    stock_rmse = models.FloatField(null=True, blank=True)
+    days_left = models.FloatField(null=True, blank=True)
+    consumption_chart = models.BinaryField(null=True, blank=True)
+    stock_chart = models.BinaryField(null=True, blank=True)
+    is_stale = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.product_id} analysis at {self.computed_at}"
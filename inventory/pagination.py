@@ -0,0 +1,158 @@
+"""
+Keyset ("seek") pagination: pages are fetched with a WHERE on the last seen
+ordering key instead of OFFSET, and no COUNT(*) is needed, so every page
+costs the same however deep it is.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Counts above this are reported as "more than" instead of counted exactly
+COUNT_CAP = 1000
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` by ``ordering``, a sequence of field or annotation
+    names (prefixed with ``-`` for descending) whose last entry is unique.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.fields = [(name.lstrip("-"), name.startswith("-")) for name in self.ordering]
+        self.per_page = per_page
+
+    def _field(self, name):
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return self.queryset.model._meta.get_field(name)
+
+    def encode_cursor(self, obj, backward=False):
+        values = [getattr(obj, name) for name, _ in self.fields]
+        payload = json.dumps({"k": values, "b": backward}, cls=DjangoJSONEncoder)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        """Return ``(values, backward)``, or ``(None, False)`` if invalid."""
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            values = [
+                self._field(name).to_python(value)
+                for (name, _), value in zip(self.fields, payload["k"], strict=True)
+            ]
+            return values, bool(payload["b"])
+        except (ValueError, TypeError, KeyError, ValidationError):
+            # binascii/JSON decoding errors are ValueErrors too
+            return None, False
+
+    def _seek(self, values, backward):
+        # (a, b) after (x, y)  ==  a > x OR (a = x AND b > y), per direction
+        condition = Q()
+        for i, (name, descending) in enumerate(self.fields):
+            op = "lt" if descending != backward else "gt"
+            term = Q(**{f"{name}__{op}": values[i]})
+            for (prefix, _), value in zip(self.fields[:i], values[:i]):
+                term &= Q(**{prefix: value})
+            condition |= term
+        return condition
+
+    def get_page(self, cursor=None):
+        values, backward = self.decode_cursor(cursor) if cursor else (None, False)
+        queryset = self.queryset
+        ordering = self.ordering
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, backward))
+        if backward:
+            ordering = [name[1:] if name.startswith("-") else f"-{name}" for name in ordering]
+
+        rows = list(queryset.order_by(*ordering)[: self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+
+        if backward:
+            if not has_more:
+                # Reached the start: show a full first page instead
+                return self.get_page()
+            rows.reverse()
+            has_next, has_previous = True, True
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        return KeysetPage(
+            rows,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=self.encode_cursor(rows[-1]) if has_next and rows else None,
+            previous_cursor=self.encode_cursor(rows[0], backward=True) if has_previous and rows else None,
+        )
+
+
+def estimate_count(queryset, cap=COUNT_CAP):
+    """
+    Return ``(count, exact)`` without a full COUNT(*): the planner's row
+    estimate on PostgreSQL, otherwise a count capped at ``cap`` rows.
+    """
+    queryset = queryset.order_by()
+    if connection.vendor == "postgresql":
+        plan = json.loads(queryset.explain(format="json"))
+        return int(plan[0]["Plan"]["Plan Rows"]), False
+    count = queryset[: cap + 1].count()
+    return min(count, cap), count <= cap
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Page-number paginator (for the admin) whose total comes from
+    ``estimate_count``, so large changelists don't run COUNT(*). Pages are
+    sliced without trusting the total, which may be short: a page past it is
+    still served, and only an empty one marks the end.
+    """
+
+    count_cap = 10000
+
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list, cap=self.count_cap)[0]
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # Past the estimate is fine; whether the page exists is up to page()
+            if int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = self.object_list[bottom : bottom + self.per_page]
+        if number > self.num_pages and not object_list:
+            raise EmptyPage(self.error_messages["no_results"])
+        return self._get_page(object_list, number, self)
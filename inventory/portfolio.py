@@ -0,0 +1,143 @@
+"""
+Supplier and portfolio rollups: average daily consumption, critical/low
+product counts and lead-time exposure over many products at once.
+
+The database sums each product's consumption over the status window from
+the DailyConsumption rollup, joined through Product.suppliers, in one
+grouped query for any number of suppliers; classifying the products and
+reducing them per supplier is vectorised. Rollups are cached per supplier
+and for the portfolio under versions that every write to one of their
+products, a lead time or a product's suppliers replaces (see
+inventory.versioning).
+"""
+from typing import NamedTuple
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import FilteredRelation, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .columnar import fetch_columns
+from .instrumentation import record_cache
+from .models import Product
+from .status import (
+    STATUS_CACHE_TIMEOUT,
+    STATUS_WINDOW_DAYS,
+    status_window_start,
+    stock_status_ranks,
+)
+from .versioning import get_portfolio_version, get_supplier_versions
+
+
+class StockRollup(NamedTuple):
+    product_count: int = 0
+    total_stock: int = 0
+    daily_usage: float = 0.0  # average over the last STATUS_WINDOW_DAYS days
+    critical_count: int = 0
+    low_count: int = 0
+    # Units short of covering the lead time's demand at the current usage
+    exposure: float = 0.0
+
+
+def _reduce(groups, n_groups, stock, minimum, usage, lead_time):
+    # One StockRollup per group from per-product columns
+    ranks = stock_status_ranks(stock, minimum, usage)
+    exposure = np.maximum(usage * lead_time / STATUS_WINDOW_DAYS - stock, 0)
+    sums = [
+        np.bincount(groups, weights=weights, minlength=n_groups)
+        for weights in (
+            None,
+            stock,
+            usage / STATUS_WINDOW_DAYS,
+            ranks == 0,
+            ranks == 1,
+            np.nan_to_num(exposure),
+        )
+    ]
+    return [
+        StockRollup(int(count), int(total), float(daily), int(critical), int(low), float(short))
+        for count, total, daily, critical, low, short in zip(*sums)
+    ]
+
+
+def _window_usage(queryset, path, since):
+    # Sum over a join limited to the window, an index range per product
+    return queryset.annotate(
+        recent=FilteredRelation(path, condition=Q(**{f"{path}__date__gte": since}))
+    ).annotate(usage=Coalesce(Sum("recent__total_quantity"), Value(0)))
+
+
+def compute_supplier_rollups(supplier_ids, today=None):
+    """``{supplier_id: StockRollup}`` for ``supplier_ids``, in one query."""
+    supplier_ids = sorted(set(supplier_ids))
+    links = (
+        Product.suppliers.through.objects.filter(supplier_id__in=supplier_ids)
+        .order_by()
+        .values_list(
+            "supplier_id",
+            "product_id",
+            "product__current_stock",
+            "product__minimum_stock_level",
+            "supplier__lead_time_days",
+        )
+    )
+    links = _window_usage(links, "product__daily_consumption", status_window_start(today))
+    suppliers, _, stock, minimum, lead_time, usage = fetch_columns(links, [np.int64] * 6)
+    groups = np.searchsorted(supplier_ids, suppliers)
+    rollups = _reduce(groups, len(supplier_ids), stock, minimum, usage, lead_time)
+    return dict(zip(supplier_ids, rollups))
+
+
+def compute_portfolio_rollup(today=None):
+    """The ``StockRollup`` of every product, each counted once."""
+    # The fastest supplier's lead time, as the forecast snapshots use
+    fastest = (
+        Product.suppliers.through.objects.filter(product_id=OuterRef("pk"))
+        .order_by("supplier__lead_time_days")
+        .values("supplier__lead_time_days")[:1]
+    )
+    products = (
+        Product.objects.order_by()
+        .annotate(lead_time=Subquery(fastest))
+        .values_list("pk", "current_stock", "minimum_stock_level", "lead_time")
+    )
+    products = _window_usage(products, "daily_consumption", status_window_start(today))
+    _, stock, minimum, lead_time, usage = fetch_columns(
+        products, [np.int64, np.int64, np.int64, float, np.int64]
+    )
+    # Products without a supplier have no lead time to be exposed over
+    return _reduce(np.zeros(len(stock), dtype=np.int64), 1, stock, minimum, usage, lead_time)[0]
+
+
+def rollup_cache_key(kind, pk, version, today):
+    return f"stock_rollup:{kind}:{pk}:{version}:{today.isoformat()}"
+
+
+def get_supplier_rollups(supplier_ids, today=None):
+    """
+    ``{supplier_id: StockRollup}`` from one ``get_many``; misses are
+    computed together and written back with one ``set_many``.
+    """
+    today = today or timezone.now().date()
+    versions = get_supplier_versions(supplier_ids)
+    keys = {pk: rollup_cache_key("supplier", pk, version, today) for pk, version in versions.items()}
+    cached = cache.get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in cached]
+    record_cache("supplier_rollup", len(keys) - len(missing), len(missing))
+    if missing:
+        fresh = {keys[pk]: rollup for pk, rollup in compute_supplier_rollups(missing, today).items()}
+        cache.set_many(fresh, timeout=STATUS_CACHE_TIMEOUT)
+        cached.update(fresh)
+    return {pk: cached[key] for pk, key in keys.items()}
+
+
+def get_portfolio_rollup(today=None):
+    today = today or timezone.now().date()
+    key = rollup_cache_key("portfolio", "all", get_portfolio_version(), today)
+    rollup = cache.get(key)
+    record_cache("portfolio_rollup", rollup is not None, rollup is None)
+    if rollup is None:
+        rollup = compute_portfolio_rollup(today)
+        cache.set(key, rollup, STATUS_CACHE_TIMEOUT)
+    return rollup
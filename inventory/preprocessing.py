@@ -0,0 +1,186 @@
+"""
+Outlier replacement and smoothing of daily consumption, on one series or
+on a products x days matrix.
+
+Every function takes a 1-D series, or a 2-D matrix with a ``mask`` of the
+days each row covers (rows padded with NaN past their last day, as
+``forecasting.ConsumptionMatrix``), and works along the last axis. Edges
+are handled the same way throughout: an outlier is replaced by linear
+interpolation between its nearest kept days, or by the nearest kept day
+at either end, and smoothers use trailing windows over the days
+available, so a row's first days average fewer values (``min_periods=1``).
+"""
+import warnings
+
+import numpy as np
+
+OUTLIER_METHODS = [
+    ("zscore", "Z-score (σ)"),
+    ("mad", "Median absolute deviation"),
+    ("iqr", "Interquartile range"),
+]
+SMOOTHING_METHODS = [
+    ("sma", "Rolling mean"),
+    ("ema", "Exponential mean"),
+    ("median", "Rolling median"),
+]
+# Series this short are never filtered for outliers
+MIN_OUTLIER_DAYS = 6
+# Scales the MAD to the standard deviation of normally distributed data,
+# so "mad" thresholds read like z-scores
+MAD_SCALE = 1.4826
+
+
+def _rows(y, mask):
+    y = np.asarray(y, dtype=float)
+    if y.ndim == 1:
+        return y[None, :], np.ones((1, len(y)), dtype=bool), True
+    if mask is None:
+        mask = np.ones(y.shape, dtype=bool)
+    return y, mask, False
+
+
+def _result(y, squeeze):
+    return y[0] if squeeze else y
+
+
+def _nan_stat(func, values, *args):
+    # Padding makes all-NaN slices; their result is masked out anyway
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return func(values, *args, axis=-1)
+
+
+def interpolate_gaps(y, mask=None):
+    """
+    Fill the NaNs inside each row's days linearly between the nearest
+    values on either side, and with the nearest value at the edges (pandas
+    ``interpolate().bfill().ffill()``).
+    """
+    y, mask, squeeze = _rows(y, mask)
+    n_rows, n_days = y.shape
+    idx = np.arange(n_days)
+    valid = mask & ~np.isnan(y)
+
+    prev = np.maximum.accumulate(np.where(valid, idx, -1), axis=1)
+    nxt = np.minimum.accumulate(np.where(valid, idx, n_days)[:, ::-1], axis=1)[:, ::-1]
+    has_prev, has_next = prev >= 0, nxt < n_days
+
+    rows = np.arange(n_rows)[:, None]
+    y_prev = y[rows, np.clip(prev, 0, n_days - 1)]
+    y_next = y[rows, np.clip(nxt, 0, n_days - 1)]
+    both = has_prev & has_next
+    span = np.where(both, nxt - prev, 1)
+    with np.errstate(invalid="ignore"):
+        filled = np.where(
+            both,
+            y_prev + (y_next - y_prev) * (idx - prev) / span,
+            np.where(has_prev, y_prev, y_next),
+        )
+    return _result(np.where(mask & ~valid, filled, y), squeeze)
+
+
+def outlier_mask(y, mask=None, threshold=2.0, method="zscore"):
+    """
+    Days that are outliers of their row by ``method``:
+
+    - ``zscore``: more than ``threshold`` sample standard deviations from
+      the mean
+    - ``mad``: more than ``threshold`` scaled median absolute deviations
+      from the median
+    - ``iqr``: more than ``threshold`` interquartile ranges outside the
+      quartiles
+
+    Rows shorter than ``MIN_OUTLIER_DAYS`` or without any spread have none.
+    """
+    y, mask, squeeze = _rows(y, mask)
+    lengths = mask.sum(axis=1)
+    values = np.where(mask, y, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if method == "zscore":
+            n = lengths.astype(float)
+            mean = np.where(mask, y, 0.0).sum(axis=1) / n
+            dev = np.where(mask, y - mean[:, None], 0.0)
+            spread = np.sqrt((dev ** 2).sum(axis=1) / (n - 1))
+            outliers = np.abs(dev / spread[:, None]) > threshold
+        elif method == "mad":
+            median = _nan_stat(np.nanmedian, values)
+            dev = np.abs(values - median[:, None])
+            spread = MAD_SCALE * _nan_stat(np.nanmedian, dev)
+            outliers = dev / spread[:, None] > threshold
+        elif method == "iqr":
+            q1, q3 = _nan_stat(np.nanpercentile, values, [25, 75])
+            spread = q3 - q1
+            outliers = (values < (q1 - threshold * spread)[:, None]) | (
+                values > (q3 + threshold * spread)[:, None]
+            )
+        else:
+            raise ValueError(f"Unknown outlier method: {method}")
+    applies = (lengths >= MIN_OUTLIER_DAYS) & (spread > 0)
+    return _result(mask & applies[:, None] & outliers, squeeze)
+
+
+def remove_outliers(y, mask=None, threshold=2.0, method="zscore"):
+    """``y`` with its ``outlier_mask`` days interpolated over."""
+    outliers = outlier_mask(y, mask, threshold, method)
+    if not outliers.any():
+        return np.asarray(y, dtype=float)
+    return interpolate_gaps(np.where(outliers, np.nan, y), mask)
+
+
+def rolling_mean(y, mask=None, window=3):
+    """Trailing mean with ``min_periods=1``, computed with one cumsum."""
+    y, mask, squeeze = _rows(y, mask)
+    csum = np.cumsum(np.where(mask, y, 0.0), axis=1)
+    shifted = np.zeros_like(csum)
+    shifted[:, window:] = csum[:, :-window]
+    counts = np.minimum(np.arange(1, y.shape[1] + 1), window)
+    return _result(np.where(mask, (csum - shifted) / counts, np.nan), squeeze)
+
+
+def exponential_mean(y, mask=None, window=3):
+    """
+    Exponentially weighted mean with span ``window`` (pandas
+    ``ewm(span=window, adjust=False)``), started at each row's first day.
+    """
+    y, mask, squeeze = _rows(y, mask)
+    alpha = 2.0 / (window + 1)
+    result = np.empty_like(y)
+    if y.shape[1]:
+        # One step per day, vectorised across rows
+        result[:, 0] = y[:, 0]
+        for day in range(1, y.shape[1]):
+            result[:, day] = alpha * y[:, day] + (1 - alpha) * result[:, day - 1]
+    return _result(np.where(mask, result, np.nan), squeeze)
+
+
+def rolling_median(y, mask=None, window=3):
+    """Trailing median with ``min_periods=1``."""
+    y, mask, squeeze = _rows(y, mask)
+    padded = np.pad(np.where(mask, y, np.nan), ((0, 0), (window - 1, 0)), constant_values=np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=1)
+    return _result(np.where(mask, _nan_stat(np.nanmedian, windows), np.nan), squeeze)
+
+
+SMOOTHERS = {"sma": rolling_mean, "ema": exponential_mean, "median": rolling_median}
+
+
+def smooth(y, mask=None, window=3, method="sma"):
+    if method not in SMOOTHERS:
+        raise ValueError(f"Unknown smoothing method: {method}")
+    if window < 1:
+        raise ValueError(f"Smoothing window must be at least 1: {window}")
+    return SMOOTHERS[method](y, mask, window)
+
+
+def preprocess(y, params, mask=None):
+    """
+    Apply the outlier replacement, then the smoothing, enabled in
+    ``params`` (an ``analytics.AnalysisParams``) to ``y``.
+    """
+    y = np.asarray(y, dtype=float)
+    if params.remove_outliers:
+        y = remove_outliers(y, mask, params.outlier_threshold, params.outlier_method)
+    if params.enable_smoothing:
+        y = smooth(y, mask, params.smoothing_window, params.smoothing_method)
+    return y
@@ -0,0 +1,188 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .ledger import (
+    BULK_DELTA_THRESHOLD,
+    BULK_WRITE_BATCH_SIZE,
+    REBUILD_BATCH_SIZE,
+    apply_stock_deltas,
+    rebuild_stock_ledger,
+    update_current_stock,
+)
+from .models import ConsumptionLog, DailyConsumption, Product
+from .snapshots import mark_all_forecasts_stale, mark_forecasts_stale
+from .versioning import bump_product_versions
+
+
+def _apply_delta(product_id, date, quantity, entries):
+    rows = DailyConsumption.objects.filter(product_id=product_id, date=date)
+    updated = rows.update(
+        total_quantity=F("total_quantity") + quantity,
+        entry_count=F("entry_count") + entries,
+    )
+    if updated:
+        if entries < 0:
+            rows.filter(entry_count__lte=0).delete()
+        return
+    if entries <= 0:
+        # Nothing to subtract from (e.g. the product is being deleted)
+        return
+    try:
+        with transaction.atomic():
+            DailyConsumption.objects.create(
+                product_id=product_id,
+                date=date,
+                total_quantity=quantity,
+                entry_count=entries,
+            )
+    except IntegrityError:
+        # Created concurrently since our UPDATE, add on top of it
+        rows.update(
+            total_quantity=F("total_quantity") + quantity,
+            entry_count=F("entry_count") + entries,
+        )
+
+
+def _apply_deltas_in_bulk(deltas):
+    # Lock the existing rows, then replace them and insert new days with a
+    # handful of bulk statements instead of one UPDATE per (product, day)
+    product_ids = {product_id for product_id, _ in deltas}
+    dates = {date for _, date in deltas}
+    existing = {
+        (row.product_id, row.date): row
+        for row in DailyConsumption.objects.select_for_update().filter(
+            product_id__in=product_ids, date__in=dates
+        )
+    }
+
+    replaced, to_create = [], []
+    for key, (quantity, entries) in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            if entries > 0:
+                to_create.append(
+                    DailyConsumption(
+                        product_id=key[0],
+                        date=key[1],
+                        total_quantity=quantity,
+                        entry_count=entries,
+                    )
+                )
+            continue
+        replaced.append(row.pk)
+        if row.entry_count + entries > 0:
+            # Re-inserted below; cheaper than a CASE-per-row bulk_update
+            to_create.append(
+                DailyConsumption(
+                    product_id=row.product_id,
+                    date=row.date,
+                    total_quantity=row.total_quantity + quantity,
+                    entry_count=row.entry_count + entries,
+                )
+            )
+
+    DailyConsumption.objects.filter(pk__in=replaced).delete()
+    try:
+        with transaction.atomic():
+            DailyConsumption.objects.bulk_create(to_create, batch_size=BULK_WRITE_BATCH_SIZE)
+    except IntegrityError:
+        # Some days were created concurrently; fall back to per-row upserts
+        for row in to_create:
+            _apply_delta(row.product_id, row.date, row.total_quantity, row.entry_count)
+
+
+def apply_consumption_deltas(deltas, update_stock=True):
+    """
+    Apply ``{(product_id, date): (quantity_delta, entry_delta)}`` to the
+    DailyConsumption rollup. Deltas may be negative (edits and deletes);
+    rows whose entry_count drops to zero are removed, the stock ledger and,
+    unless ``update_stock`` is false, current_stock move by the negated
+    quantities (see inventory.ledger), and the data version and forecast
+    snapshot of every touched product are invalidated.
+    """
+    deltas = {key: tuple(delta) for key, delta in deltas.items() if any(delta)}
+    product_ids = {product_id for product_id, _ in deltas}
+    with transaction.atomic():
+        bump_product_versions(product_ids)
+        mark_forecasts_stale(product_ids)
+        if len(deltas) > BULK_DELTA_THRESHOLD:
+            _apply_deltas_in_bulk(deltas)
+        else:
+            for (product_id, date), (quantity, entries) in deltas.items():
+                _apply_delta(product_id, date, quantity, entries)
+        apply_stock_deltas({key: -quantity for key, (quantity, _) in deltas.items()})
+        if update_stock:
+            stock_changes = defaultdict(int)
+            latest = {}
+            for (product_id, date), (quantity, _) in deltas.items():
+                stock_changes[product_id] -= quantity
+                latest[product_id] = max(date, latest.get(product_id, date))
+            update_current_stock(stock_changes, latest)
+
+
+def record_log_change(old=None, new=None):
+    """
+    Update the rollup for one ConsumptionLog write. ``old`` and ``new`` are
+    ``(product_id, date, quantity)`` tuples for the row before and after
+    the write; pass ``None`` for a create (old) or delete (new).
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    if old is not None:
+        product_id, date, quantity = old
+        deltas[(product_id, date)][0] -= quantity
+        deltas[(product_id, date)][1] -= 1
+    if new is not None:
+        product_id, date, quantity = new
+        deltas[(product_id, date)][0] += quantity
+        deltas[(product_id, date)][1] += 1
+    apply_consumption_deltas(deltas)
+
+
+def rebuild_daily_consumption(product_ids=None, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Recompute the rollup from raw ConsumptionLog rows, and the stock ledger
+    from it, for every product or only ``product_ids``. Returns the number
+    of rollup rows written.
+    """
+    logs = ConsumptionLog.objects.all()
+    rollups = DailyConsumption.objects.all()
+    if product_ids is not None:
+        logs = logs.filter(product_id__in=product_ids)
+        rollups = rollups.filter(product_id__in=product_ids)
+
+    grouped = (
+        logs.order_by()
+        .values_list("product_id", "date")
+        .annotate(total=Sum("quantity"), entries=Count("id"))
+    )
+
+    written = 0
+    with transaction.atomic():
+        if product_ids is not None:
+            bump_product_versions(product_ids)
+            mark_forecasts_stale(product_ids)
+        else:
+            bump_product_versions(Product.objects.values_list("pk", flat=True))
+            mark_all_forecasts_stale()
+        rollups.delete()
+        batch = []
+        for product_id, date, total, entries in grouped.iterator(chunk_size=batch_size):
+            batch.append(
+                DailyConsumption(
+                    product_id=product_id,
+                    date=date,
+                    total_quantity=total,
+                    entry_count=entries,
+                )
+            )
+            if len(batch) >= batch_size:
+                DailyConsumption.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            DailyConsumption.objects.bulk_create(batch)
+            written += len(batch)
+        rebuild_stock_ledger(product_ids, batch_size)
+    return written
@@ -0,0 +1,133 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .ledger import record_movement_change
+from .models import ConsumptionLog, Product, StockMovement, Supplier
+from .rollups import record_log_change
+from .snapshots import mark_forecasts_stale
+from .versioning import bump_product_version, bump_product_versions, bump_supplier_versions
+
+
+@receiver(pre_save, sender=ConsumptionLog)
+def remember_previous_log(sender, instance, raw=False, **kwargs):
+    # Keep the stored row so post_save can move its quantity off the old day
+    instance._rollup_previous = None
+    if raw or instance.pk is None:
+        return
+    instance._rollup_previous = (
+        ConsumptionLog.objects.filter(pk=instance.pk)
+        .values_list("product_id", "date", "quantity")
+        .first()
+    )
+
+
+@receiver(post_save, sender=ConsumptionLog)
+def update_rollup_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    record_log_change(
+        old=getattr(instance, "_rollup_previous", None),
+        new=(instance.product_id, instance.date, instance.quantity),
+    )
+
+
+def _deleting_product(origin):
+    # Cascade from a product (or product queryset) delete: its rollup and
+    # ledger rows are deleted too, there is nothing to update
+    return isinstance(origin, Product) or getattr(origin, "model", None) is Product
+
+
+@receiver(post_delete, sender=ConsumptionLog)
+def update_rollup_on_delete(sender, instance, origin=None, **kwargs):
+    if _deleting_product(origin):
+        return
+    record_log_change(old=(instance.product_id, instance.date, instance.quantity))
+
+
+@receiver(pre_save, sender=StockMovement)
+def remember_previous_movement(sender, instance, raw=False, **kwargs):
+    instance._ledger_previous = None
+    if raw or instance.pk is None:
+        return
+    instance._ledger_previous = (
+        StockMovement.objects.filter(pk=instance.pk)
+        .values_list("product_id", "date", "quantity")
+        .first()
+    )
+
+
+@receiver(post_save, sender=StockMovement)
+def update_stock_on_movement_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    record_movement_change(
+        old=getattr(instance, "_ledger_previous", None),
+        new=(instance.product_id, instance.date, instance.quantity),
+    )
+
+
+@receiver(post_delete, sender=StockMovement)
+def update_stock_on_movement_delete(sender, instance, origin=None, **kwargs):
+    if _deleting_product(origin):
+        return
+    record_movement_change(old=(instance.product_id, instance.date, instance.quantity))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    bump_product_version(instance.pk)
+
+
+@receiver(pre_delete, sender=Product)
+def invalidate_supplier_rollups_on_delete(sender, instance, **kwargs):
+    # The supplier links are gone by post_delete
+    bump_supplier_versions(instance.suppliers.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_forecast(sender, instance, created=False, raw=False, **kwargs):
+    # Stock levels feed the forecast and the reorder quantity
+    if not created and not raw:
+        mark_forecasts_stale([instance.pk])
+
+
+@receiver(m2m_changed, sender=Product.suppliers.through)
+def invalidate_products_on_suppliers_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == "pre_clear":
+        # instance is a Supplier, whose product links are gone by post_clear
+        instance._cleared_product_ids = list(instance.products.values_list("pk", flat=True))
+        return
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        # pk_set are products (None on clear)
+        product_ids = pk_set if pk_set is not None else instance._cleared_product_ids
+    else:
+        product_ids = [instance.pk]
+    # The links are part of the products' data (API payloads and validators)
+    bump_product_versions(product_ids)
+    mark_forecasts_stale(product_ids)
+
+
+@receiver(m2m_changed, sender=Product.suppliers.through)
+def invalidate_supplier_rollups_on_suppliers_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action.startswith("post_"):
+            bump_supplier_versions([instance.pk])
+    elif action == "pre_clear":
+        bump_supplier_versions(instance.suppliers.values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove"):
+        bump_supplier_versions(pk_set)
+
+
+@receiver(post_save, sender=Supplier)
+def invalidate_forecast_on_lead_time_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        mark_forecasts_stale(instance.products.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+def invalidate_supplier_rollups(sender, instance, **kwargs):
+    bump_supplier_versions([instance.pk])
@@ -0,0 +1,151 @@
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .analytics import AnalysisParams
+from .forecasting import forecast_products
+from .jobs import enqueue_all_analysis, enqueue_analysis
+from .models import ForecastSnapshot, Product
+from .status import STATUS_WINDOW_DAYS
+
+# Products are forecast in chunks to bound the consumption matrix size
+SNAPSHOT_BATCH_SIZE = 2000
+# A recommended order covers the supplier lead time plus this many days
+ORDER_COVERAGE_DAYS = 14
+
+SNAPSHOT_FIELDS = [
+    "computed_at",
+    "avg_daily_usage",
+    "days_left",
+    "depletion_date",
+    "lead_time_days",
+    "order_by_date",
+    "recommended_order_quantity",
+    "is_stale",
+]
+
+
+def mark_forecasts_stale(product_ids):
+    """Flag the forecasts of ``product_ids`` as outdated and queue their recomputation."""
+    product_ids = list(product_ids)
+    ForecastSnapshot.objects.filter(product_id__in=product_ids, is_stale=False).update(
+        is_stale=True
+    )
+    enqueue_analysis(product_ids)
+
+
+def mark_all_forecasts_stale():
+    ForecastSnapshot.objects.update(is_stale=True)
+    enqueue_all_analysis()
+
+
+def recommend_order_quantity(current_stock, minimum_stock_level, avg_daily_usage, lead_time_days):
+    """
+    Units to order today so stock covers the lead time plus
+    ``ORDER_COVERAGE_DAYS`` and still ends above the minimum level.
+    """
+    cover_days = (lead_time_days or 0) + ORDER_COVERAGE_DAYS
+    target = math.ceil(avg_daily_usage * cover_days) + minimum_stock_level
+    return max(0, target - current_stock)
+
+
+def build_snapshot(product, lead_time_days, avg_daily_usage, days_left, today, now):
+    depletion_date = None
+    if product.current_stock <= 0 and avg_daily_usage > 0:
+        # Already out of stock
+        days_left = 0.0
+        depletion_date = today
+    elif days_left is not None and days_left > 0:
+        depletion_date = today + timedelta(days=days_left)
+    else:
+        days_left = None
+
+    order_by_date = None
+    if depletion_date is not None:
+        order_by_date = max(today, depletion_date - timedelta(days=lead_time_days or 0))
+
+    return ForecastSnapshot(
+        product=product,
+        computed_at=now,
+        avg_daily_usage=avg_daily_usage,
+        days_left=days_left,
+        depletion_date=depletion_date,
+        lead_time_days=lead_time_days,
+        order_by_date=order_by_date,
+        recommended_order_quantity=recommend_order_quantity(
+            product.current_stock, product.minimum_stock_level, avg_daily_usage, lead_time_days
+        ),
+        is_stale=False,
+    )
+
+
+def products_to_recompute(incremental=False):
+    products = Product.objects.order_by("pk")
+    if incremental:
+        products = products.filter(
+            Q(forecast_snapshot__isnull=True) | Q(forecast_snapshot__is_stale=True)
+        )
+    return products.values_list("pk", flat=True)
+
+
+def compute_forecast_snapshots(product_ids, params=AnalysisParams(), batch_size=SNAPSHOT_BATCH_SIZE):
+    """
+    Forecast ``product_ids`` with the batch engine and upsert their
+    ForecastSnapshot rows. Returns the number of snapshots written.
+    """
+    product_ids = list(product_ids)
+    today = timezone.now().date()
+    now = timezone.now()
+    written = 0
+
+    for start in range(0, len(product_ids), batch_size):
+        chunk = product_ids[start:start + batch_size]
+        products = {
+            p.pk: p
+            for p in Product.objects.filter(pk__in=chunk)
+            .annotate(fastest_lead_time=Min("suppliers__lead_time_days"))
+            .only("pk", "current_stock", "minimum_stock_level")
+        }
+        forecast = forecast_products(chunk, params)
+
+        # Recent usage (last STATUS_WINDOW_DAYS of each series) drives orders
+        mask = ~np.isnan(forecast.quantities)
+        recent = mask & (
+            np.arange(mask.shape[1]) >= mask.sum(axis=1)[:, None] - STATUS_WINDOW_DAYS
+        )
+        with np.errstate(invalid="ignore"):
+            recent_usage = np.where(recent, forecast.quantities, 0.0).sum(axis=1) / recent.sum(axis=1)
+        forecasted = {
+            pk: (float(recent_usage[row]), float(forecast.days_left[row]))
+            for row, pk in enumerate(forecast.product_ids.tolist())
+        }
+
+        snapshots = []
+        for pk, product in products.items():
+            avg_daily_usage, days_left = forecasted.get(pk, (0.0, None))
+            snapshots.append(
+                build_snapshot(
+                    product, product.fastest_lead_time, avg_daily_usage, days_left, today, now
+                )
+            )
+        ForecastSnapshot.objects.bulk_create(
+            snapshots,
+            update_conflicts=True,
+            unique_fields=["product"],
+            update_fields=SNAPSHOT_FIELDS,
+        )
+        written += len(snapshots)
+    return written
+
+
+def reorder_dashboard_queryset(horizon_days=7, today=None):
+    """Snapshots of products running out within ``horizon_days`` (one query)."""
+    today = today or timezone.now().date()
+    return (
+        ForecastSnapshot.objects.filter(depletion_date__lte=today + timedelta(days=horizon_days))
+        .select_related("product")
+        .order_by("depletion_date", "product__name")
+    )
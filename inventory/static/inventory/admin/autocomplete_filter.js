@@ -0,0 +1,14 @@
+'use strict';
+{
+    // Apply an autocomplete changelist filter as soon as a value is picked
+    const $ = django.jQuery;
+    $(function() {
+        $('select.admin-autocomplete-filter').on('change', function() {
+            const url = new URL(this.dataset.filterUrl, window.location.href);
+            if (this.value) {
+                url.searchParams.set(this.name, this.value);
+            }
+            window.location.href = url.href;
+        });
+    });
+}
@@ -0,0 +1,164 @@
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import (
+    Case,
+    CharField,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.core.cache import cache
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .instrumentation import record_cache
+from .models import DailyConsumption, Product
+from .versioning import get_product_versions
+
+# Average daily usage is measured over this many trailing days
+STATUS_WINDOW_DAYS = 30
+# A product is critical when it runs out within this many days
+CRITICAL_DAYS = 7
+
+STATUS_CRITICAL = "critical"
+STATUS_LOW = "low"
+STATUS_OK = "ok"
+STATUS_CHOICES = (STATUS_CRITICAL, STATUS_LOW, STATUS_OK)
+
+# Cached statuses are keyed by data version and day, so they only need to
+# outlive the day they were computed for.
+STATUS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def classify_stock_status(current_stock, minimum_stock_level, window_usage):
+    """
+    Return ``(days_left, status_alert)`` for a product that consumed
+    ``window_usage`` units over the last ``STATUS_WINDOW_DAYS`` days.
+
+    Mirrors ``annotate_stock_status`` so values computed in Python and in the
+    database always agree (integer division, truncated towards zero).
+    """
+    days_left = None
+    if window_usage > 0:
+        days_left = current_stock * STATUS_WINDOW_DAYS // window_usage
+        if days_left <= CRITICAL_DAYS:
+            return days_left, STATUS_CRITICAL
+    if current_stock <= minimum_stock_level:
+        # Below min stock but maybe slow (or no) consumption
+        return days_left, STATUS_LOW
+    return days_left, STATUS_OK
+
+
+def stock_status_ranks(current_stock, minimum_stock_level, window_usage):
+    """
+    ``status_rank`` (0 = critical, 2 = ok) for arrays of products, by the
+    rules of ``classify_stock_status``.
+    """
+    consuming = window_usage > 0
+    days_left = current_stock * STATUS_WINDOW_DAYS // np.where(consuming, window_usage, 1)
+    critical = consuming & (days_left <= CRITICAL_DAYS)
+    low = current_stock <= minimum_stock_level
+    return np.where(critical, 0, np.where(low, 1, 2))
+
+
+def status_window_start(today=None):
+    today = today or timezone.now().date()
+    return today - timedelta(days=STATUS_WINDOW_DAYS)
+
+
+def window_usage_subquery(since):
+    # Reads the daily rollup: one row per product per day in the window
+    days = (
+        DailyConsumption.objects.filter(product=OuterRef("pk"), date__gte=since)
+        .order_by()
+        .values("product")
+        .annotate(total=Sum("total_quantity"))
+        .values("total")
+    )
+    return Subquery(days[:1], output_field=IntegerField())
+
+
+def annotate_stock_status(queryset, today=None):
+    """
+    Annotate a ``Product`` queryset with ``window_usage``, ``days_left``,
+    ``status_alert`` and ``status_rank`` (0 = critical, 2 = ok) in the same
+    SELECT, so a whole page can be classified, filtered and sorted by the
+    database in one query.
+    """
+    since = status_window_start(today)
+    queryset = queryset.annotate(
+        window_usage=Coalesce(window_usage_subquery(since), Value(0))
+    )
+    queryset = queryset.annotate(
+        days_left=Case(
+            When(
+                window_usage__gt=0,
+                then=F("current_stock") * STATUS_WINDOW_DAYS / F("window_usage"),
+            ),
+            default=None,
+            output_field=IntegerField(),
+        )
+    )
+    critical = Q(window_usage__gt=0, days_left__lte=CRITICAL_DAYS)
+    low = Q(current_stock__lte=F("minimum_stock_level"))
+    return queryset.annotate(
+        status_alert=Case(
+            When(critical, then=Value(STATUS_CRITICAL)),
+            When(low, then=Value(STATUS_LOW)),
+            default=Value(STATUS_OK),
+            output_field=CharField(),
+        ),
+        status_rank=Case(
+            When(critical, then=Value(0)),
+            When(low, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ),
+    )
+
+
+def status_cache_key(pk, version, today):
+    return f"product_status:{pk}:{version}:{today.isoformat()}"
+
+
+def attach_stock_status(products, today=None):
+    """
+    Set ``days_left`` and ``status_alert`` on each product in ``products``.
+
+    Statuses are read with one ``get_many`` keyed by each product's data
+    version; misses are computed together with one annotated query and
+    written back with one ``set_many``.
+    """
+    products = list(products)
+    if not products:
+        return products
+    today = today or timezone.now().date()
+
+    versions = get_product_versions([p.pk for p in products])
+    keys = {p.pk: status_cache_key(p.pk, versions[p.pk], today) for p in products}
+    cached = cache.get_many(keys.values())
+
+    missing = [p for p in products if keys[p.pk] not in cached]
+    record_cache("status", len(products) - len(missing), len(missing))
+    if missing:
+        computed = annotate_stock_status(
+            Product.objects.filter(pk__in=[p.pk for p in missing]), today
+        ).only("pk", "current_stock", "minimum_stock_level")
+        fresh = {
+            keys[p.pk]: {"days_left": p.days_left, "status_alert": p.status_alert}
+            for p in computed
+        }
+        cache.set_many(fresh, timeout=STATUS_CACHE_TIMEOUT)
+        cached.update(fresh)
+
+    for product in products:
+        status_data = cached.get(keys[product.pk], {})
+        product.days_left = status_data.get("days_left")
+        product.status_alert = status_data.get("status_alert", STATUS_OK)
+    return products
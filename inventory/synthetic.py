@@ -0,0 +1,346 @@
+"""
+Seeded synthetic inventory data at production-like scale, used by
+``seed_data`` and the benchmark harness.
+
+Rows are drawn as ``numpy`` arrays and written in large batches; each chunk
+of products gets its own generator spawned from the seed, so a given seed
+always produces the same data however many workers draw the chunks.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ConsumptionLog, DailyConsumption, DailyStockBalance, Product, Supplier, StockMovement
+from .snapshots import mark_all_forecasts_stale
+from .versioning import bump_product_versions
+
+GENERATE_BATCH_SIZE = 10000
+# Upper bound on products x days cells drawn at once
+CHUNK_CELLS = 2_000_000
+
+DEMO_CATALOG = {
+    "GRO": ["Avocados", "Olive Oil", "Flour", "Eggs", "Cheese", "Bacon", "Lettuce"],
+    "BEV": ["Green Tea", "Black Tea", "Espresso Pods", "Syrup (Vanilla)", "Syrup (Caramel)", "Almond Milk"],
+    "SUP": ["Paper Towels", "Trash Bags", "Dish Soap", "Sponges", "Sanitizer", "Straws", "Lids"],
+}
+# 60% normal, 20% critical, 20% low
+SCENARIOS = ("normal", "critical", "low")
+SCENARIO_WEIGHTS = (0.6, 0.2, 0.2)
+# Daily log chance and quantity range for normal and heavily used products
+USAGE_PROFILES = {
+    "normal": (0.3, 1, 10),
+    "heavy": (0.8, 5, 15),
+}
+# Products with less stock than this are given the heavy usage profile
+HEAVY_USAGE_STOCK = 25
+
+
+def insert_rows(model, fields, rows, batch_size=GENERATE_BATCH_SIZE):
+    """
+    INSERT ``rows`` (tuples of already adapted values for ``fields``) with
+    ``executemany``. Skips model instantiation and signals, which makes it
+    several times faster than ``bulk_create`` for log-sized tables.
+    """
+    opts = model._meta
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(opts.get_field(name).column) for name in fields)
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        quote(opts.db_table), columns, ", ".join(["%s"] * len(fields))
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+
+
+def write_consumption(product_ids, dates, rows, cols, per_cell, quantities, notes, batch_size):
+    """
+    Write logs for the non-empty cells ``(rows[i], cols[i])`` of a products x
+    days grid (in row-major order), ``per_cell[i]`` entries each, and the
+    matching rollup and stock ledger rows.
+    ``dates`` are database-adapted date values. Returns the log count.
+    """
+    if not len(rows):
+        return 0
+    product_col = product_ids[rows].tolist()
+    date_col = [dates[c] for c in cols.tolist()]
+    total_entries = int(per_cell.sum())
+
+    log_rows = list(
+        zip(
+            np.repeat(product_ids[rows], per_cell).tolist(),
+            [dates[c] for c in np.repeat(cols, per_cell).tolist()],
+            quantities.tolist(),
+            [notes] * total_entries,
+        )
+    )
+    insert_rows(ConsumptionLog, ["product", "date", "quantity", "notes"], log_rows, batch_size)
+
+    # Rollup straight from the arrays
+    cell_totals = np.add.reduceat(quantities, np.concatenate(([0], np.cumsum(per_cell)[:-1])))
+    insert_rows(
+        DailyConsumption,
+        ["product", "date", "total_quantity", "entry_count"],
+        list(zip(product_col, date_col, cell_totals.tolist(), per_cell.tolist())),
+        batch_size,
+    )
+
+    # Running totals restart at each product's first cell
+    running = np.cumsum(-cell_totals)
+    first = np.flatnonzero(np.diff(rows, prepend=-1))
+    running -= np.repeat(running[first] + cell_totals[first], np.diff(np.append(first, len(rows))))
+    insert_rows(
+        DailyStockBalance,
+        ["product", "date", "net_change", "running_total"],
+        list(zip(product_col, date_col, (-cell_totals).tolist(), running.tolist())),
+        batch_size,
+    )
+    return total_entries
+
+
+def clear_consumption():
+    """
+    Delete every log, rollup row and stock movement without loading them;
+    stock history starts over from the current stock levels.
+    """
+    bump_product_versions(Product.objects.values_list("pk", flat=True))
+    mark_all_forecasts_stale()
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for model in (DailyStockBalance, StockMovement, DailyConsumption, ConsumptionLog):
+            cursor.execute(f"DELETE FROM {quote(model._meta.db_table)}")
+
+
+def date_range(days, end_date=None):
+    """``days`` consecutive database-adapted dates ending at ``end_date``."""
+    end_date = end_date or timezone.now().date()
+    return [
+        connection.ops.adapt_datefield_value(end_date - timedelta(days=days - 1 - d))
+        for d in range(days)
+    ]
+
+
+def product_chunks(n_products, days):
+    chunk = max(1, CHUNK_CELLS // days)
+    return [(start, min(start + chunk, n_products)) for start in range(0, n_products, chunk)]
+
+
+def draw_chunks(draw, chunks, seed, workers=1):
+    """
+    Yield ``draw(rng, start, stop)`` for each chunk in order, drawing up to
+    ``workers`` chunks ahead of the consumer in background threads.
+    """
+    generators = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(len(chunks))]
+    jobs = [(rng, start, stop) for rng, (start, stop) in zip(generators, chunks)]
+    if workers <= 1:
+        for job in jobs:
+            yield draw(*job)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for job in jobs:
+            pending.append(pool.submit(draw, *job))
+            if len(pending) > workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def link_suppliers(product_ids, supplier_ids, rng, batch_size=GENERATE_BATCH_SIZE):
+    """Give each product one or two distinct suppliers."""
+    n = len(product_ids)
+    first = rng.integers(0, len(supplier_ids), n)
+    second = (first + 1 + rng.integers(0, max(1, len(supplier_ids) - 1), n)) % len(supplier_ids)
+    two = (rng.random(n) < 0.5) & (len(supplier_ids) > 1)
+
+    Through = Product.suppliers.through
+    for start in range(0, n, batch_size):
+        Through.objects.filter(product_id__in=product_ids[start:start + batch_size].tolist()).delete()
+    links = [(p, supplier_ids[s]) for p, s in zip(product_ids.tolist(), first.tolist())]
+    links += [(p, supplier_ids[s]) for p, s in zip(product_ids[two].tolist(), second[two].tolist())]
+    Through.objects.bulk_create(
+        (Through(product_id=p, supplier_id=s) for p, s in sorted(links)), batch_size=batch_size
+    )
+    return len(links)
+
+
+def popularity_rates(n_products, rng, max_daily_entries=40.0, skew=1.1):
+    """Mean log entries per day for each product (randomly ordered ranks)."""
+    ranks = rng.permutation(n_products) + 1
+    return max_daily_entries * ranks.astype(float) ** -skew
+
+
+def generate_dataset(
+    n_products,
+    days,
+    seed=0,
+    max_daily_entries=40.0,
+    skew=1.1,
+    end_date=None,
+    batch_size=GENERATE_BATCH_SIZE,
+    workers=1,
+    progress=None,
+):
+    """
+    Create ``n_products`` products with ``days`` days of consumption logs
+    ending at ``end_date`` (today by default), plus suppliers and the daily
+    rollup. Product popularity follows a Zipf-like curve, so a few SKUs log
+    dozens of entries per day while the long tail logs only occasionally.
+    Returns ``{"products": ..., "logs": ..., "daily_rows": ...}``.
+    """
+    rng = np.random.default_rng(seed)
+    dates = date_range(days, end_date)
+    counts = {"products": n_products, "logs": 0, "daily_rows": 0}
+
+    with transaction.atomic():
+        n_suppliers = max(3, n_products // 100)
+        lead_times = rng.integers(1, 15, n_suppliers)
+        suppliers = Supplier.objects.bulk_create(
+            Supplier(
+                name=f"Synthetic Supplier {i + 1}",
+                contact_email=f"supplier{i + 1}@example.com",
+                lead_time_days=int(lead_times[i]),
+            )
+            for i in range(n_suppliers)
+        )
+
+        rates = popularity_rates(n_products, rng, max_daily_entries, skew)
+        mean_quantity = 5.5
+        # Roughly two to eight weeks of stock at the product's usage rate
+        stock = np.ceil(rates * mean_quantity * rng.uniform(14, 56, n_products)).astype(int)
+        minimum = np.ceil(rates * mean_quantity * rng.uniform(3, 10, n_products)).astype(int) + 1
+        products = Product.objects.bulk_create(
+            (
+                Product(
+                    name=f"Synthetic Product {i:07d}",
+                    sku=f"SYN-{seed}-{i:07d}",
+                    current_stock=int(stock[i]),
+                    minimum_stock_level=int(minimum[i]),
+                )
+                for i in range(n_products)
+            ),
+            batch_size=batch_size,
+        )
+        product_ids = np.array([p.pk for p in products])
+        link_suppliers(product_ids, [s.pk for s in suppliers], rng, batch_size)
+
+        def draw(chunk_rng, start, stop):
+            entries = chunk_rng.poisson(rates[start:stop, None], size=(stop - start, days))
+            rows, cols = np.nonzero(entries)
+            per_cell = entries[rows, cols]
+            return start, stop, rows, cols, per_cell, chunk_rng.integers(1, 11, int(per_cell.sum()))
+
+        chunks = product_chunks(n_products, days)
+        for start, stop, rows, cols, per_cell, quantities in draw_chunks(draw, chunks, seed, workers):
+            counts["logs"] += write_consumption(
+                product_ids[start:stop], dates, rows, cols, per_cell, quantities, "Synthetic", batch_size
+            )
+            counts["daily_rows"] += len(rows)
+            if progress:
+                progress(stop, n_products, counts["logs"])
+    return counts
+
+
+def demo_names(n_products):
+    """``(category, name)`` pairs: the demo catalog, then numbered variants."""
+    catalog = [(code, name) for code, items in DEMO_CATALOG.items() for name in items]
+    for i in range(n_products):
+        code, name = catalog[i % len(catalog)]
+        round_ = i // len(catalog)
+        yield code, name if round_ == 0 else f"{name} #{round_ + 1}"
+
+
+def seed_inventory(n_products, days, seed=None, workers=1, batch_size=GENERATE_BATCH_SIZE, progress=None):
+    """
+    Create or refresh ``n_products`` demo products with a critical / low /
+    normal stock scenario each, and replace all consumption logs with
+    ``days`` days of usage matching those scenarios. Products and suppliers
+    are matched by name, so re-running updates them in place.
+    """
+    seed = np.random.SeedSequence(seed).entropy
+    rng = np.random.default_rng(seed)
+    dates = date_range(days)
+    counts = {"products": n_products, "logs": 0, "daily_rows": 0}
+
+    with transaction.atomic():
+        n_suppliers = max(3, n_products // 100)
+        lead_times = rng.integers(1, 8, n_suppliers)
+        existing = dict(Supplier.objects.values_list("name", "pk"))
+        Supplier.objects.bulk_create(
+            (
+                Supplier(
+                    name=f"Supplier {i + 1}",
+                    contact_email=f"supplier{i + 1}@example.com",
+                    lead_time_days=int(lead_times[i]),
+                )
+                for i in range(n_suppliers)
+                if f"Supplier {i + 1}" not in existing
+            ),
+            batch_size=batch_size,
+        )
+        suppliers = dict(Supplier.objects.values_list("name", "pk"))
+        supplier_ids = [suppliers[f"Supplier {i + 1}"] for i in range(n_suppliers)]
+
+        scenario = rng.choice(len(SCENARIOS), size=n_products, p=SCENARIO_WEIGHTS)
+        critical = scenario == SCENARIOS.index("critical")
+        low = scenario == SCENARIOS.index("low")
+        minimum = np.where(low, rng.integers(20, 41, n_products), rng.integers(10, 31, n_products))
+        stock = np.select(
+            [critical, low],
+            [rng.integers(5, 21, n_products), rng.integers(5, minimum)],
+            rng.integers(50, 201, n_products),
+        )
+
+        existing = dict(Product.objects.values_list("name", "pk"))
+        products, new = [], []
+        for i, (code, name) in enumerate(demo_names(n_products)):
+            product = Product(
+                pk=existing.get(name),
+                name=name,
+                sku=f"SKU-{code}-{name.replace(' ', '')[:4].upper()}-{i + 1:06d}",
+                current_stock=int(stock[i]),
+                minimum_stock_level=int(minimum[i]),
+            )
+            products.append(product)
+            if product.pk is None:
+                new.append(product)
+        Product.objects.bulk_update(
+            [p for p in products if p.pk is not None],
+            ["current_stock", "minimum_stock_level"],
+            batch_size=batch_size,
+        )
+        Product.objects.bulk_create(new, batch_size=batch_size)
+        product_ids = np.array([p.pk for p in products])
+        link_suppliers(product_ids, supplier_ids, rng, batch_size)
+
+        heavy = stock < HEAVY_USAGE_STOCK
+        chance, min_q, max_q = (
+            np.where(heavy, h, n) for h, n in zip(USAGE_PROFILES["heavy"], USAGE_PROFILES["normal"])
+        )
+
+        def draw(chunk_rng, start, stop):
+            logged = chunk_rng.random((stop - start, days)) < chance[start:stop, None]
+            rows, cols = np.nonzero(logged)
+            quantities = chunk_rng.integers(min_q[start:stop, None], max_q[start:stop, None] + 1, logged.shape)
+            return start, stop, rows, cols, quantities[rows, cols].astype(np.int64)
+
+        clear_consumption()
+        chunks = product_chunks(n_products, days)
+        for start, stop, rows, cols, quantities in draw_chunks(draw, chunks, seed, workers):
+            counts["logs"] += write_consumption(
+                product_ids[start:stop],
+                dates,
+                rows,
+                cols,
+                np.ones(len(rows), dtype=np.int64),
+                quantities,
+                "Daily usage",
+                batch_size,
+            )
+            counts["daily_rows"] += len(rows)
+            if progress:
+                progress(stop, n_products, counts["logs"])
+    counts["seed"] = seed
+    return counts
@@ -1,3 +1,1870 @@
-from django.test import TestCase
+import contextvars
+import hashlib
+import io
+import os
+import random
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.paginator import EmptyPage
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.test import (
+    AsyncRequestFactory,
+    Client,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    analytics,
+    api,
+    benchmarks,
+    charts,
+    columnar,
+    forecast_cache,
+    instrumentation,
+    ledger,
+    preprocessing,
+    rollups,
+    synthetic,
+    versioning,
+    views,
+)
+from .admin import ProductAdmin
+from .analytics import AnalysisParams, analyse_product, predict_days_left
+from .benchmarks import NOISE_FLOOR_MS, compare_to_baseline
+from .charts import CHART_KINDS
+from .columnar import bucket_means, load_daily_usage, load_stock_history, load_stock_matrix
+from .forecasting import forecast_products
+from .jobs import claim_jobs
+from .ingest import import_consumption
+from .ledger import STOCK_FLOOR_NOTE, create_movements
+from .models import (
+    AnalysisJob,
+    ConsumptionLog,
+    DailyConsumption,
+    DailyStockBalance,
+    ForecastSnapshot,
+    PrecomputedAnalysis,
+    Product,
+    StockMovement,
+    Supplier,
+)
+from .pagination import EstimatedCountPaginator, KeysetPaginator
+from .portfolio import (
+    StockRollup,
+    compute_portfolio_rollup,
+    compute_supplier_rollups,
+    get_portfolio_rollup,
+    get_supplier_rollups,
+)
+from .rollups import BULK_DELTA_THRESHOLD, rebuild_daily_consumption
+from .snapshots import build_snapshot, compute_forecast_snapshots
+from .status import (
+    annotate_stock_status,
+    attach_stock_status,
+    classify_stock_status,
+    status_window_start,
+    stock_status_ranks,
+)
+from .trend_models import TREND_MODEL_REGISTRY, TrendModel
+from .versioning import get_product_version
+from .workers import process_jobs, run_jobs
+
+
+class BatchForecastTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        start = date(2025, 1, 1)
+        for i in range(12):
+            product = Product.objects.create(
+                name=f"Product {i}",
+                sku=f"SKU-{i}",
+                current_stock=rng.randint(0, 300),
+                minimum_stock_level=rng.randint(5, 30),
+            )
+            offset = rng.randint(0, 20)
+            # Includes single-day and two-day histories as edge cases
+            days = [1, 2][i] if i < 2 else rng.randint(10, 90)
+            for day in range(days):
+                if day in (0, days - 1) or rng.random() < 0.6:
+                    ConsumptionLog.objects.create(
+                        product=product,
+                        date=start + timedelta(days=offset + day),
+                        quantity=rng.choice([rng.randint(1, 10), rng.randint(40, 80)]),
+                    )
+
+    def test_matches_per_product_analysis(self):
+        param_sets = [
+            AnalysisParams(),
+            AnalysisParams(consumption_model="p2", stock_model="p2"),
+            AnalysisParams(enable_smoothing=True, smoothing_window=5),
+            AnalysisParams(remove_outliers=True, outlier_threshold=1.5),
+            AnalysisParams("p2", "p2", True, 7, True, 2.0),
+            AnalysisParams(consumption_model="holt", stock_model="weekly"),
+            AnalysisParams(consumption_model="weekly", stock_model="ma7", enable_smoothing=True),
+            AnalysisParams(consumption_model="ma7", stock_model="holt", remove_outliers=True),
+        ]
+        products = {p.pk: p for p in Product.objects.all()}
+        for params in param_sets:
+            batch = forecast_products(params=params)
+            self.assertEqual(len(batch.product_ids), len(products))
+            for row, pk in enumerate(batch.product_ids.tolist()):
+                with self.subTest(params=params, product=pk):
+                    expected = analyse_product(products[pk], params)
+                    daily_df = expected["daily_df"]
+                    n = len(daily_df)
+                    np.testing.assert_allclose(batch.quantities[row, :n], daily_df["quantity"].values)
+                    np.testing.assert_allclose(batch.stock_levels[row, :n], daily_df["stock_level"].values)
+                    if expected["stock_rmse"] is None:
+                        self.assertTrue(np.isnan(batch.stock_rmse[row]))
+                    else:
+                        self.assertAlmostEqual(batch.stock_rmse[row], expected["stock_rmse"], places=5)
+                        self.assertAlmostEqual(
+                            batch.consumption_rmse[row], expected["consumption_rmse"], places=5
+                        )
+                    # np.roots can land a hair either side of an exact root, so
+                    # compare the raw forecast rather than int(days_left)
+                    self.assertAlmostEqual(
+                        batch.days_left[row],
+                        predict_days_left(daily_df, products[pk].current_stock, params.stock_model),
+                        places=5,
+                    )
+
+
+class TrendModelTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        days = np.arange(120)
+        consumption = 20 + 0.1 * days + 5 * np.sin(days * 2 * np.pi / 7) + rng.normal(0, 2, len(days))
+        self.series = {
+            "consumption": consumption,
+            "stock": 3500 - np.cumsum(consumption),
+        }
+
+    def test_incremental_update_matches_full_fit(self):
+        for code, model in TREND_MODEL_REGISTRY.items():
+            for name, y in self.series.items():
+                with self.subTest(model=code, series=name):
+                    full = model.fit(y)
+                    state = model.fit(y[:50])
+                    for chunk in np.array_split(y[50:], 4):
+                        state = model.update(state, chunk)
+                    self.assertEqual(state.n, len(y))
+                    np.testing.assert_allclose(model.trend(state), model.trend(full), rtol=1e-7, atol=1e-6)
+                    self.assertAlmostEqual(model.rmse(state), model.rmse(full), places=4)
+                    np.testing.assert_allclose(model.forecast(state, 30), model.forecast(full, 30), rtol=1e-7)
+                    if name == "stock":
+                        self.assertAlmostEqual(model.days_to_zero(state), model.days_to_zero(full), places=4)
+
+    def test_dropping_leading_days_matches_full_fit(self):
+        for code, model in TREND_MODEL_REGISTRY.items():
+            for name, y in self.series.items():
+                with self.subTest(model=code, series=name):
+                    state = model.drop(model.fit(y[:100]), y[:30])
+                    if model.degree is None:
+                        self.assertIsNone(state)
+                        continue
+                    state = model.update(state, y[100:])
+                    full = model.fit(y[30:])
+                    self.assertEqual(state.n, len(y) - 30)
+                    np.testing.assert_allclose(model.trend(state), model.trend(full), rtol=1e-7, atol=1e-6)
+                    self.assertAlmostEqual(model.rmse(state), model.rmse(full), places=4)
+
+    def test_models_implement_the_whole_interface(self):
+        with self.assertRaises(TypeError):
+            TrendModel()
+
+        class FitOnly(TrendModel):
+            def fit(self, y):
+                return y
+
+        with self.assertRaises(TypeError):
+            FitOnly()
+
+    def test_cached_states_are_extended_with_appended_days(self):
+        cache.clear()
+        product = Product.objects.create(name="Oats", sku="SKU-GRO-OATS-1", current_stock=900)
+        day = date(2025, 3, 1)
+        for d in range(20):
+            ConsumptionLog.objects.create(product=product, date=day + timedelta(days=d), quantity=d % 5 + 1)
+        model = TREND_MODEL_REGISTRY["p1"]
+
+        def fits(params, days):
+            # The stock goes down with the log, so earlier stock levels stay put
+            ConsumptionLog.objects.create(product=product, date=day + timedelta(days=days), quantity=3)
+            product.refresh_from_db()
+            with mock.patch.object(model, "fit", wraps=model.fit) as fit:
+                analyse_product(product, params)
+            return fit.call_count
+
+        smoothed = AnalysisParams(enable_smoothing=True)
+        self.assertEqual(fits(smoothed, 20), 2)
+        self.assertEqual(fits(smoothed, 21), 0)
+        # Replaced outliers can move with every new day: consumption is refitted
+        self.assertEqual(fits(AnalysisParams(remove_outliers=True), 22), 1)
+
+    def test_sliding_window_states_are_cache_hits(self):
+        cache.clear()
+        product = Product.objects.create(name="Rye", sku="SKU-GRO-RYE-1", current_stock=90000)
+        day = date(2024, 1, 1)
+        ConsumptionLog.objects.bulk_create(
+            ConsumptionLog(product=product, date=day + timedelta(days=d), quantity=d % 7 + 1) for d in range(400)
+        )
+        rebuild_daily_consumption()
+        model = TREND_MODEL_REGISTRY["p1"]
+
+        def fits(days):
+            import_consumption(["sku,date,quantity", f"{product.sku},{day + timedelta(days=days)},3"], "csv")
+            product.refresh_from_db()
+            with mock.patch.object(model, "fit", wraps=model.fit) as fit:
+                analysis = analyse_product(product, AnalysisParams())
+            return fit.call_count, analysis
+
+        self.assertEqual(fits(400)[0], 2)
+        # The 365-day window moved on a day: both series drop one and add one
+        fit_count, analysis = fits(401)
+        self.assertEqual(fit_count, 0)
+        full = model.fit(analysis["daily_df"]["quantity"].values)
+        np.testing.assert_allclose(analysis["consumption_trend"], model.trend(full), rtol=1e-7, atol=1e-6)
+
+    def test_stock_depletion_is_forecast(self):
+        y = self.series["stock"]
+        for code, model in TREND_MODEL_REGISTRY.items():
+            with self.subTest(model=code):
+                # ~420 units left, used at 30+ units a day and rising
+                self.assertTrue(8 < model.days_to_zero(model.fit(y)) < 25)
+
+
+class QueryPlanTests(TestCase):
+    """The hot ConsumptionLog/Product queries must be served by our indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name="Avocados", sku="SKU-GRO-AVOC-1")
+        ConsumptionLog.objects.bulk_create(
+            ConsumptionLog(product=cls.product, date=date(2025, 1, 1) + timedelta(days=i), quantity=1)
+            for i in range(50)
+        )
+
+    def setUp(self):
+        if connection.vendor == "postgresql":
+            # Tiny test tables would otherwise always get a sequential scan
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+            self.addCleanup(connection.cursor().execute, "RESET enable_seqscan")
+        elif connection.vendor != "sqlite":
+            self.skipTest("Query plans are only checked on SQLite and PostgreSQL")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn("TEMP B-TREE FOR ORDER BY", plan)
+
+    def test_recent_usage_by_product(self):
+        logs = ConsumptionLog.objects.filter(product=self.product, date__gte=date(2025, 2, 1))
+        self.assertUsesIndex(logs.values("product").annotate(total=Sum("quantity")), "log_product_date_idx")
+
+    def test_history_newest_first(self):
+        logs = self.product.consumption_logs.order_by("-date", "-id")[:10]
+        self.assertUsesIndex(logs, "log_product_date_idx")
+
+    def test_date_filter_across_products(self):
+        self.assertUsesIndex(ConsumptionLog.objects.filter(date__gte=date(2025, 2, 1)), "log_date_idx")
+
+    def test_product_prefix_search(self):
+        self.assertUsesIndex(Product.objects.filter(name__istartswith="avo"), "product_name_search_idx")
+        self.assertUsesIndex(Product.objects.filter(sku__istartswith="sku-gro"), "product_sku_search_idx")
+
+
+class StockStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = date(2025, 3, 31)
+        since = status_window_start(cls.today)
+        # Stocks and window usages either side of the 7-day and minimum-level edges
+        cls.cases = [
+            (stock, minimum, usage)
+            for stock in (0, 1, 7, 8, 10, 11, 233)
+            for minimum in (0, 10)
+            for usage in (0, 1, 29, 30, 31, 300)
+        ]
+        products = Product.objects.bulk_create(
+            Product(name=f"Case {i}", sku=f"SKU-CASE-{i}", current_stock=stock, minimum_stock_level=minimum)
+            for i, (stock, minimum, _) in enumerate(cls.cases)
+        )
+        rows = []
+        for product, (_, _, usage) in zip(products, cls.cases):
+            if not usage:
+                continue
+            # Split over the window's first and last days, plus a day just
+            # before the window that doesn't count
+            days = [(since, usage // 2), (cls.today, usage - usage // 2), (since - timedelta(days=1), 99)]
+            rows.extend(
+                DailyConsumption(product=product, date=day, total_quantity=quantity, entry_count=1)
+                for day, quantity in days
+            )
+        DailyConsumption.objects.bulk_create(rows)
+
+        # A small catalogue for the list view: critical, low and ok products
+        for name, stock, minimum, usage in [
+            ("Bolt A", 5, 0, 30),
+            ("Bolt B", 2, 0, 30),
+            ("Bolt C", 8, 10, 0),
+            ("Bolt D", 50, 10, 30),
+            ("Bolt E", 500, 10, 0),
+        ]:
+            product = Product.objects.create(
+                name=name, sku=f"SKU-BOLT-{name[-1]}", current_stock=stock, minimum_stock_level=minimum
+            )
+            if usage:
+                DailyConsumption.objects.create(
+                    product=product, date=timezone.now().date(), total_quantity=usage, entry_count=1
+                )
+
+    def test_python_and_database_rules_agree(self):
+        annotated = annotate_stock_status(Product.objects.filter(sku__startswith="SKU-CASE-"), self.today)
+        annotated = sorted(annotated, key=lambda p: int(p.sku.rsplit("-", 1)[1]))
+        self.assertEqual(len(annotated), len(self.cases))
+        for product, case in zip(annotated, self.cases):
+            with self.subTest(case=case):
+                self.assertEqual(product.window_usage, case[2])
+                self.assertEqual(classify_stock_status(*case), (product.days_left, product.status_alert))
+
+        ranks = stock_status_ranks(*(np.array(column) for column in zip(*self.cases)))
+        self.assertEqual(ranks.tolist(), [product.status_rank for product in annotated])
+
+    def test_list_filters_and_sorts_by_status(self):
+        def names(**params):
+            response = self.client.get(reverse("product_list"), {"q": "Bolt", **params})
+            return [product.name for product in response.context["products"]]
+
+        self.assertEqual(names(status="critical"), ["Bolt A", "Bolt B"])
+        self.assertEqual(names(status="low"), ["Bolt C"])
+        self.assertEqual(names(status="ok"), ["Bolt D", "Bolt E"])
+        self.assertEqual(names(status="unknown"), ["Bolt A", "Bolt B", "Bolt C", "Bolt D", "Bolt E"])
+        # Products without an estimate sort last either way
+        self.assertEqual(names(sort="days_left"), ["Bolt B", "Bolt A", "Bolt D", "Bolt C", "Bolt E"])
+        self.assertEqual(names(sort="-days_left"), ["Bolt D", "Bolt A", "Bolt B", "Bolt C", "Bolt E"])
+        self.assertEqual(names(sort="status"), ["Bolt B", "Bolt A", "Bolt C", "Bolt D", "Bolt E"])
+        self.assertEqual(names(status="critical", sort="-days_left"), ["Bolt A", "Bolt B"])
+
+
+class DataVersionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name="Rivets", sku="SKU-HWR-RIVT-1", current_stock=100)
+
+    def setUp(self):
+        cache.clear()
+
+    def log(self, quantity=1):
+        return ConsumptionLog.objects.create(product=self.product, date=timezone.now().date(), quantity=quantity)
+
+    def test_versions_bump_only_on_commit(self):
+        version = get_product_version(self.product.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.log()
+            self.assertEqual(get_product_version(self.product.pk), version)
+        self.assertTrue(callbacks)
+        for callback in callbacks:
+            callback()
+        bumped = get_product_version(self.product.pk)
+        self.assertNotEqual(bumped, version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.log()
+                raise RuntimeError
+        self.assertEqual(get_product_version(self.product.pk), bumped)
+
+    def test_cached_status_is_replaced_after_a_log_write(self):
+        self.assertEqual(attach_stock_status([self.product])[0].status_alert, "ok")
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.log(500)
+            # Still the committed data's status until the bump
+            self.assertEqual(attach_stock_status([self.product])[0].status_alert, "ok")
+        for callback in callbacks:
+            callback()
+        self.product.refresh_from_db()
+        product = attach_stock_status([self.product])[0]
+        # The log took the stock down to zero
+        self.assertEqual((self.product.current_stock, product.status_alert, product.days_left), (0, "critical", 0))
+
+
+class VersionBumpOrderTests(TransactionTestCase):
+    # Autocommit: on_commit callbacks run as soon as they are registered
+
+    def test_versions_bump_after_the_writes(self):
+        product = Product.objects.create(name="Rivets", sku="SKU-HWR-RIVT-1", current_stock=100)
+        day = date(2025, 5, 1)
+        seen = []
+
+        def record_state(*args, **kwargs):
+            product.refresh_from_db()
+            seen.append((DailyConsumption.objects.filter(product=product).count(), product.current_stock))
+
+        with mock.patch.object(versioning.cache, "set_many", side_effect=record_state):
+            rollups.apply_consumption_deltas({(product.pk, day): (5, 1)})
+            ledger.apply_movement_deltas({(product.pk, day): 20})
+        self.assertEqual(seen, [(1, 95), (1, 115)])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        product = Product.objects.create(name="Eggs", sku="SKU-GRO-EGGS-1")
+        # Several logs per day, so the id tie-breaker matters
+        ConsumptionLog.objects.bulk_create(
+            ConsumptionLog(product=product, date=date(2025, 1, 1) + timedelta(days=i // 3), quantity=i + 1)
+            for i in range(25)
+        )
+        cls.logs = product.consumption_logs.all()
+
+    def test_walks_forward_and_back_over_every_row(self):
+        expected = list(self.logs.order_by("-date", "-id"))
+        paginator = KeysetPaginator(self.logs, ("-date", "-id"), 10)
+
+        pages = [paginator.get_page()]
+        while pages[-1].has_next:
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([log for page in pages for log in page], expected)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+
+        previous = paginator.get_page(pages[-1].previous_cursor)
+        self.assertEqual(previous.object_list, pages[1].object_list)
+        self.assertFalse(paginator.get_page(previous.previous_cursor).has_previous)
+
+    def test_invalid_cursor_returns_first_page(self):
+        paginator = KeysetPaginator(self.logs, ("-date", "-id"), 10)
+        self.assertEqual(paginator.get_page("not-a-cursor").object_list, paginator.get_page().object_list)
+
+    def test_estimated_count_pages_past_the_cap(self):
+        logs = self.logs.order_by("id")
+        paginator = EstimatedCountPaginator(logs, 4)
+        paginator.count_cap = 10
+        self.assertEqual(paginator.num_pages, 3)
+
+        pages, number = [], 1
+        while True:
+            try:
+                pages.append(paginator.page(number))
+            except EmptyPage:
+                break
+            number += 1
+        self.assertEqual([log for page in pages for log in page], list(logs))
+        self.assertEqual(len(pages), 7)
+        with self.assertRaises(EmptyPage):
+            paginator.page(0)
+
+
+@override_settings(INVENTORY_INSTRUMENTATION=True)
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name="Flour", sku="SKU-GRO-FLOU-1", current_stock=50)
+        ConsumptionLog.objects.bulk_create(
+            ConsumptionLog(product=cls.product, date=date(2025, 1, 1) + timedelta(days=i), quantity=i % 4 + 1)
+            for i in range(10)
+        )
+        rebuild_daily_consumption()
+
+    def setUp(self):
+        instrumentation.stats.reset()
+        forecast_cache.local_cache.clear()
+        cache.clear()
+
+    def test_server_timing_reports_queries_and_spans(self):
+        response = self.client.get(reverse("product_detail", args=[self.product.pk]))
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'db;dur=[0-9.]+;desc="\d+ queries"')
+        for name in ("analytics.fetch", "analytics.resample", "analytics.fit"):
+            self.assertIn(f"{name};dur=", timing)
+
+        summary = instrumentation.stats.summary()["product_detail"]
+        self.assertEqual(summary["requests"], 1)
+        self.assertIn("analytics.prepare", summary["spans"])
+
+    async def test_async_requests_stay_async(self):
+        def get_response(request):
+            return HttpResponse()
+
+        async def aget_response(request):
+            return HttpResponse()
+
+        self.assertFalse(iscoroutinefunction(instrumentation.InstrumentationMiddleware(get_response)))
+        self.assertTrue(iscoroutinefunction(instrumentation.InstrumentationMiddleware(aget_response)))
+
+        response = await self.async_client.get(reverse("product_detail", args=[self.product.pk]))
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'db;dur=[0-9.]+;desc="[1-9]\d* queries"')
+        self.assertIn("analytics.fit;dur=", timing)
+
+    def test_counters_are_shared_safely_between_threads(self):
+        metrics = instrumentation.RequestMetrics()
+        token = instrumentation._current.set(metrics)
+        try:
+            def work(_):
+                for _ in range(2000):
+                    with instrumentation.span("stage"):
+                        instrumentation.record_cache("stage", 1, 0)
+
+            with ThreadPoolExecutor(8) as pool:
+                contexts = [contextvars.copy_context() for _ in range(8)]
+                list(pool.map(lambda context: context.run(work, None), contexts))
+        finally:
+            instrumentation._current.reset(token)
+        self.assertEqual(metrics.as_dict()["cache"], {"stage": {"hits": 16000, "misses": 0}})
+        self.assertGreater(metrics.spans["stage"], 0)
+
+    def test_disabled_by_default(self):
+        with self.settings(INVENTORY_INSTRUMENTATION=False):
+            response = Client().get(reverse("product_list"))
+        self.assertNotIn("Server-Timing", response)
+
+
+@override_settings(INVENTORY_BACKGROUND_ANALYSIS=True)
+class AnalysisJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name="Sponges", sku="SKU-SUP-SPON-1", current_stock=120)
+        for i in range(20):
+            ConsumptionLog.objects.create(
+                product=cls.product, date=date(2025, 1, 1) + timedelta(days=i), quantity=i % 5 + 1
+            )
+
+    def setUp(self):
+        forecast_cache.local_cache.clear()
+        cache.clear()
+
+    def test_writes_coalesce_into_one_job(self):
+        job = AnalysisJob.objects.get(product=self.product)
+        self.assertEqual(job.status, AnalysisJob.PENDING)
+        ConsumptionLog.objects.create(product=self.product, date=date(2025, 1, 21), quantity=3)
+        self.assertEqual(AnalysisJob.objects.get(product=self.product).requested_at, job.requested_at)
+
+    def test_worker_results_are_served_until_the_next_write(self):
+        self.assertEqual(process_jobs(workers=0, once=True), 1)
+        self.assertEqual(AnalysisJob.objects.get(product=self.product).status, AnalysisJob.DONE)
+        self.assertFalse(ForecastSnapshot.objects.get(product=self.product).is_stale)
+
+        self.product.refresh_from_db()
+        expected = analyse_product(self.product, AnalysisParams())
+        url = reverse("product_detail", args=[self.product.pk])
+        with self.settings(INVENTORY_INSTRUMENTATION=True):
+            response = self.client.get(url)
+        self.assertIn('cache.precomputed;desc="1 hits, 0 misses"', response["Server-Timing"])
+        self.assertNotIn("analytics.fit", response["Server-Timing"])
+        self.assertEqual(response.context["days_remaining"], expected["days_remaining"])
+        self.assertEqual(response.context["stock_rmse"], round(expected["stock_rmse"], 2))
+
+        chart = self.client.get(reverse("product_chart", args=[self.product.pk, "stock", "png"]))
+        self.assertEqual(
+            chart.content, bytes(PrecomputedAnalysis.objects.get(product=self.product).stock_chart)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ConsumptionLog.objects.create(product=self.product, date=date(2025, 1, 21), quantity=3)
+        self.assertTrue(PrecomputedAnalysis.objects.get(product=self.product).is_stale)
+        self.assertEqual(AnalysisJob.objects.get(product=self.product).status, AnalysisJob.PENDING)
+        with self.settings(INVENTORY_INSTRUMENTATION=True):
+            response = self.client.get(url)
+        self.assertIn("analytics.fit", response["Server-Timing"])
+
+    def test_disabling_stops_queueing_but_not_invalidation(self):
+        process_jobs(workers=0, once=True)
+        with self.settings(INVENTORY_BACKGROUND_ANALYSIS=False):
+            with self.captureOnCommitCallbacks(execute=True):
+                ConsumptionLog.objects.create(product=self.product, date=date(2025, 1, 21), quantity=3)
+            response = self.client.get(reverse("product_detail", args=[self.product.pk]))
+        self.assertTrue(PrecomputedAnalysis.objects.get(product=self.product).is_stale)
+        self.assertEqual(AnalysisJob.objects.get(product=self.product).status, AnalysisJob.DONE)
+        self.product.refresh_from_db()
+        expected = analyse_product(self.product, AnalysisParams())
+        self.assertEqual(response.context["stock_rmse"], round(expected["stock_rmse"], 2))
+
+    def test_write_while_running_keeps_results_stale(self):
+        jobs = claim_jobs(10)
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(claim_jobs(10), [])
+        ConsumptionLog.objects.create(product=self.product, date=date(2025, 1, 21), quantity=3)
+        run_jobs(jobs)
+        self.assertTrue(PrecomputedAnalysis.objects.get(product=self.product).is_stale)
+        self.assertEqual(AnalysisJob.objects.get(product=self.product).status, AnalysisJob.PENDING)
+
+
+class ChartRenderingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = []
+        for i, days in enumerate([40, 1, 15]):
+            product = Product.objects.create(name=f"Syrup {i}", sku=f"SKU-BEV-SYRU-{i}", current_stock=200)
+            ConsumptionLog.objects.bulk_create(
+                ConsumptionLog(
+                    product=product, date=date(2025, 3, 1) + timedelta(days=d), quantity=(d * 7 + i) % 9 + 1
+                )
+                for d in range(days)
+            )
+            cls.products.append(product)
+        rebuild_daily_consumption()
+
+    def test_pooled_and_concurrent_renders_match_fresh_figures(self):
+        params = AnalysisParams()
+        jobs = [
+            (product, kind, analyse_product(product, params))
+            for product in self.products
+            for kind in CHART_KINDS
+        ]
+        fresh = []
+        for product, kind, analysis in jobs:
+            charts.figure_pool.clear()
+            fresh.append(hashlib.md5(charts.render_chart(product, analysis, kind, params)).hexdigest())
+
+        # Reused figures, in an order that changes the data on every render
+        reused = [
+            hashlib.md5(charts.render_chart(product, analysis, kind, params)).hexdigest()
+            for product, kind, analysis in jobs
+        ]
+        self.assertEqual(reused, fresh)
+        with ThreadPoolExecutor(4) as pool:
+            concurrent = list(
+                pool.map(
+                    lambda job: hashlib.md5(charts.render_chart(job[0], job[2], job[1], params)).hexdigest(),
+                    jobs * 3,
+                )
+            )
+        self.assertEqual(concurrent, fresh * 3)
+
+    def test_json_series(self):
+        product = self.products[0]
+        response = self.client.get(reverse("product_chart", args=[product.pk, "consumption", "json"]))
+        self.assertEqual(response["Content-Type"], "application/json")
+        series = response.json()
+        self.assertEqual(len(series["dates"]), 40)
+        self.assertEqual(series["dates"][0], "2025-03-01")
+        self.assertEqual(series["values"][:3], [1.0, 8.0, 6.0])
+        self.assertEqual(len(series["trend"]), 40)
+        self.assertEqual(series["min_level"], product.minimum_stock_level)
+
+    def test_conditional_requests_and_cache_headers(self):
+        cache.clear()
+        product = self.products[2]
+        url = reverse("product_chart", args=[product.pk, "stock", "png"])
+        first = self.client.get(url)
+        etag = first["ETag"]
+        self.assertIn("no-cache", first["Cache-Control"])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        versioned = self.client.get(url, {"v": get_product_version(product.pk)})
+        self.assertIn("public", versioned["Cache-Control"])
+        self.assertIn(f"max-age={views.CHART_MAX_AGE}", versioned["Cache-Control"])
+        self.assertEqual(versioned["ETag"], etag)
+        # Settings are part of the representation
+        smoothed = self.client.get(url, {"enable_smoothing": "on"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(smoothed.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ConsumptionLog.objects.create(product=product, date=date(2025, 3, 20), quantity=4)
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+
+    def test_invalid_settings_fall_back_to_defaults(self):
+        product = self.products[0]
+        for query in (
+            {"smoothing_window": "abc"},
+            {"enable_smoothing": "on", "smoothing_window": "0"},
+            {"remove_outliers": "on", "outlier_threshold": "nan"},
+        ):
+            with self.subTest(query=query):
+                response = self.client.get(reverse("product_detail", args=[product.pk]), query)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context["smoothing_window"], 3)
+                self.assertEqual(response.context["outlier_threshold"], 2.0)
+                chart = self.client.get(reverse("product_chart", args=[product.pk, "consumption", "json"]), query)
+                self.assertEqual(chart.status_code, 200)
+
+
+class AsyncViewTests(TransactionTestCase):
+    # Stages run on other threads (and connections), so the data must be committed
+
+    def setUp(self):
+        supplier = Supplier.objects.create(name="Acme", contact_email="acme@example.com", lead_time_days=3)
+        self.products = []
+        for i in range(15):
+            product = Product.objects.create(
+                name=f"Lid {i:02}", sku=f"SKU-SUP-LIDS-{i}", current_stock=40 + i
+            )
+            product.suppliers.add(supplier)
+            self.products.append(product)
+        ConsumptionLog.objects.bulk_create(
+            ConsumptionLog(product=product, date=date(2025, 5, 1) + timedelta(days=d), quantity=d % 4 + 1)
+            for product in self.products[:3]
+            for d in range(25)
+        )
+        rebuild_daily_consumption()
+
+    def assertSameResponse(self, sync_view, async_view, path, **kwargs):
+        expected = sync_view.as_view()(RequestFactory().get(path), **kwargs)
+        actual = async_to_sync(async_view.as_view())(AsyncRequestFactory().get(path), **kwargs)
+        for response in (expected, actual):
+            if hasattr(response, "render"):
+                response.render()
+        self.assertEqual(actual.status_code, expected.status_code)
+        self.assertEqual(actual.content, expected.content)
+        return actual
+
+    def test_list_matches_sync_view(self):
+        self.assertTrue(views.AsyncProductListView.view_is_async)
+        response = self.assertSameResponse(views.ProductListView, views.AsyncProductListView, "/?sort=name")
+        self.assertContains(response, "Lid 09")
+        self.assertSameResponse(views.ProductListView, views.AsyncProductListView, "/?sort=status")
+
+    def test_detail_matches_sync_view(self):
+        self.assertTrue(views.AsyncProductDetailView.view_is_async)
+        for product in self.products[:2] + self.products[-1:]:
+            path = f"/product/{product.pk}/"
+            response = self.assertSameResponse(
+                views.ProductDetailView, views.AsyncProductDetailView, path, pk=product.pk
+            )
+            self.assertContains(response, "Acme")
+
+    @override_settings(INVENTORY_INSTRUMENTATION=True)
+    def test_stage_queries_are_instrumented(self):
+        def queries(view):
+            # Same cold caches for both views
+            forecast_cache.local_cache.clear()
+            cache.clear()
+            get_response = view.as_view()
+            if view.view_is_async:
+                get_response = async_to_sync(get_response)
+            response = instrumentation.InstrumentationMiddleware(get_response)(AsyncRequestFactory().get("/"))
+            return int(re.search(r'db;dur=[0-9.]+;desc="(\d+) queries"', response["Server-Timing"]).group(1))
+
+        expected = queries(views.ProductListView)
+        self.assertGreater(expected, 0)
+        self.assertEqual(queries(views.AsyncProductListView), expected)
+
+    def test_chart_matches_sync_view(self):
+        pk = self.products[0].pk
+        self.assertSameResponse(
+            views.ProductChartView, views.AsyncProductChartView, "/", pk=pk, kind="stock", fmt="json"
+        )
+
+
+class ForecastCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name="Trash Bags", sku="SKU-SUP-TRAS-1", current_stock=300)
+        ConsumptionLog.objects.bulk_create(
+            ConsumptionLog(
+                product=cls.product, date=date(2025, 2, 1) + timedelta(days=d), quantity=d % 6 + 2
+            )
+            for d in range(30)
+        )
+        rebuild_daily_consumption()
+
+    def setUp(self):
+        forecast_cache.local_cache.clear()
+        cache.clear()
+
+    def assertSameAnalysis(self, actual, expected):
+        for key in ("dates", "quantity", "stock_level", "consumption_trend", "stock_trend"):
+            np.testing.assert_array_equal(actual[key], expected[key])
+        for key in ("consumption_rmse", "stock_rmse", "days_left", "prediction_date", "days_remaining"):
+            self.assertEqual(actual[key], expected[key])
+
+    def test_tiers_return_the_computed_result(self):
+        params = AnalysisParams(consumption_model="holt", enable_smoothing=True)
+        expected = analyse_product(self.product, params)
+        with mock.patch.object(forecast_cache, "analyse_product", wraps=analyse_product) as analyse:
+            computed = forecast_cache.get_analysis(self.product, params)
+            local = forecast_cache.get_analysis(self.product, params)
+            forecast_cache.local_cache.clear()
+            shared = forecast_cache.get_analysis(self.product, params)
+            other = forecast_cache.get_analysis(self.product, params._replace(smoothing_window=5))
+        self.assertEqual(analyse.call_count, 2)
+        for analysis in (computed, local, shared):
+            self.assertNotIn("daily_df", analysis)
+            self.assertSameAnalysis(analysis, expected)
+        self.assertFalse(np.array_equal(other["quantity"], expected["quantity"]))
+
+    def test_writes_change_the_key(self):
+        params = AnalysisParams()
+        before = forecast_cache.get_analysis(self.product, params)
+        with self.captureOnCommitCallbacks(execute=True):
+            ConsumptionLog.objects.create(product=self.product, date=date(2025, 3, 3), quantity=50)
+        after = forecast_cache.get_analysis(self.product, params)
+        self.assertEqual(len(after["quantity"]), len(before["quantity"]) + 1)
+
+        self.product.current_stock = 10
+        self.assertSameAnalysis(
+            forecast_cache.get_analysis(self.product, params), analyse_product(self.product, params)
+        )
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.supplier = Supplier.objects.create(name="Acme", contact_email="orders@acme.test", lead_time_days=5)
+        other = Supplier.objects.create(name="Globex", contact_email="orders@globex.test", lead_time_days=9)
+        cls.gloves = Product.objects.create(name="Gloves", sku="SKU-SUP-GLOV-1", current_stock=80)
+        cls.gloves.suppliers.add(cls.supplier, other)
+        cls.masks = Product.objects.create(name="Masks", sku="SKU-SUP-MASK-1", current_stock=60)
+        cls.masks.suppliers.add(other)
+        ConsumptionLog.objects.bulk_create(
+            ConsumptionLog(product=product, date=date(2025, 4, 1) + timedelta(days=d), quantity=d + 1)
+            for product in (cls.gloves, cls.masks)
+            for d in range(10)
+        )
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "pw")
+
+    def export_rows(self, name, **params):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode().splitlines()
+
+    def test_consumption_csv_is_filtered(self):
+        rows = self.export_rows(
+            "consumption_export", supplier=self.supplier.pk, start="2025-04-03", end="2025-04-06"
+        )
+        self.assertEqual(rows[0], "id,sku,date,quantity,notes")
+        self.assertEqual(
+            [row.split(",")[1:4] for row in rows[1:]],
+            [["SKU-SUP-GLOV-1", f"2025-04-0{d}", str(d)] for d in range(3, 7)],
+        )
+
+    def test_command_output_matches_view(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "consumption.csv")
+            call_command("export_data", "consumption", path, chunk_size=3, stdout=io.StringIO())
+            with open(path, newline="") as f:
+                rows = f.read().splitlines()
+        self.assertEqual(len(rows), 21)
+        self.assertEqual(rows, self.export_rows("consumption_export"))
+
+    def test_streams_asynchronously_under_asgi(self):
+        request = AsyncRequestFactory().get(reverse("consumption_export"))
+        request.user = self.user
+        response = views.ExportView.as_view()(request)
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return [chunk async for chunk in response.streaming_content]
+
+        chunks = async_to_sync(read)()
+        self.assertEqual(b"".join(chunks).decode().splitlines(), self.export_rows("consumption_export"))
+
+    def test_forecasts_csv_and_errors(self):
+        compute_forecast_snapshots([self.gloves.pk, self.masks.pk])
+        rows = self.export_rows("forecast_export", sku=self.masks.sku)
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(rows[1].startswith("SKU-SUP-MASK-1,Masks,"))
+        self.assertEqual(self.export_rows("forecast_export", sku="missing"), [rows[0]])
+
+        for params in ({"start": "April"}, {"format": "xlsx"}):
+            self.assertEqual(self.client.get(reverse("consumption_export"), params).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse("consumption_export")).status_code, 403)
+
+
+class ForecastSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.now().date()
+        cls.fast = Supplier.objects.create(name="Fast", contact_email="fast@example.com", lead_time_days=3)
+        cls.slow = Supplier.objects.create(name="Slow", contact_email="slow@example.com", lead_time_days=9)
+        cls.product = Product.objects.create(
+            name="Foil", sku="SKU-SUP-FOIL-1", current_stock=200, minimum_stock_level=10
+        )
+        cls.product.suppliers.add(cls.fast, cls.slow)
+        cls.idle = Product.objects.create(name="Twine", sku="SKU-SUP-TWIN-1", current_stock=5)
+        ConsumptionLog.objects.bulk_create(
+            ConsumptionLog(product=cls.product, date=cls.today - timedelta(days=d), quantity=4)
+            for d in range(30)
+        )
+        rebuild_daily_consumption()
+
+    def snapshot(self, product=None):
+        return ForecastSnapshot.objects.get(product=product or self.product)
+
+    def test_order_quantity_and_order_by_date(self):
+        now = timezone.now()
+        product = Product(current_stock=20, minimum_stock_level=10)
+        snapshot = build_snapshot(product, 5, 4.0, 10.0, self.today, now)
+        self.assertEqual(snapshot.depletion_date, self.today + timedelta(days=10))
+        self.assertEqual(snapshot.order_by_date, self.today + timedelta(days=5))
+        # 4/day over 5 + 14 days, plus the minimum, less what is in stock
+        self.assertEqual(snapshot.recommended_order_quantity, 76 + 10 - 20)
+
+        # Ordering late still means ordering today
+        snapshot = build_snapshot(product, 5, 4.0, 2.5, self.today, now)
+        self.assertEqual(snapshot.order_by_date, self.today)
+
+        product.current_stock = 0
+        snapshot = build_snapshot(product, None, 4.0, None, self.today, now)
+        self.assertEqual((snapshot.days_left, snapshot.depletion_date), (0.0, self.today))
+        self.assertEqual(snapshot.recommended_order_quantity, 56 + 10)
+
+        product.current_stock = 50
+        snapshot = build_snapshot(product, 5, 0.0, None, self.today, now)
+        self.assertEqual((snapshot.depletion_date, snapshot.order_by_date), (None, None))
+        self.assertEqual(snapshot.recommended_order_quantity, 0)
+
+    def test_compute_and_incremental_command(self):
+        self.assertEqual(compute_forecast_snapshots([self.product.pk, self.idle.pk]), 2)
+        snapshot = self.snapshot()
+        self.assertEqual((snapshot.avg_daily_usage, snapshot.lead_time_days), (4.0, 3))
+        self.assertFalse(snapshot.is_stale)
+        # 4/day over 3 + 14 days plus the minimum is well below the stock
+        self.assertEqual(snapshot.recommended_order_quantity, 0)
+        self.assertIsNotNone(snapshot.depletion_date)
+        idle = self.snapshot(self.idle)
+        self.assertEqual((idle.avg_daily_usage, idle.depletion_date, idle.lead_time_days), (0.0, None, None))
+
+        out = io.StringIO()
+        call_command("compute_forecasts", "--incremental", stdout=out)
+        self.assertIn("for 0 products", out.getvalue())
+
+        self.fast.lead_time_days = 12
+        self.fast.save()
+        self.assertTrue(self.snapshot().is_stale)
+        self.assertFalse(self.snapshot(self.idle).is_stale)
+        out = io.StringIO()
+        call_command("compute_forecasts", "--incremental", stdout=out)
+        self.assertIn("for 1 products", out.getvalue())
+        snapshot = self.snapshot()
+        self.assertEqual(snapshot.lead_time_days, 9)
+        self.assertFalse(snapshot.is_stale)
+
+    def test_signals_mark_snapshots_stale(self):
+        def stale_after(change, product=None):
+            compute_forecast_snapshots([self.product.pk, self.idle.pk])
+            change()
+            return self.snapshot(product).is_stale
+
+        self.assertTrue(stale_after(lambda: self.product.suppliers.remove(self.slow)))
+        self.assertTrue(stale_after(lambda: self.fast.products.add(self.idle), self.idle))
+        self.assertTrue(stale_after(lambda: self.fast.products.clear()))
+        self.assertTrue(stale_after(lambda: self.idle.save(), self.idle))
+        self.assertTrue(
+            stale_after(lambda: ConsumptionLog.objects.create(product=self.product, date=self.today, quantity=1))
+        )
+        # No longer a supplier of the product
+        self.assertFalse(stale_after(lambda: self.slow.save()))
+
+    def test_dashboard_lists_soonest_depletion_first(self):
+        now = timezone.now()
+        rows = [("Cord", 6), ("Bags", 2), ("Wrap", 2), ("Pins", 8), ("Ties", None)]
+        for name, days in rows:
+            product = Product.objects.create(name=name, sku=f"SKU-DSH-{name.upper()}")
+            ForecastSnapshot.objects.create(
+                product=product,
+                computed_at=now,
+                depletion_date=None if days is None else self.today + timedelta(days=days),
+            )
+        response = self.client.get(reverse("reorder_dashboard"))
+        self.assertEqual(
+            [snapshot.product.name for snapshot in response.context["snapshots"]], ["Bags", "Wrap", "Cord"]
+        )
+
+
+class DailyConsumptionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = Product.objects.bulk_create(
+            Product(name=f"Wire {i}", sku=f"SKU-HWR-WIRE-{i}", current_stock=500) for i in range(2)
+        )
+
+    def rollup(self):
+        return list(
+            DailyConsumption.objects.order_by("product_id", "date").values_list(
+                "product_id", "date", "total_quantity", "entry_count"
+            )
+        )
+
+    def test_log_writes_match_a_rebuild(self):
+        first, second = self.products
+        day = date(2025, 2, 1)
+        logs = [
+            ConsumptionLog.objects.create(product=product, date=day + timedelta(days=d % 3), quantity=d + 1)
+            for d in range(6)
+            for product in (first, second)
+        ]
+        # Move to another day, to another product, both at once, and change the quantity
+        logs[0].date = day + timedelta(days=5)
+        logs[0].save()
+        logs[1].product = first
+        logs[1].save()
+        logs[2].product, logs[2].date, logs[2].quantity = second, day + timedelta(days=9), 40
+        logs[2].save()
+        logs[3].quantity = 7
+        logs[3].save()
+        # Deleting the only log of a day drops its row
+        logs[0].delete()
+        logs[4].delete()
+
+        incremental = self.rollup()
+        self.assertNotIn((first.pk, day + timedelta(days=5)), [row[:2] for row in incremental])
+        rebuild_daily_consumption()
+        self.assertEqual(incremental, self.rollup())
+        self.assertEqual(
+            sum(row[2] for row in incremental),
+            ConsumptionLog.objects.aggregate(total=Sum("quantity"))["total"],
+        )
+
+
+    def test_daily_usage_from_logs_and_rollup_match_the_orm(self):
+        first, second = self.products
+        day = date(2025, 2, 1)
+        ConsumptionLog.objects.bulk_create(
+            ConsumptionLog(product=product, date=day + timedelta(days=d // 3 * 2), quantity=d + 1)
+            for d in range(30)
+            for product in (first, second)
+        )
+        rebuild_daily_consumption()
+
+        # Bounds on and between logged days (every other day)
+        for start, end in [(None, None), (5, None), (None, 8), (4, 13)]:
+            start = start and day + timedelta(days=start)
+            end = end and day + timedelta(days=end)
+            logs = first.consumption_logs.all()
+            if start:
+                logs = logs.filter(date__gte=start)
+            if end:
+                logs = logs.filter(date__lte=end)
+            expected = list(
+                logs.values("date").annotate(total=Sum("quantity")).order_by("date").values_list("date", "total")
+            )
+            for from_logs in (True, False):
+                with self.subTest(start=start, end=end, from_logs=from_logs):
+                    usage = load_daily_usage(first.pk, start, end, from_logs=from_logs)
+                    self.assertEqual(usage.dates.tolist(), [row[0] for row in expected])
+                    self.assertEqual(usage.quantities.tolist(), [row[1] for row in expected])
+
+
+class SeedDataTests(TestCase):
+    def rows(self, queryset, *fields):
+        return list(queryset.order_by(*fields[:2]).values_list(*fields))
+
+    def written(self):
+        return [
+            self.rows(Product.objects, "name", "sku", "current_stock", "minimum_stock_level"),
+            self.rows(Product.suppliers.through.objects, "product__name", "supplier__name"),
+            self.rows(ConsumptionLog.objects, "product__name", "date", "quantity"),
+            self.rows(DailyConsumption.objects, "product__name", "date", "total_quantity", "entry_count"),
+            self.rows(DailyStockBalance.objects, "product__name", "date", "net_change", "running_total"),
+        ]
+
+    def seeded(self, workers):
+        out = io.StringIO()
+        # Small chunks, so several are drawn ahead by the workers
+        with mock.patch.object(synthetic, "CHUNK_CELLS", 200):
+            call_command("seed_data", products=30, days=40, seed=11, workers=workers, stdout=out)
+        self.assertIn("seed 11", out.getvalue())
+        return self.written()
+
+    def test_same_seed_same_rows_whatever_the_workers(self):
+        single = self.seeded(workers=1)
+        self.assertEqual(len(single[0]), 30)
+        self.assertTrue(single[2])
+        self.assertEqual(self.seeded(workers=3), single)
+
+        # The rollup and ledger written from the arrays match a rebuild
+        rebuild_daily_consumption()
+        self.assertEqual(self.written(), single)
+
+    def test_tiny_and_empty_inputs(self):
+        for seed in range(1, 6):
+            # Some of these seeds draw no logs at all
+            call_command("seed_data", products=1, days=1, seed=seed, stdout=io.StringIO())
+            self.assertEqual(Product.objects.count(), 1)
+            self.assertEqual(DailyConsumption.objects.count(), ConsumptionLog.objects.count())
+        for option in ("--products", "--days"):
+            with self.assertRaises(CommandError):
+                call_command("seed_data", option, "0", stdout=io.StringIO())
+
+
+class BenchmarkBaselineTests(TestCase):
+    def result(self, p50=100.0, p95=200.0, queries=3, memory=1000.0):
+        return {"p50_ms": p50, "p95_ms": p95, "p99_ms": p95, "queries": queries, "peak_memory_kb": memory}
+
+    def test_regressions_beyond_the_tolerance(self):
+        baseline = {"scenarios": {"list": self.result(), "detail": self.result(p50=1.0, p95=2.0)}}
+        self.assertEqual(compare_to_baseline({"list": self.result()}, baseline), [])
+        # Within 25%, and small timings within the noise floor
+        within = {
+            "list": self.result(p50=124.0, p95=249.0, memory=1250.0),
+            "detail": self.result(p50=1.0 + NOISE_FLOOR_MS, p95=2.0),
+        }
+        self.assertEqual(compare_to_baseline(within, baseline, tolerance=0.25), [])
+        self.assertEqual(
+            compare_to_baseline(within, baseline, tolerance=0.1),
+            [
+                "list: p50_ms 100.0 -> 124.0",
+                "list: p95_ms 200.0 -> 249.0",
+                "list: peak_memory_kb 1000.0 -> 1250.0",
+            ],
+        )
+        # Any extra query counts
+        self.assertEqual(compare_to_baseline({"list": self.result(queries=4)}, baseline), ["list: queries 3 -> 4"])
+
+    def test_scenarios_missing_on_either_side_are_skipped(self):
+        baseline = {"scenarios": {"list": self.result(), "chart": self.result()}}
+        results = {"list": self.result(), "export": self.result(p50=1e6, queries=99)}
+        self.assertEqual(compare_to_baseline(results, baseline), [])
+        self.assertEqual(compare_to_baseline(results, {}), [])
+
+    def test_cold_scenarios_start_from_empty_caches(self):
+        product = Product.objects.create(name="Bolts", sku="SKU-HWR-BOLT-1", current_stock=100)
+        ConsumptionLog.objects.bulk_create(
+            ConsumptionLog(product=product, date=date(2025, 5, 1) + timedelta(days=d), quantity=2) for d in range(20)
+        )
+        rebuild_daily_consumption()
+        forecast_cache.local_cache.clear()
+        with mock.patch.object(
+            benchmarks, "load_consumption_matrix", wraps=benchmarks.load_consumption_matrix
+        ) as load_matrix:
+            scenarios = {scenario.name: scenario for scenario in benchmarks.build_scenarios(Client())}
+            load_matrix.assert_not_called()
+
+            scenarios["detail_busiest_p1_p1"].run()
+            self.assertEqual(len(forecast_cache.local_cache), 1)
+            scenarios["detail_busiest_p1_p1_cold"].reset()
+            self.assertEqual(len(forecast_cache.local_cache), 0)
+
+            for name in ("preprocess_batch_zscore_sma", "preprocess_rows_mad_ema"):
+                benchmarks.measure(scenarios[name], iterations=2)
+            load_matrix.assert_called_once()
+
+
+class ConsumptionImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        cls.products = Product.objects.bulk_create(
+            Product(name=f"Tape {i}", sku=f"SKU-OFF-TAPE-{i}", current_stock=1000) for i in range(2)
+        )
+
+    def rollup(self):
+        return list(
+            DailyConsumption.objects.order_by("product_id", "date").values_list(
+                "product_id", "date", "total_quantity", "entry_count"
+            )
+        )
+
+    def test_rejected_rows_are_reported_with_their_reasons(self):
+        report = import_consumption(
+            [
+                "sku,date,quantity",
+                "SKU-OFF-TAPE-0,2025-03-01,4",
+                "SKU-NOPE,2025-03-01,4",
+                "SKU-OFF-TAPE-0,March,4",
+                "SKU-OFF-TAPE-0,2025-03-02,lots",
+                "SKU-OFF-TAPE-0,2025-03-02,0",
+            ],
+            "csv",
+        )
+        self.assertEqual((report.rows, report.imported, report.rejected), (5, 1, 4))
+        self.assertEqual(
+            report.errors,
+            [
+                {"line": 3, "error": "Unknown SKU: 'SKU-NOPE'"},
+                {"line": 4, "error": "Invalid date: 'March'"},
+                {"line": 5, "error": "Invalid quantity: 'lots'"},
+                {"line": 6, "error": "Quantity must be positive: 0"},
+            ],
+        )
+
+        lines = ['{"sku": "SKU-OFF-TAPE-1", "date": "2025-03-01", "quantity": 2}', "", "{", "[1]"]
+        report = import_consumption(lines, "jsonl")
+        self.assertEqual((report.rows, report.imported), (3, 1))
+        self.assertEqual([error["line"] for error in report.errors], [3, 4])
+        self.assertTrue(report.errors[0]["error"].startswith("Invalid JSON"))
+        self.assertEqual(report.errors[1]["error"], "Expected an object")
+
+    def test_bulk_rollup_and_stock_match_a_rebuild(self):
+        # One existing day per product, so the bulk path updates as well as inserts
+        ConsumptionLog.objects.bulk_create(
+            ConsumptionLog(product=product, date=date(2025, 4, 1), quantity=3) for product in self.products
+        )
+        rebuild_daily_consumption()
+        lines = ["sku,date,quantity"] + [
+            f"{product.sku},{date(2025, 4, 1) + timedelta(days=d // 2)},{d + 1}"
+            for product in self.products
+            for d in range(2 * BULK_DELTA_THRESHOLD)
+        ]
+        with mock.patch.object(rollups, "_apply_deltas_in_bulk", wraps=rollups._apply_deltas_in_bulk) as bulk:
+            report = import_consumption(lines, "csv")
+        bulk.assert_called_once()
+        self.assertEqual(report.imported, 4 * BULK_DELTA_THRESHOLD)
+
+        incremental = self.rollup()
+        self.assertEqual(len(incremental), 2 * BULK_DELTA_THRESHOLD)
+        rebuild_daily_consumption()
+        self.assertEqual(incremental, self.rollup())
+
+        imported = sum(range(1, 2 * BULK_DELTA_THRESHOLD + 1))
+        for product in self.products:
+            product.refresh_from_db()
+            self.assertEqual(product.current_stock, 1000 - imported)
+
+    def test_import_view_rejects_undecodable_bodies(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        url = reverse("consumption_import") + "?batch_size=1"
+        body = b"sku,date,quantity\nSKU-OFF-TAPE-0,2025-03-01,4\nSKU-OFF-TAPE-0,2025-03-02,\xff\n"
+        self.assertEqual(client.post(url, body, content_type="text/csv").status_code, 403)
+
+        client.get(reverse("admin:index"))
+        token = client.cookies["csrftoken"].value
+        response = client.post(url, body, content_type="text/csv", headers={"X-CSRFToken": token})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()["error"].startswith("Body is not valid UTF-8"))
+        self.assertEqual(response.json()["imported"], 1)
+        self.assertEqual(ConsumptionLog.objects.get().quantity, 4)
+
+
+class AdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        cls.products = Product.objects.bulk_create(
+            Product(name=f"Part {i}", sku=f"SKU-PRT-{i}", current_stock=20) for i in range(6)
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_changelist_pages_past_the_estimated_count(self):
+        url = reverse("admin:inventory_product_changelist")
+        with mock.patch.object(EstimatedCountPaginator, "count_cap", 3), mock.patch.object(
+            ProductAdmin, "list_per_page", 2
+        ):
+            response, _ = self.changelist_queries(f"{url}?p=3")
+            self.assertEqual(len(response.context["cl"].result_list), 2)
+            response = self.client.get(f"{url}?p=4")
+        self.assertRedirects(response, f"{url}?e=1", fetch_redirect_response=False)
+
+    def test_log_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse("admin:inventory_consumptionlog_changelist")
+        ConsumptionLog.objects.create(product=self.products[0], date=date(2025, 5, 1), quantity=1)
+        _, few = self.changelist_queries(url)
+        ConsumptionLog.objects.bulk_create(
+            ConsumptionLog(product=product, date=date(2025, 5, 2), quantity=2) for product in self.products
+        )
+        response, many = self.changelist_queries(url)
+        self.assertEqual(few, many)
+        self.assertEqual(response.context["cl"].result_count, 7)
+
+        response, _ = self.changelist_queries(f"{url}?product__id__exact={self.products[0].pk}")
+        self.assertEqual(response.context["cl"].result_count, 2)
+        self.assertContains(response, 'class="admin-autocomplete-filter')
+        self.assertRedirects(
+            self.client.get(f"{url}?product__id__exact=x"), f"{url}?e=1", fetch_redirect_response=False
+        )
+
+    @override_settings(INVENTORY_BACKGROUND_ANALYSIS=True)
+    def test_adjust_stock_action_is_one_update(self):
+        def adjust(selected, change):
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse("admin:inventory_product_changelist"),
+                    {
+                        "action": "adjust_stock",
+                        "index": 0,
+                        "_selected_action": selected,
+                        "stock_adjustment": change,
+                    },
+                )
+            self.assertEqual(response.status_code, 302)
+            updates = [q["sql"] for q in queries if q["sql"].startswith('UPDATE "inventory_product"')]
+            self.assertEqual(len(updates), 1)
+            return len(queries)
+
+        selected = [product.pk for product in self.products[:3]]
+        with self.assertNumQueries(adjust(selected, "-25")):
+            # Twice the products, the same queries
+            adjust([product.pk for product in self.products], "10")
+        stock = dict(Product.objects.values_list("pk", "current_stock"))
+        self.assertEqual([stock[product.pk] for product in self.products], [10, 10, 10, 30, 30, 30])
+        self.assertEqual(set(AnalysisJob.objects.values_list("product_id", flat=True)), set(stock))
+
+        def ledger():
+            return list(DailyStockBalance.objects.order_by("product_id").values_list("product_id", "running_total"))
+
+        incremental = ledger()
+        # Clamped at zero: the first three took -20, not -25
+        self.assertEqual(incremental, [(pk, -10 if pk in selected else 10) for pk in sorted(stock)])
+        rebuild_daily_consumption()
+        self.assertEqual(ledger(), incremental)
+
+
+class StockLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # 100 left after the logs below
+        cls.product = Product.objects.create(name="Napkins", sku="SKU-SUP-NAPK-1", current_stock=150)
+        for d in range(10):
+            ConsumptionLog.objects.create(
+                product=cls.product, date=date(2025, 6, 1) + timedelta(days=d), quantity=5
+            )
+
+    def ledger(self):
+        return list(
+            DailyStockBalance.objects.order_by("product_id", "date").values_list(
+                "product_id", "date", "net_change", "running_total"
+            )
+        )
+
+    def stock_history(self):
+        self.product.refresh_from_db()
+        return analyse_product(self.product, AnalysisParams())["stock_level"].tolist()
+
+    def test_receipts_move_stock_and_later_history(self):
+        self.assertEqual(self.stock_history(), [100 + 45 - 5 * d for d in range(10)])
+        receipt = StockMovement.objects.create(
+            product=self.product, kind=StockMovement.RECEIPT, quantity=200, date=date(2025, 6, 5)
+        )
+        self.assertEqual(
+            self.stock_history(), [100 + 45 - 5 * d + (200 if d >= 4 else 0) for d in range(10)]
+        )
+        self.assertEqual(self.product.current_stock, 300)
+
+        receipt.delete()
+        self.assertEqual(self.stock_history(), [100 + 45 - 5 * d for d in range(10)])
+        self.assertEqual(self.product.current_stock, 100)
+
+    def test_log_writes_move_current_stock(self):
+        history = self.stock_history()
+        self.assertEqual(self.product.current_stock, 100)
+        log = ConsumptionLog.objects.create(product=self.product, date=date(2025, 6, 11), quantity=8)
+        self.assertEqual(self.stock_history(), history + [92])
+        log.quantity = 3
+        log.save()
+        self.assertEqual(self.stock_history(), history + [97])
+        log.delete()
+        self.assertEqual(self.stock_history(), history)
+        self.assertEqual(self.product.current_stock, 100)
+
+        # Unless an import says the stock count already has it
+        import_consumption(["sku,date,quantity", f"{self.product.sku},2025-06-11,10"], "csv", update_stock=False)
+        self.assertEqual(self.stock_history(), [level + 10 for level in history] + [100])
+
+    def test_incremental_updates_match_rebuild(self):
+        other = Product.objects.create(name="Cups", sku="SKU-SUP-CUPS-1", current_stock=50)
+        log = ConsumptionLog.objects.create(product=other, date=date(2025, 6, 3), quantity=7)
+        movement = StockMovement.objects.create(
+            product=self.product, kind=StockMovement.ADJUSTMENT, quantity=-4, date=date(2025, 5, 20)
+        )
+        log.date, log.quantity = date(2025, 6, 20), 9
+        log.save()
+        movement.date = date(2025, 6, 7)
+        movement.save()
+        ConsumptionLog.objects.filter(product=self.product, date=date(2025, 6, 2)).delete()
+        # Bulk path: more changes than BULK_DELTA_THRESHOLD
+        create_movements(
+            [
+                StockMovement(
+                    product=product,
+                    kind=StockMovement.RECEIPT,
+                    quantity=d + 1,
+                    date=date(2025, 6, 1) + timedelta(days=d),
+                )
+                for product in (self.product, other)
+                for d in range(0, 30, 2)
+            ]
+        )
+        incremental = self.ledger()
+        rebuild_daily_consumption()
+        self.assertEqual(incremental, self.ledger())
+
+        forecast = forecast_products(params=AnalysisParams(enable_smoothing=True))
+        for row, product in enumerate(Product.objects.order_by("pk")):
+            stock = analyse_product(product, AnalysisParams())["stock_level"]
+            np.testing.assert_allclose(forecast.stock_levels[row, : len(stock)], stock)
+
+    def test_stock_matrix_reads_only_the_requested_windows(self):
+        # Products between the requested ids, with long histories of their own
+        busy = Product.objects.bulk_create(
+            Product(name=f"Busy {i}", sku=f"SKU-SUP-BUSY-{i}", current_stock=900) for i in range(2)
+        )
+        ConsumptionLog.objects.bulk_create(
+            ConsumptionLog(product=product, date=date(2025, 1, 1) + timedelta(days=d), quantity=1)
+            for product in busy
+            for d in range(200)
+        )
+        last = Product.objects.create(name="Cups", sku="SKU-SUP-CUPS-1", current_stock=40)
+        ConsumptionLog.objects.create(product=last, date=date(2025, 5, 1), quantity=3)
+        rebuild_daily_consumption()
+
+        ids = np.array([self.product.pk, last.pk])
+        starts = np.array([np.datetime64("2025-06-04"), np.datetime64("2025-04-28")]).astype(np.int64)
+        lengths = np.array([4, 10])
+        fetched, original = [], columnar.fetch_columns
+
+        def fetch_columns(queryset, dtypes):
+            columns = original(queryset, dtypes)
+            fetched.append(len(columns[0]))
+            return columns
+
+        with mock.patch.object(columnar, "fetch_columns", fetch_columns):
+            stock = load_stock_matrix(ids, starts, lengths, [100, 40])
+        # The window rows (4 days, and Cups' one day), then one bounds row per product
+        self.assertEqual(fetched, [5, 2])
+        for row, (product, current_stock) in enumerate(zip((self.product, last), (100, 40))):
+            start = starts[row].astype("datetime64[D]")
+            expected = load_stock_history(product.pk, start, lengths[row], current_stock)
+            np.testing.assert_array_equal(stock[row, : lengths[row]], expected)
+
+    def test_changes_clamped_at_zero_keep_earlier_history(self):
+        before = self.stock_history()
+        # Stock on the last day is 100; take 150 off
+        StockMovement.objects.create(
+            product=self.product, kind=StockMovement.ADJUSTMENT, quantity=-150, date=date(2025, 6, 10)
+        )
+        self.assertEqual(self.stock_history(), before[:-1] + [0])
+        self.assertEqual(self.product.current_stock, 0)
+        floor = StockMovement.objects.get(notes=STOCK_FLOOR_NOTE)
+        self.assertEqual((floor.quantity, floor.date), (50, date(2025, 6, 10)))
+
+        other = Product.objects.create(name="Cups", sku="SKU-SUP-CUPS-1", current_stock=10)
+        report = import_consumption(
+            ["sku,date,quantity", "SKU-SUP-CUPS-1,2025-06-03,4", "SKU-SUP-CUPS-1,2025-06-05,25"], "csv"
+        )
+        self.assertEqual(report.imported, 2)
+        other.refresh_from_db()
+        self.assertEqual(other.current_stock, 0)
+        stock = analyse_product(other, AnalysisParams())["stock_level"].tolist()
+        self.assertEqual(stock, [6, 6, 0])
+
+        incremental = self.ledger()
+        rebuild_daily_consumption()
+        self.assertEqual(incremental, self.ledger())
+
+
+class AnalysisWindowTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name="Gloves", sku="SKU-SUP-GLOV-1", current_stock=500)
+        cls.start = date(2022, 1, 5)
+        ConsumptionLog.objects.bulk_create(
+            ConsumptionLog(product=cls.product, date=cls.start + timedelta(days=d), quantity=d % 7 + 1)
+            for d in range(1001)
+            if d % 3 != 2
+        )
+        rebuild_daily_consumption()
+        cls.full = analyse_product(cls.product, AnalysisParams(window="all", consumption_model="p2"))
+
+    def test_long_windows_are_downsampled_and_fitted_on_trailing_days(self):
+        # Daily reference series from the 365-day analysis of the same data
+        daily = self.full["daily_df"]
+        self.assertEqual(len(daily), analytics.FORECAST_WINDOW_DAYS)
+        self.assertEqual(daily.index[-1].date(), self.start + timedelta(days=1000))
+        np.testing.assert_array_equal(self.full["trend_dates"], daily.index.values.astype("datetime64[D]"))
+
+        self.assertEqual(self.full["unit"], "week")
+        dates = self.full["dates"]
+        # 2022-01-05 is a Wednesday: the first bucket is cut short
+        self.assertEqual(dates[0], np.datetime64("2022-01-09"))
+        self.assertTrue((np.diff(dates[1:-1]) == np.timedelta64(7, "D")).all())
+        days = np.arange(1001)
+        quantity = np.where(days % 3 != 2, days % 7 + 1, 0)
+        ends = (dates - np.datetime64(self.start)).astype(int)
+        begins = np.concatenate([[0], ends[:-1] + 1])
+        np.testing.assert_allclose(
+            self.full["quantity"],
+            [quantity[b : e + 1].mean() for b, e in zip(begins, ends)],
+        )
+        np.testing.assert_allclose(self.full["stock_level"], 500 + quantity.sum() - np.cumsum(quantity)[ends])
+
+        batch = forecast_products(params=AnalysisParams(consumption_model="p2"))
+        np.testing.assert_allclose(batch.quantities[0], daily["quantity"].values)
+        self.assertAlmostEqual(batch.consumption_rmse[0], self.full["consumption_rmse"], places=5)
+
+        # The window only changes the plotted range, reads stay bounded
+        with CaptureQueriesContext(connection) as month:
+            recent = analyse_product(self.product, AnalysisParams(window="30"))
+        self.assertEqual(recent["unit"], "day")
+        # Starts at the window's first logged day
+        self.assertEqual(recent["dates"][0], np.datetime64(self.start + timedelta(days=972)))
+        self.assertEqual(len(recent["dates"]), 29)
+        np.testing.assert_array_equal(recent["trend_dates"], recent["dates"])
+        with CaptureQueriesContext(connection) as everything:
+            analyse_product(self.product, AnalysisParams(window="all"))
+        self.assertLessEqual(len(everything), len(month) + 4)
+
+    def test_downsampled_windows_are_prepared_by_day(self):
+        days = np.arange(1001)
+        quantity = np.where(days % 3 != 2, days % 7 + 1, 0).astype(float)
+        quantity[500] = 400
+        ConsumptionLog.objects.create(product=self.product, date=self.start + timedelta(days=500), quantity=400)
+        raw = analyse_product(self.product, AnalysisParams(window="all"))
+        dates = np.datetime64(self.start) + days
+        ends, averages = bucket_means(dates, quantity, "week")
+        np.testing.assert_array_equal(raw["dates"], ends)
+        np.testing.assert_allclose(raw["quantity"], averages)
+
+        for params in (
+            AnalysisParams(window="all", enable_smoothing=True, smoothing_window=5),
+            AnalysisParams(window="all", remove_outliers=True, outlier_method="mad"),
+        ):
+            with self.subTest(params=params):
+                prepared = analyse_product(self.product, params)
+                _, expected = bucket_means(dates, preprocessing.preprocess(quantity, params), "week")
+                np.testing.assert_allclose(prepared["quantity"], expected)
+                self.assertFalse(np.allclose(prepared["quantity"], raw["quantity"]))
+
+    def test_custom_window_from_the_query(self):
+        query = {"window": "custom", "start": "2023-03-01", "end": "2023-03-31"}
+        url = reverse("product_chart", args=[self.product.pk, "stock", "json"])
+        series = self.client.get(url, query).json()
+        self.assertEqual(series["unit"], "day")
+        self.assertEqual(series["dates"][0], "2023-03-01")
+        self.assertEqual(series["dates"][-1], "2023-03-31")
+
+        response = self.client.get(reverse("product_detail", args=[self.product.pk]), query)
+        self.assertEqual(response.context["window"], "custom")
+        self.assertEqual(response.context["start"], date(2023, 3, 1))
+        self.assertIn("window=custom&start=2023-03-01&end=2023-03-31", response.context["chart_query"])
+
+        response = self.client.get(
+            reverse("product_detail", args=[self.product.pk]), {"window": "custom", "start": "2030-01-01"}
+        )
+        self.assertNotIn("analysis", response.context)
+        self.assertContains(response, "Not enough data for analysis in this date window.")
+
+
+class SupplierRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(23)
+        today = timezone.now().date()
+        cls.suppliers = [
+            Supplier.objects.create(name=f"Vendor {i}", contact_email=f"v{i}@example.com", lead_time_days=lead)
+            for i, lead in enumerate([2, 10, 30, 5])
+        ]
+        cls.products = []
+        for i in range(20):
+            product = Product.objects.create(
+                name=f"Part {i:02}",
+                sku=f"SKU-PRT-{i}",
+                current_stock=rng.randint(0, 400),
+                minimum_stock_level=rng.randint(5, 60),
+            )
+            # Vendor 3 supplies nothing; one product has no supplier
+            if i:
+                product.suppliers.set(rng.sample(cls.suppliers[:3], rng.randint(1, 3)))
+            cls.products.append(product)
+            ConsumptionLog.objects.bulk_create(
+                ConsumptionLog(product=product, date=today - timedelta(days=d), quantity=rng.randint(1, 12))
+                for d in range(45)
+                if rng.random() < 0.5
+            )
+        rebuild_daily_consumption()
+
+    def setUp(self):
+        cache.clear()
+
+    def expected(self, products, lead_time):
+        attach_stock_status(products)
+        since = status_window_start()
+        rollup = [0, 0, 0.0, 0, 0, 0.0]
+        for product in products:
+            usage = product.daily_consumption.filter(date__gte=since).aggregate(total=Sum("total_quantity"))
+            daily = (usage["total"] or 0) / 30
+            lead = lead_time(product)
+            rollup[0] += 1
+            rollup[1] += product.current_stock
+            rollup[2] += daily
+            rollup[3] += product.status_alert == "critical"
+            rollup[4] += product.status_alert == "low"
+            rollup[5] += max(daily * lead - product.current_stock, 0) if lead is not None else 0
+        return rollup
+
+    def assertRollup(self, actual, expected):
+        self.assertEqual(list(actual[:2]) + list(actual[3:5]), expected[:2] + expected[3:5])
+        self.assertAlmostEqual(actual.daily_usage, expected[2])
+        self.assertAlmostEqual(actual.exposure, expected[5])
+
+    def test_rollups_match_per_product_status(self):
+        with self.assertNumQueries(1):
+            rollups = compute_supplier_rollups([s.pk for s in self.suppliers])
+        for supplier in self.suppliers:
+            with self.subTest(supplier=supplier.name):
+                self.assertRollup(
+                    rollups[supplier.pk],
+                    self.expected(list(supplier.products.all()), lambda product: supplier.lead_time_days),
+                )
+        self.assertEqual(rollups[self.suppliers[3].pk], StockRollup())
+        self.assertGreater(sum(rollup.critical_count + rollup.low_count for rollup in rollups.values()), 0)
+
+        with self.assertNumQueries(1):
+            portfolio = compute_portfolio_rollup()
+        fastest = lambda product: min((s.lead_time_days for s in product.suppliers.all()), default=None)
+        self.assertRollup(portfolio, self.expected(list(Product.objects.all()), fastest))
+
+        response = self.client.get(reverse("supplier_dashboard"), {"sort": "exposure"})
+        exposures = [supplier.rollup.exposure for supplier in response.context["suppliers"]]
+        self.assertEqual(exposures, sorted(exposures, reverse=True))
+        self.assertEqual(response.context["portfolio"], portfolio)
+
+    def test_cached_until_a_write_touches_the_supplier(self):
+        first, second = self.suppliers[:2]
+        product = next(p for p in first.products.all() if second not in p.suppliers.all())
+        before = get_supplier_rollups([first.pk, second.pk])
+        with mock.patch("inventory.portfolio.compute_supplier_rollups") as compute:
+            self.assertEqual(get_supplier_rollups([first.pk, second.pk]), before)
+        compute.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ConsumptionLog.objects.create(product=product, date=timezone.now().date(), quantity=900)
+        with mock.patch(
+            "inventory.portfolio.compute_supplier_rollups", wraps=compute_supplier_rollups
+        ) as compute:
+            after = get_supplier_rollups([first.pk, second.pk])
+        compute.assert_called_once_with([first.pk], mock.ANY)
+        self.assertAlmostEqual(after[first.pk].daily_usage, before[first.pk].daily_usage + 30)
+        self.assertEqual(after[second.pk], before[second.pk])
+
+        # Lead times, supplier links and deletes invalidate too
+        portfolio = get_portfolio_rollup()
+        with self.captureOnCommitCallbacks(execute=True):
+            second.lead_time_days = 90
+            second.save()
+        self.assertGreater(get_supplier_rollups([second.pk])[second.pk].exposure, before[second.pk].exposure)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.suppliers.add(second)
+        self.assertEqual(
+            get_supplier_rollups([second.pk])[second.pk].product_count, before[second.pk].product_count + 1
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        rollups = get_supplier_rollups([first.pk, second.pk])
+        self.assertEqual(rollups[first.pk].product_count, before[first.pk].product_count - 1)
+        self.assertEqual(rollups[second.pk].product_count, before[second.pk].product_count)
+        self.assertEqual(get_portfolio_rollup().product_count, portfolio.product_count - 1)
+
+
+class ProductAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.supplier = Supplier.objects.create(name="Vendor", contact_email="v@example.com", lead_time_days=4)
+        cls.products = []
+        for i, stock in enumerate([500, 12, 80]):
+            product = Product.objects.create(
+                name=f"Item {i}", sku=f"SKU-API-{i}", current_stock=stock, minimum_stock_level=20
+            )
+            product.suppliers.add(cls.supplier)
+            ConsumptionLog.objects.bulk_create(
+                ConsumptionLog(product=product, date=date(2025, 3, 1) + timedelta(days=d), quantity=d % 5 + i)
+                for d in range(60)
+            )
+            cls.products.append(product)
+        rebuild_daily_consumption()
+
+    def setUp(self):
+        forecast_cache.local_cache.clear()
+        cache.clear()
+
+    def test_batch_lookup_with_field_selection(self):
+        response = self.client.get(
+            reverse("api_products"),
+            {"sku": ["SKU-API-2,SKU-API-0", "SKU-NOPE"], "fields": "sku,status,series", "window": "30"},
+        )
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["missing"], ["SKU-NOPE"])
+        self.assertEqual([p["sku"] for p in body["products"]], ["SKU-API-2", "SKU-API-0"])
+        self.assertEqual(set(body["products"][0]), {"sku", "status", "days_left", "series"})
+        self.assertNotIn(b" ", response.content)
+
+        expected = analyse_product(self.products[2], AnalysisParams(window="30"))
+        series = body["products"][0]["series"]
+        self.assertEqual(series["dates"], np.datetime_as_string(expected["dates"]).tolist())
+        np.testing.assert_allclose(series["stock_trend"], expected["stock_trend"], atol=1e-3)
+
+        detail = self.client.get(reverse("api_product", args=["SKU-API-1"])).json()
+        self.assertEqual(set(detail), set(api.DEFAULT_API_FIELDS) | {"days_left"})
+        self.assertEqual(detail["suppliers"], [self.supplier.pk])
+        self.assertEqual(detail["status"], "low")
+        self.assertEqual(self.client.get(reverse("api_product", args=["SKU-NOPE"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("api_products"), {"fields": "sku,price"}).status_code, 400)
+        detail_url = reverse("api_product", args=["SKU-API-1"])
+        for query in (
+            {"smoothing_window": "0"},
+            {"smoothing_window": "abc"},
+            {"outlier_threshold": "0"},
+            {"outlier_threshold": "nan"},
+            {"outlier_threshold": "inf"},
+        ):
+            with self.subTest(query=query):
+                response = self.client.get(detail_url, {"fields": "series", "enable_smoothing": "on", **query})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+
+    def test_pages_follow_the_cursor(self):
+        skus = []
+        cursor = None
+        with mock.patch.object(views, "API_PAGE_SIZE", 2):
+            while True:
+                query = {"fields": "sku"} if cursor is None else {"fields": "sku", "cursor": cursor}
+                body = self.client.get(reverse("api_products"), query).json()
+                skus += [p["sku"] for p in body["products"]]
+                cursor = body["next_cursor"]
+                if cursor is None:
+                    break
+        self.assertEqual(skus, sorted(p.sku for p in self.products))
+
+    def test_conditional_requests_until_the_data_changes(self):
+        url = reverse("api_products")
+        query = {"sku": "SKU-API-0", "fields": "sku,status,forecast,analysis"}
+        first = self.client.get(url, query)
+        etag, last_modified = first["ETag"], first["Last-Modified"]
+        self.assertIn("no-cache", first["Cache-Control"])
+
+        with mock.patch("inventory.views.product_payloads") as payloads:
+            self.assertEqual(self.client.get(url, query, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(url, query, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        payloads.assert_not_called()
+        # Different fields are a different representation
+        other = self.client.get(url, {"sku": "SKU-API-0"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(other.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ConsumptionLog.objects.create(product=self.products[0], date=date(2025, 5, 1), quantity=50)
+        changed = self.client.get(url, query, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+
+        def later(seconds):
+            # Last-Modified has second resolution
+            issued = time.time_ns() + seconds * 10**9
+            return mock.patch.object(versioning, "_new_version", lambda: f"{issued:x}")
+
+        linked = self.client.get(url, {"sku": "SKU-API-0", "fields": "suppliers"})
+        with later(5), self.captureOnCommitCallbacks(execute=True):
+            self.products[0].suppliers.clear()
+        for condition in (
+            {"HTTP_IF_NONE_MATCH": linked["ETag"]},
+            {"HTTP_IF_MODIFIED_SINCE": linked["Last-Modified"]},
+        ):
+            unlinked = self.client.get(url, {"sku": "SKU-API-0", "fields": "suppliers"}, **condition)
+            self.assertEqual(unlinked.status_code, 200)
+            self.assertEqual(unlinked.json()["products"][0]["suppliers"], [])
+
+        # A page that loses a product is modified too
+        page = self.client.get(url, {"fields": "sku"})
+        with later(10), self.captureOnCommitCallbacks(execute=True):
+            self.products[1].delete()
+        shorter = self.client.get(url, {"fields": "sku"}, HTTP_IF_MODIFIED_SINCE=page["Last-Modified"])
+        self.assertEqual(shorter.status_code, 200)
+        self.assertEqual([p["sku"] for p in shorter.json()["products"]], ["SKU-API-0", "SKU-API-2"])
+
+        compressed = self.client.get(url, {"fields": "sku,series"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+
+
+class PreprocessingTests(TestCase):
+    def series(self, rng, days):
+        y = rng.poisson(6, days).astype(float)
+        spikes = rng.choice(days, size=max(days // 15, 1), replace=False)
+        y[spikes] = rng.integers(60, 120, len(spikes))
+        return y
+
+    def pandas_reference(self, y, params):
+        # The pandas pipeline prepare_daily_frame used before the numpy one
+        quantity = pd.Series(y)
+        if params.remove_outliers and len(quantity) > 5:
+            std = quantity.std()
+            if std > 0:
+                z_scores = (quantity - quantity.mean()) / std
+                quantity[z_scores.abs() > params.outlier_threshold] = np.nan
+                quantity = quantity.interpolate().bfill().ffill()
+        if params.enable_smoothing:
+            quantity = quantity.rolling(window=params.smoothing_window, min_periods=1).mean()
+        return quantity.to_numpy()
+
+    def test_zscore_sma_matches_the_pandas_path(self):
+        rng = np.random.default_rng(25)
+        lengths = [1, 5, 6, 30, 365]
+        rows = [self.series(rng, n) for n in lengths] + [np.full(40, 3.0)]
+        # Spikes on the first and last day exercise the edge fills
+        rows[3][[0, -1]] = 150
+        matrix = np.full((len(rows), 365), np.nan)
+        for i, row in enumerate(rows):
+            matrix[i, : len(row)] = row
+        mask = ~np.isnan(matrix)
+
+        for params in (
+            AnalysisParams(remove_outliers=True, outlier_threshold=1.5),
+            AnalysisParams(enable_smoothing=True, smoothing_window=7),
+            AnalysisParams(remove_outliers=True, enable_smoothing=True, smoothing_window=4),
+        ):
+            batch = preprocessing.preprocess(matrix, params, mask)
+            for i, row in enumerate(rows):
+                with self.subTest(params=params, days=len(row)):
+                    expected = self.pandas_reference(row, params)
+                    np.testing.assert_allclose(preprocessing.preprocess(row, params), expected, rtol=1e-12)
+                    np.testing.assert_allclose(batch[i, : len(row)], expected, rtol=1e-12)
+                    self.assertTrue(np.isnan(batch[i, len(row):]).all())
+
+    def test_robust_filters_and_smoothers(self):
+        rng = np.random.default_rng(7)
+        y = self.series(rng, 120)
+        spikes = y > 50
+        for method in ("mad", "iqr"):
+            with self.subTest(method=method):
+                np.testing.assert_array_equal(preprocessing.outlier_mask(y, threshold=3.0, method=method), spikes)
+        # The spikes inflate the standard deviation, hiding some of them
+        zscore = preprocessing.outlier_mask(y, threshold=3.0, method="zscore")
+        self.assertTrue(zscore[spikes].any() and not zscore[spikes].all())
+        self.assertFalse(zscore[~spikes].any())
+        # Mostly-zero usage has no spread around the median: nothing is an outlier
+        sparse = np.zeros(60)
+        sparse[::7] = 4
+        for method in ("mad", "iqr"):
+            self.assertFalse(preprocessing.outlier_mask(sparse, method=method).any())
+
+        reference = {
+            "sma": pd.Series(y).rolling(5, min_periods=1).mean(),
+            "ema": pd.Series(y).ewm(span=5, adjust=False).mean(),
+            "median": pd.Series(y).rolling(5, min_periods=1).median(),
+        }
+        matrix = np.vstack([y, np.concatenate([y[:50], np.full(70, np.nan)])])
+        mask = ~np.isnan(matrix)
+        for method, expected in reference.items():
+            with self.subTest(method=method):
+                smoothed = preprocessing.smooth(matrix, mask, 5, method)
+                np.testing.assert_allclose(smoothed[0], expected.to_numpy(), rtol=1e-12)
+                np.testing.assert_allclose(smoothed[1, :50], expected.to_numpy()[:50], rtol=1e-12)
+                self.assertTrue(np.isnan(smoothed[1, 50:]).all())
+
+        params = AnalysisParams.from_query({"outlier_method": "iqr", "smoothing_method": "bogus"})
+        self.assertEqual((params.outlier_method, params.smoothing_method), ("iqr", "sma"))
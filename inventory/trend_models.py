@@ -0,0 +1,340 @@
+"""
+Registry of trend/forecast models for daily series (consumption and
+stock level).
+
+Every model shares one interface:
+
+- ``fit(y)`` returns a state for the series ``y`` (day index 0..n-1)
+- ``update(state, new_y)`` extends a state with new trailing days in
+  O(len(new_y)), without revisiting the history
+- ``drop(state, old_y)`` removes the leading days ``old_y`` the same way,
+  or returns ``None`` for models whose state depends on all of them
+- ``trend(state)`` / ``rmse(state)`` give in-sample fitted values and error
+- ``forecast(state, steps)`` predicts the next ``steps`` days
+- ``days_to_zero(state)`` is the number of days after the last one until
+  the series reaches zero, or ``None`` if it doesn't
+
+States are NamedTuples of numbers and arrays, so they pickle into the cache
+(see ``fit_cached``).
+"""
+import abc
+from math import comb
+from typing import NamedTuple
+
+import numpy as np
+from django.core.cache import cache
+
+from .instrumentation import record_cache
+
+DEFAULT_TREND_MODEL = "p1"
+# Furthest ahead days_to_zero looks for models without a closed form
+MAX_FORECAST_DAYS = 3650
+TREND_STATE_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+class TrendModel(abc.ABC):
+    code = None
+    label = None
+    # Polynomial degree, for models the batch engine can vectorise
+    degree = None
+
+    @abc.abstractmethod
+    def fit(self, y):
+        pass
+
+    @abc.abstractmethod
+    def update(self, state, new_y):
+        pass
+
+    def drop(self, state, old_y):
+        return None
+
+    @abc.abstractmethod
+    def trend(self, state):
+        pass
+
+    @abc.abstractmethod
+    def forecast(self, state, steps):
+        pass
+
+    def rmse(self, state):
+        return float(np.sqrt(state.sse / state.n)) if state.n else None
+
+    def current(self, state):
+        """The model's estimate for the last day."""
+        return self.trend(state)[-1]
+
+    def days_to_zero(self, state):
+        # Walk the forecast and interpolate within the first day it crosses 0
+        path = np.concatenate(([self.current(state)], self.forecast(state, MAX_FORECAST_DAYS)))
+        if path[0] <= 0:
+            return None
+        crossed = np.flatnonzero(path <= 0)
+        if not len(crossed):
+            return None
+        h = crossed[0]
+        return float(h - 1 + path[h - 1] / (path[h - 1] - path[h]))
+
+
+class PolynomialState(NamedTuple):
+    n: int
+    power_sums: np.ndarray  # sum(x**k) for k in 0..2*degree
+    moments: np.ndarray  # sum(x**k * y) for k in 0..degree
+    sum_squares: float  # sum(y**2)
+    coefs: np.ndarray  # highest order first, as np.polyfit
+    sse: float
+
+
+class PolynomialModel(TrendModel):
+    """Least-squares polynomial trend; updates keep the normal-equation sums."""
+
+    def __init__(self, code, label, degree):
+        self.code = code
+        self.label = label
+        self.degree = degree
+
+    def _sums(self, x, y):
+        powers = x[None, :] ** np.arange(2 * self.degree + 1)[:, None]
+        return powers.sum(axis=1), powers[: self.degree + 1] @ y, float(y @ y)
+
+    def fit(self, y):
+        y = np.asarray(y, dtype=float)
+        x = np.arange(len(y), dtype=float)
+        coefs = np.polyfit(x, y, self.degree)
+        sse = float(((y - np.polyval(coefs, x)) ** 2).sum())
+        return PolynomialState(len(y), *self._sums(x, y), coefs, sse)
+
+    def _solve(self, n, power_sums, moments, sum_squares):
+        # Solve on x / (n - 1) to keep the system well conditioned
+        k = self.degree + 1
+        scale = max(n - 1, 1.0)
+        exponents = np.add.outer(np.arange(k), np.arange(k))
+        normal = power_sums[exponents] / scale ** exponents
+        low_first = np.linalg.pinv(normal) @ (moments / scale ** np.arange(k)) / scale ** np.arange(k)
+        sse = sum_squares - 2 * low_first @ moments + low_first @ power_sums[exponents] @ low_first
+        return PolynomialState(n, power_sums, moments, sum_squares, low_first[::-1], max(float(sse), 0.0))
+
+    def update(self, state, new_y):
+        new_y = np.asarray(new_y, dtype=float)
+        if not len(new_y):
+            return state
+        x = np.arange(state.n, state.n + len(new_y), dtype=float)
+        power_sums, moments, sum_squares = self._sums(x, new_y)
+        return self._solve(
+            state.n + len(new_y),
+            state.power_sums + power_sums,
+            state.moments + moments,
+            state.sum_squares + sum_squares,
+        )
+
+    def drop(self, state, old_y):
+        old_y = np.asarray(old_y, dtype=float)
+        days = len(old_y)
+        if not days:
+            return state
+        power_sums, moments, sum_squares = self._sums(np.arange(days, dtype=float), old_y)
+        # Re-index the remaining days from 0: sum((x - days)**k * w) expands
+        # into the sums of lower powers
+        size = 2 * self.degree + 1
+        shift = np.array(
+            [[comb(k, j) * (-days) ** (k - j) for j in range(size)] for k in range(size)], dtype=float
+        )
+        k = self.degree + 1
+        return self._solve(
+            state.n - days,
+            shift @ (state.power_sums - power_sums),
+            shift[:k, :k] @ (state.moments - moments),
+            state.sum_squares - sum_squares,
+        )
+
+    def trend(self, state):
+        return np.polyval(state.coefs, np.arange(state.n, dtype=float))
+
+    def forecast(self, state, steps):
+        return np.polyval(state.coefs, np.arange(state.n, state.n + steps, dtype=float))
+
+    def days_to_zero(self, state):
+        roots = np.poly1d(state.coefs).roots
+        real_roots = roots[np.isreal(roots)].real
+        # Earliest root after the last day
+        last_day_idx = state.n - 1
+        future_roots = real_roots[real_roots > last_day_idx]
+        if not len(future_roots):
+            return None
+        return float(future_roots.min() - last_day_idx)
+
+
+class SmoothingState(NamedTuple):
+    n: int
+    level: float
+    slope: float
+    season: tuple  # additive seasonal offsets, empty without seasonality
+    head: tuple  # first days, kept until there are enough to initialise
+    sse: float
+    fitted: np.ndarray
+
+
+class HoltWintersModel(TrendModel):
+    """
+    Additive Holt (``period=None``) or Holt-Winters exponential smoothing
+    with fixed smoothing factors. Points are filtered one at a time, so
+    ``fit(y)`` is exactly ``update()`` over an empty state and incremental
+    updates give identical results to a full refit.
+    """
+
+    def __init__(self, code, label, alpha=0.3, beta=0.1, gamma=0.2, period=None):
+        self.code = code
+        self.label = label
+        self.alpha, self.beta, self.gamma = alpha, beta, gamma
+        self.period = period
+
+    def fit(self, y):
+        return self.update(SmoothingState(0, 0.0, 0.0, (), (), 0.0, np.empty(0)), y)
+
+    def update(self, state, new_y):
+        n, level, slope, season, head, sse = state[:6]
+        season = list(season)
+        head = list(head)
+        init_days = self.period or 2
+        alpha, beta, gamma, period = self.alpha, self.beta, self.gamma, self.period
+        fitted = []
+        for value in np.asarray(new_y, dtype=float).tolist():
+            if n < init_days:
+                # Initialisation: echo the data until there is enough of it
+                head.append(value)
+                fitted.append(value)
+                if len(head) == init_days:
+                    if period:
+                        level = sum(head) / period
+                        season = [v - level for v in head]
+                    else:
+                        level, slope = head[1], head[1] - head[0]
+            else:
+                offset = season[n % period] if period else 0.0
+                estimate = level + slope + offset
+                fitted.append(estimate)
+                sse += (value - estimate) ** 2
+                previous = level
+                level = alpha * (value - offset) + (1 - alpha) * (level + slope)
+                slope = beta * (level - previous) + (1 - beta) * slope
+                if period:
+                    season[n % period] = gamma * (value - level) + (1 - gamma) * offset
+            n += 1
+        return SmoothingState(
+            n, level, slope, tuple(season), tuple(head), sse,
+            np.concatenate((state.fitted, fitted)),
+        )
+
+    def trend(self, state):
+        return state.fitted
+
+    def current(self, state):
+        if state.n < (self.period or 2):
+            return state.head[-1]
+        return state.level + (state.season[(state.n - 1) % self.period] if self.period else 0.0)
+
+    def forecast(self, state, steps):
+        h = np.arange(1, steps + 1)
+        if state.n < (self.period or 2):
+            # Not initialised: carry the last value forward
+            return np.full(steps, state.head[-1] if state.head else 0.0)
+        values = state.level + h * state.slope
+        if self.period:
+            values += np.asarray(state.season)[(state.n - 1 + h) % self.period]
+        return values
+
+
+class MovingAverageState(NamedTuple):
+    n: int
+    window: tuple  # the last ``size`` values
+    sse: float
+    fitted: np.ndarray
+
+
+class MovingAverageModel(TrendModel):
+    """
+    Trailing mean (``min_periods=1``), forecast as the last mean plus the
+    average daily change across the window.
+    """
+
+    def __init__(self, code, label, size=7):
+        self.code = code
+        self.label = label
+        self.size = size
+
+    def fit(self, y):
+        return self.update(MovingAverageState(0, (), 0.0, np.empty(0)), y)
+
+    def update(self, state, new_y):
+        window = list(state.window)
+        sse = state.sse
+        fitted = []
+        for value in np.asarray(new_y, dtype=float).tolist():
+            window.append(value)
+            if len(window) > self.size:
+                window.pop(0)
+            mean = sum(window) / len(window)
+            fitted.append(mean)
+            sse += (value - mean) ** 2
+        return MovingAverageState(
+            state.n + len(fitted), tuple(window), sse, np.concatenate((state.fitted, fitted))
+        )
+
+    def trend(self, state):
+        return state.fitted
+
+    def forecast(self, state, steps):
+        window = state.window
+        drift = (window[-1] - window[0]) / (len(window) - 1) if len(window) > 1 else 0.0
+        return state.fitted[-1] + np.arange(1, steps + 1) * drift
+
+
+TREND_MODEL_REGISTRY = {}
+
+
+def register_trend_model(model):
+    TREND_MODEL_REGISTRY[model.code] = model
+    return model
+
+
+register_trend_model(PolynomialModel("p1", "Linear (Default)", 1))
+register_trend_model(PolynomialModel("p2", "Polynomial (deg=2)", 2))
+register_trend_model(HoltWintersModel("holt", "Holt exponential smoothing"))
+register_trend_model(HoltWintersModel("weekly", "Weekly seasonal (Holt-Winters)", period=7))
+register_trend_model(MovingAverageModel("ma7", "Moving average (7 days)", size=7))
+
+
+def get_trend_model(code):
+    return TREND_MODEL_REGISTRY.get(code) or TREND_MODEL_REGISTRY[DEFAULT_TREND_MODEL]
+
+
+def fit_cached(model, y, key, first_day=0, timeout=TREND_STATE_CACHE_TIMEOUT):
+    """
+    Fit ``model`` to ``y``, the series from day number ``first_day`` on,
+    reusing the state cached under ``key`` when ``y`` only appends days to
+    the series it was fitted on, or also starts later and ``model.drop``
+    can remove the leading days (a sliding window). A changed history is
+    refitted from scratch. The series is cached with its state, so a hit
+    still compares the overlapping days but only fits the new and dropped
+    ones. ``key`` must name a series whose days, once seen, never change
+    (see ``analytics.trend_state_key``).
+    """
+    y = np.asarray(y, dtype=float)
+    entry = cache.get(key)
+    if entry is not None:
+        cached_first, cached_y, state = entry
+        dropped = first_day - cached_first
+        kept = len(cached_y) - dropped
+        if 0 <= dropped < len(cached_y) and kept <= len(y) and np.array_equal(cached_y[dropped:], y[:kept]):
+            if dropped:
+                state = model.drop(state, cached_y[:dropped])
+            if state is not None:
+                record_cache("trend_state", 1, 0)
+                if dropped or kept < len(y):
+                    state = model.update(state, y[kept:])
+                    cache.set(key, (first_day, y, state), timeout)
+                return state
+    record_cache("trend_state", 0, 1)
+    state = model.fit(y)
+    cache.set(key, (first_day, y, state), timeout)
+    return state
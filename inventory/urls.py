@@ -1,9 +1,44 @@
-from django.urls import path
+from django.conf import settings
+from django.urls import path, re_path
 from . import views
 
+# Under an ASGI server the async variants overlap their database and
+# compute stages instead of holding a thread per request
+if getattr(settings, "INVENTORY_ASYNC_VIEWS", False):
+    list_view, detail_view, chart_view = (
+        views.AsyncProductListView,
+        views.AsyncProductDetailView,
+        views.AsyncProductChartView,
+    )
+else:
+    list_view, detail_view, chart_view = (
+        views.ProductListView,
+        views.ProductDetailView,
+        views.ProductChartView,
+    )
+
 urlpatterns = [
-    path('', views.ProductListView.as_view(), name='product_list'),
-    path('product/<int:pk>/', views.ProductDetailView.as_view(), name='product_detail'),
+    path('', list_view.as_view(), name='product_list'),
+    path('product/<int:pk>/', detail_view.as_view(), name='product_detail'),
+    path('consumption/import/', views.ConsumptionImportView.as_view(), name='consumption_import'),
+    path('consumption/export/', views.ExportView.as_view(), name='consumption_export'),
+    path(
+        'forecasts/export/',
+        views.ExportView.as_view(
+            kind='forecasts', permission_required='inventory.view_forecastsnapshot'
+        ),
+        name='forecast_export',
+    ),
+    path('reorder/', views.ReorderDashboardView.as_view(), name='reorder_dashboard'),
+    path('suppliers/', views.SupplierDashboardView.as_view(), name='supplier_dashboard'),
+    path('api/products/', views.ProductAPIView.as_view(), name='api_products'),
+    path('api/products/<str:sku>/', views.ProductAPIView.as_view(), name='api_product'),
+    path('instrumentation/stats/', views.InstrumentationStatsView.as_view(), name='instrumentation_stats'),
     path('product/add/', views.ProductCreateView.as_view(), name='product_create'),
     path('product/<int:pk>/edit/', views.ProductUpdateView.as_view(), name='product_update'),
+    re_path(
+        r'^product/(?P<pk>[0-9]+)/chart/(?P<kind>consumption|stock)\.(?P<fmt>png|svg|json)$',
+        chart_view.as_view(),
+        name='product_chart',
+    ),
 ]
@@ -0,0 +1,115 @@
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .instrumentation import record_cache
+from .models import Product
+
+# Every cached artefact derived from a product's data (status, charts,
+# forecasts) embeds the product's current data version in its key. Writes
+# replace the version with a fresh token, so stale entries are simply never
+# read again and unchanged products can be cached for a long time.
+PRODUCT_VERSION_KEY = "product_version:{pk}"
+# Rollups over many products (see inventory.portfolio) have versions of
+# their own, replaced along with those of any of their products
+SUPPLIER_VERSION_KEY = "supplier_version:{pk}"
+PORTFOLIO_VERSION_KEY = "portfolio_version"
+
+
+def _version_key(pk):
+    return PRODUCT_VERSION_KEY.format(pk=pk)
+
+
+def _supplier_version_key(pk):
+    return SUPPLIER_VERSION_KEY.format(pk=pk)
+
+
+def _new_version():
+    # Unique even if the version entry was evicted and has to be recreated
+    return f"{time.time_ns():x}"
+
+
+def version_timestamp(version):
+    """When ``version`` was issued (versions are nanosecond timestamps)."""
+    return datetime.fromtimestamp(int(version, 16) / 1e9, tz=timezone.utc)
+
+
+def _get_versions(pks, key_func):
+    keys = {key_func(pk): pk for pk in pks}
+    versions = {keys[key]: version for key, version in cache.get_many(keys).items()}
+    missing = {key_func(pk): _new_version() for pk in pks if pk not in versions}
+    record_cache("version", len(versions), len(missing))
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update({keys[key]: version for key, version in missing.items()})
+    return versions
+
+
+def get_product_versions(pks):
+    """Return ``{pk: version}`` for ``pks`` with a single cache round-trip."""
+    return _get_versions(pks, _version_key)
+
+
+def get_product_version(pk):
+    return get_product_versions([pk])[pk]
+
+
+def bump_product_versions(pks):
+    """
+    Invalidate everything cached for ``pks``. Runs once the current
+    transaction commits so readers can't re-cache pre-commit data under the
+    new version.
+    """
+    pks = set(pks)
+    if not pks:
+        return
+    # Looked up now: a deleted product's supplier links are gone on commit
+    supplier_pks = set(
+        Product.suppliers.through.objects.filter(product_id__in=pks).values_list(
+            "supplier_id", flat=True
+        )
+    )
+
+    def bump():
+        versions = {_version_key(pk): _new_version() for pk in pks}
+        versions.update({_supplier_version_key(pk): _new_version() for pk in supplier_pks})
+        versions[PORTFOLIO_VERSION_KEY] = _new_version()
+        cache.set_many(versions, timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def bump_product_version(pk):
+    bump_product_versions([pk])
+
+
+def get_supplier_versions(pks):
+    """``get_product_versions`` for supplier rollups."""
+    return _get_versions(pks, _supplier_version_key)
+
+
+def get_portfolio_version():
+    version = cache.get(PORTFOLIO_VERSION_KEY)
+    record_cache("version", version is not None, version is None)
+    if version is None:
+        version = _new_version()
+        cache.set(PORTFOLIO_VERSION_KEY, version, timeout=None)
+    return version
+
+
+def bump_supplier_versions(pks):
+    """
+    Invalidate the rollups of suppliers ``pks`` and the portfolio, for
+    changes to a supplier itself or to its product list. Product writes
+    bump their suppliers through ``bump_product_versions``.
+    """
+    pks = set(pks)
+
+    def bump():
+        versions = {_supplier_version_key(pk): _new_version() for pk in pks}
+        versions[PORTFOLIO_VERSION_KEY] = _new_version()
+        cache.set_many(versions, timeout=None)
+
+    transaction.on_commit(bump)
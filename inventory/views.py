@@ -1,20 +1,52 @@
-import io
-import urllib
-import base64
-import numpy as np
-import pandas as pd
-import matplotlib
-matplotlib.use('Agg')  # Set backend to non-interactive to avoid thread issues
-import matplotlib.pyplot as plt
-from django.db.models import Sum, F, ExpressionWrapper, FloatField, Q
-from django.core.paginator import Paginator
+import asyncio
+import codecs
+from urllib.parse import urlencode
+from django.conf import settings
+from django.db.models import Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.core.handlers.asgi import ASGIRequest
+from django.contrib.auth.mixins import PermissionRequiredMixin, UserPassesTestMixin
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from datetime import timedelta
-from .models import Product, ConsumptionLog
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.views.decorators.gzip import gzip_page
+from .models import Product, Supplier
 from .forms import ProductForm
+from .analytics import ANALYSIS_WINDOWS, AnalysisParams
+from . import instrumentation
+from .api import (
+    API_PAGE_SIZE,
+    JSON_DUMPS_PARAMS,
+    api_queryset,
+    api_validators,
+    parse_fields,
+    parse_skus,
+    product_payloads,
+)
+from .export import EXPORT_CONTENT_TYPES, ExportFilters, aiter_export, export_filename, stream_export
+from .ingest import IMPORT_BATCH_SIZE, IMPORT_FORMATS, ImportReport, guess_format, import_consumption
+from .pagination import KeysetPaginator, estimate_count
+from .preprocessing import OUTLIER_METHODS, SMOOTHING_METHODS
+from .portfolio import get_portfolio_rollup, get_supplier_rollups
+from .snapshots import reorder_dashboard_queryset
+from .concurrency import compute_stage, db_stage
+from .charts import CHART_CONTENT_TYPES, chart_cache_key, chart_etag, get_chart
+from .trend_models import TREND_MODEL_REGISTRY
+from .status import STATUS_CHOICES, annotate_stock_status, attach_stock_status
+from .versioning import get_product_version
+from .workers import get_detail_analysis
 from django.urls import reverse_lazy
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
-from django.core.cache import cache
+from django.views import View
+from django.views.generic import ListView, DetailView, CreateView, UpdateView
+from django.views.generic.detail import SingleObjectMixin
+
+# Product search matching: "contains" (default) or "prefix"
+PRODUCT_SEARCH_MODE = getattr(settings, "INVENTORY_PRODUCT_SEARCH", "contains")
+
+# Browser/CDN lifetime of chart images requested with a current ?v= version
+CHART_MAX_AGE = 60 * 60 * 24
 
 class ProductCreateView(CreateView):
     model = Product
@@ -36,253 +68,421 @@ class ProductListView(ListView):
     context_object_name = "products"
     paginate_by = 10
 
+    # ?sort= values: keyset ordering (unique on id) and how products without
+    # a days_left estimate sort (last either way)
+    SORT_ORDERINGS = {
+        "name": (("name", "id"), None),
+        "days_left": (("days_left_key", "name", "id"), 2 ** 31 - 1),
+        "-days_left": (("-days_left_key", "name", "id"), -1),
+        "status": (("status_rank", "days_left_key", "name", "id"), 2 ** 31 - 1),
+    }
+
     def get_queryset(self):
         queryset = super().get_queryset()
         query = self.request.GET.get('q')
         if query:
+            # "prefix" matching is index-backed on every supported database;
+            # "contains" only on PostgreSQL (trigram indexes)
+            lookup = "istartswith" if PRODUCT_SEARCH_MODE == "prefix" else "icontains"
             queryset = queryset.filter(
-                Q(name__icontains=query) | Q(sku__icontains=query)
+                Q(**{f"name__{lookup}": query}) | Q(**{f"sku__{lookup}": query})
             )
-        return queryset.order_by('name')
+
+        status = self.request.GET.get('status')
+        sort = self.request.GET.get('sort')
+        if sort not in self.SORT_ORDERINGS:
+            sort = "name"
+
+        # Status is only needed in the page query when filtering/sorting on it;
+        # otherwise it comes from the cache in get_context_data.
+        self.ordering_keys, days_left_default = self.SORT_ORDERINGS[sort]
+        if status in STATUS_CHOICES or sort != "name":
+            queryset = annotate_stock_status(queryset)
+            if status in STATUS_CHOICES:
+                queryset = queryset.filter(status_alert=status)
+        if days_left_default is not None:
+            queryset = queryset.annotate(
+                days_left_key=Coalesce("days_left", Value(days_left_default))
+            )
+        return queryset
+
+    def paginate_queryset(self, queryset, page_size):
+        # Keyset pagination: constant cost per page, no COUNT(*)
+        paginator = KeysetPaginator(queryset, self.ordering_keys, page_size)
+        page = paginator.get_page(self.request.GET.get('cursor'))
+        self.total_count, self.total_exact = estimate_count(queryset)
+        return paginator, page, page.object_list, page.has_other_pages()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Calculate status for each product
-        # Logic: Warning if days_remaining <= 7
-        
-        # This is a naive implementation (N+1 queries for aggregation)
-        # Optimized approach would use subqueries, but for this scale, interation is fine.
-        thirty_days_ago = timezone.now().date() - timedelta(days=30)
-        
-        # Iterate over the paginated list, not the full queryset if possible, 
-        # but generic view context['products'] is the page slice when paginated.
-        for product in context['products']:
-            # Implement caching for status calculation
-            cache_key = f"product_status_{product.pk}"
-            status_data = cache.get(cache_key)
-
-            if status_data:
-                 product.days_left = status_data.get('days_left')
-                 product.status_alert = status_data.get('status_alert')
-            else:
-                # Calculate average daily usage over last 30 days
-                total_usage = ConsumptionLog.objects.filter(
-                    product=product, 
-                    date__gte=thirty_days_ago
-                ).aggregate(Sum('quantity'))['quantity__sum'] or 0
-                
-                avg_daily = total_usage / 30.0
-                
-                status_alert = "ok"
-                days_left = None
-
-                if avg_daily > 0:
-                    days_left = int(product.current_stock / avg_daily)
-                    if days_left <= 7:
-                        status_alert = "critical" # < 7 days
-                    elif product.current_stock <= product.minimum_stock_level:
-                        status_alert = "low" # Below min stock but maybe slow consumption
-                else:
-                    # No consumption data
-                    if product.current_stock <= product.minimum_stock_level:
-                        status_alert = "low"
-                
-                # Set calculate attributes
-                product.days_left = days_left
-                product.status_alert = status_alert
-                
-                # Cache the result for 5 minutes
-                cache.set(cache_key, {'days_left': days_left, 'status_alert': status_alert}, 300)
-                     
+        # Logic: Warning if days_remaining <= 7 (see inventory.status)
+        products = [p for p in context['products'] if not hasattr(p, 'status_alert')]
+        # Products not already annotated by the page query come from the cache
+        attach_stock_status(products)
+
+        params = self.request.GET.copy()
+        params.pop('cursor', None)
+        context['total_count'] = self.total_count
+        context['total_exact'] = self.total_exact
+        context['querystring'] = params.urlencode()
+        context['status_choices'] = STATUS_CHOICES
+        context['current_status'] = self.request.GET.get('status', '')
+        context['current_sort'] = self.request.GET.get('sort', 'name')
         return context
 
 
+class AsyncProductListView(ProductListView):
+    """
+    ProductListView for ASGI: the page query, then its status lookups, run
+    concurrently with the total count on the bounded database pool.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        paginator = KeysetPaginator(self.object_list, self.ordering_keys, self.paginate_by)
+
+        async def page_with_status():
+            page = await db_stage(paginator.get_page, request.GET.get('cursor'))
+            await db_stage(attach_stock_status, [p for p in page if not hasattr(p, 'status_alert')])
+            return page
+
+        page, (self.total_count, self.total_exact) = await asyncio.gather(
+            page_with_status(), db_stage(estimate_count, self.object_list)
+        )
+        self.paginated = (paginator, page, page.object_list, page.has_other_pages())
+        return self.render_to_response(self.get_context_data())
+
+    def paginate_queryset(self, queryset, page_size):
+        return self.paginated
+
+
 class ProductDetailView(DetailView):
     model = Product
     template_name = "inventory/product_detail.html"
     context_object_name = "product"
 
-    def get_context_data(self, **kwargs):
+    def get_log_page(self):
+        # Keyset pagination for logs, newest first: deep pages cost the same
+        # as the first one
+        paginator = KeysetPaginator(self.object.consumption_logs.all(), ("-date", "-id"), 10)
+        return paginator.get_page(self.request.GET.get('cursor'))
+
+    def get_log_count(self):
+        # The daily rollup gives an exact total from one row per day
+        return self.object.daily_consumption.aggregate(total=Sum('entry_count'))['total'] or 0
+
+    def get_stages(self, params):
+        """The page's independent queries and analysis, run in turn."""
+        # Precomputed by the background workers when possible
+        analysis = get_detail_analysis(self.object, params)
+        return {
+            'page_obj': self.get_log_page(),
+            'log_count': self.get_log_count(),
+            'analysis': analysis,
+            'version': get_product_version(self.object.pk) if analysis is not None else None,
+        }
+
+    def get_context_data(self, stages=None, **kwargs):
         context = super().get_context_data(**kwargs)
+        product = self.object
+
+        # Trend models and advanced preparation settings from the request
+        params = AnalysisParams.from_query(self.request.GET)
+        if stages is None:
+            stages = self.get_stages(params)
+        context['page_obj'] = stages['page_obj']
+        context['log_count'] = stages['log_count']
+        context.update(params._asdict())
+        context['trend_models'] = [(code, model.label) for code, model in TREND_MODEL_REGISTRY.items()]
+        context['analysis_windows'] = ANALYSIS_WINDOWS
+        context['outlier_methods'] = OUTLIER_METHODS
+        context['smoothing_methods'] = SMOOTHING_METHODS
+        context['analysis_query'] = urlencode(params.as_query())
+
+        analysis = stages['analysis']
+        if analysis is not None:
+            context['analysis'] = True
+            if analysis['consumption_rmse'] is not None:
+                context['consumption_rmse'] = round(analysis['consumption_rmse'], 2)
+            if analysis['stock_rmse'] is not None:
+                context['stock_rmse'] = round(analysis['stock_rmse'], 2)
+            if 'prediction_date' in analysis:
+                context['prediction_date'] = analysis['prediction_date']
+                context['days_remaining'] = analysis['days_remaining']
+
+            # Charts are separate, cacheable requests; the version makes
+            # their URLs change whenever the product's data does.
+            context['chart_query'] = urlencode({**params.as_query(), 'v': stages['version']})
+
+        return context
+
+
+class AsyncProductDetailView(ProductDetailView):
+    """
+    ProductDetailView for ASGI: the log page, log count, data version and
+    analysis are fetched/computed concurrently on bounded thread pools.
+    """
+
+    def get_queryset(self):
+        # Suppliers are listed on the page; load them off the event loop too
+        return super().get_queryset().prefetch_related('suppliers')
+
+    async def get(self, request, *args, **kwargs):
+        self.object = await db_stage(self.get_object)
+        params = AnalysisParams.from_query(request.GET)
+        page_obj, log_count, version, analysis = await asyncio.gather(
+            db_stage(self.get_log_page),
+            db_stage(self.get_log_count),
+            db_stage(get_product_version, self.object.pk),
+            compute_stage(get_detail_analysis, self.object, params),
+        )
+        stages = {'page_obj': page_obj, 'log_count': log_count, 'analysis': analysis, 'version': version}
+        return self.render_to_response(self.get_context_data(object=self.object, stages=stages))
+
+
+class ProductChartView(SingleObjectMixin, View):
+    model = Product
+
+    def get(self, request, *args, **kwargs):
         product = self.get_object()
-        all_logs = product.consumption_logs.all().order_by("-date") # Newest first for table
-
-        # Pagination for Logs
-        paginator = Paginator(all_logs, 10) # 10 logs per page
-        page_number = self.request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-        context['page_obj'] = page_obj
-
-        # For analytics, we typically need ALL data, sorted by date asc
-        logs = product.consumption_logs.all().order_by("date")
-
-        # Get trend models from request parameters (default to 'linear')
-        consumption_model = self.request.GET.get('consumption_model', 'p1') # p1 for polyfit deg 1
-        stock_model = self.request.GET.get('stock_model', 'p1')
-        
-        # Advanced Preparation Settings
-        enable_smoothing = self.request.GET.get('enable_smoothing') == 'on'
-        smoothing_window = int(self.request.GET.get('smoothing_window', 3))
-        remove_outliers = self.request.GET.get('remove_outliers') == 'on'
-        outlier_threshold = float(self.request.GET.get('outlier_threshold', 2.0))
-
-        context['consumption_model'] = consumption_model
-        context['stock_model'] = stock_model
-        context['enable_smoothing'] = enable_smoothing
-        context['smoothing_window'] = smoothing_window
-        context['remove_outliers'] = remove_outliers
-        context['outlier_threshold'] = outlier_threshold
-
-        if logs.exists():
-            # Data preparation
-            data = {
-                "date": [log.date for log in logs],
-                "quantity": [log.quantity for log in logs],
-            }
-            df = pd.DataFrame(data)
-            df["date"] = pd.to_datetime(df["date"])
-            df = df.sort_values("date")
-            df.set_index("date", inplace=True)
-            
-            # Resample to daily frequency and fill 0 for missing days
-            daily_df = df.resample('D').sum().fillna(0)
-
-            # --- Advanced Data Pre-processing ---
-            # 1. Outlier Removal (Discard Excesses)
-            if remove_outliers and len(daily_df) > 5:
-                # Calculate Z-scores
-                mean = daily_df["quantity"].mean()
-                std = daily_df["quantity"].std()
-                if std > 0:
-                    z_scores = (daily_df["quantity"] - mean) / std
-                    # Replace outliers with NaN
-                    daily_df.loc[z_scores.abs() > outlier_threshold, "quantity"] = np.nan
-                    # Interpolate to fill gaps (linear interpolation)
-                    daily_df["quantity"] = daily_df["quantity"].interpolate()
-                    # Handle edge cases (if first/last indices were NaN)
-                    daily_df["quantity"] = daily_df["quantity"].fillna(method='bfill').fillna(method='ffill')
-
-            # 2. Smoothing (Rolling Average)
-            if enable_smoothing:
-                daily_df["quantity"] = daily_df["quantity"].rolling(window=smoothing_window, min_periods=1).mean()
-
-            # --- Calculate Stock History ---
-            total_consumed = daily_df["quantity"].sum()
-            simulated_start_stock = product.current_stock + total_consumed
-            daily_df["stock_level"] = simulated_start_stock - daily_df["quantity"].cumsum()
-
-            # Calculate average daily consumption (Naive Baseline)
-            avg_daily_usage = daily_df["quantity"].mean()
-            days_left_naive = 0
-            if avg_daily_usage > 0:
-                days_left_naive = product.current_stock / avg_daily_usage
-
-            # Prediction logic using Stock Trend Model
-            days_left = days_left_naive # Default to naive
-            
-            if len(daily_df) > 1:
-                try:
-                    x = np.arange(len(daily_df))
-                    y_stock = daily_df["stock_level"].values
-                    deg = 2 if stock_model == 'p2' else 1
-                    
-                    z = np.polyfit(x, y_stock, deg)
-                    p = np.poly1d(z)
-                    
-                    # Find roots where stock = 0
-                    roots = p.roots
-                    real_roots = roots[np.isreal(roots)].real
-                    
-                    # Filter for roots in the future (greater than current last index)
-                    last_day_idx = len(daily_df) - 1
-                    future_roots = real_roots[real_roots > last_day_idx]
-                    
-                    if len(future_roots) > 0:
-                        # Take the earliest future date where stock hits 0
-                        target_idx = future_roots.min()
-                        days_left = target_idx - last_day_idx
-                    else:
-                        # If no crossing in future (e.g. slope up or never crossing), fallback or max out
-                        # For safety, keep naive if model fails to predict depletion
-                        pass
-                except Exception as e:
-                    print(f"Prediction Error: {e}")
-            
-            if days_left > 0:
-                 prediction_date = timezone.now().date() + timezone.timedelta(days=days_left)
-                 context["prediction_date"] = prediction_date
-                 context["days_remaining"] = int(days_left)
-
-            def get_trend_poly(x, y, model_code):
-                deg = 2 if model_code == 'p2' else 1
-                try:
-                    z = np.polyfit(x, y, deg)
-                    p = np.poly1d(z)
-                    y_pred = p(x)
-                    rmse = np.sqrt(np.mean((y - y_pred)**2))
-                    return p(x), rmse
-                except Exception:
-                    return None, None
-
-            # --- Graph 1: Consumption ---
-            plt.figure(figsize=(10, 5))
-            plt.plot(daily_df.index, daily_df["quantity"], marker='o', linestyle='-', label='Consumption')
-            
-            if len(daily_df) > 1:
-                x = np.arange(len(daily_df))
-                y = daily_df["quantity"].values
-                trend_y, rmse = get_trend_poly(x, y, consumption_model)
-                
-                if trend_y is not None:
-                    label = f'Trend ({consumption_model}, RMSE={rmse:.2f})'
-                    plt.plot(daily_df.index, trend_y, "r--", linewidth=2, label=label)
-                    context['consumption_rmse'] = round(rmse, 2)
-
-            plt.title('Daily Consumption Trend')
-            plt.xlabel('Date')
-            plt.ylabel('Quantity')
-            plt.legend()
-            plt.grid(True)
-            plt.tight_layout()
-            
-            # --- Min Stock Threshold Line ---
-            plt.axhline(y=product.minimum_stock_level, color='red', linestyle=':', linewidth=2, label=f'Min Level ({product.minimum_stock_level})')
-
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png')
-            buf.seek(0)
-            string = base64.b64encode(buf.read())
-            context["graph"] = urllib.parse.quote(string)
-            plt.close()
-
-            # --- Graph 2: Stock Level ---
-            # Stock history already calculated above as daily_df["stock_level"]
-
-            plt.figure(figsize=(10, 5))
-            plt.plot(daily_df.index, daily_df["stock_level"], marker='s', linestyle='-', color='green', label='Stock Level')
-
-            if len(daily_df) > 1:
-                x = np.arange(len(daily_df))
-                y = daily_df["stock_level"].values
-                trend_y, rmse = get_trend_poly(x, y, stock_model)
-                
-                if trend_y is not None:
-                     label = f'Trend ({stock_model}, RMSE={rmse:.2f})'
-                     plt.plot(daily_df.index, trend_y, "r--", linewidth=2, label=label)
-                     context['stock_rmse'] = round(rmse, 2)
-
-            plt.title('Stock Level History (Simulated)')
-            plt.xlabel('Date')
-            plt.ylabel('Units Remaining')
-            plt.legend()
-            plt.grid(True)
-            plt.tight_layout()
-
-            buf2 = io.BytesIO()
-            plt.savefig(buf2, format='png')
-            buf2.seek(0)
-            string2 = base64.b64encode(buf2.read())
-            context["stock_graph"] = urllib.parse.quote(string2)
-            plt.close()
+        kind, fmt = kwargs['kind'], kwargs['fmt']
+        params = AnalysisParams.from_query(request.GET)
+        version = get_product_version(product.pk)
+
+        etag = chart_etag(chart_cache_key(product.pk, version, kind, fmt, params))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            content = get_chart(product, version, kind, fmt, params)
+            response = self.chart_response(content, fmt)
+        return self.add_cache_headers(response, etag, version)
+
+    def chart_response(self, content, fmt):
+        if content is None:
+            raise Http404("Not enough data for analysis.")
+        return HttpResponse(content, content_type=CHART_CONTENT_TYPES[fmt])
+
+    def add_cache_headers(self, response, etag, version):
+        response['ETag'] = etag
+        if self.request.GET.get('v') == version:
+            # Versioned URL: content can never change
+            patch_cache_control(response, public=True, max_age=CHART_MAX_AGE)
+        else:
+            patch_cache_control(response, no_cache=True)
+        return response
+
+
+class AsyncProductChartView(ProductChartView):
+    """ProductChartView for ASGI, rendering on the bounded compute pool."""
+
+    async def get(self, request, *args, **kwargs):
+        kind, fmt = kwargs['kind'], kwargs['fmt']
+        params = AnalysisParams.from_query(request.GET)
+        product, version = await asyncio.gather(
+            db_stage(self.get_object), db_stage(get_product_version, int(kwargs['pk']))
+        )
+
+        etag = chart_etag(chart_cache_key(product.pk, version, kind, fmt, params))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            content = await compute_stage(get_chart, product, version, kind, fmt, params)
+            response = self.chart_response(content, fmt)
+        return self.add_cache_headers(response, etag, version)
+
+
+class ReorderDashboardView(ListView):
+    """Products that will run out within a week, from precomputed snapshots."""
+
+    template_name = "inventory/reorder_dashboard.html"
+    context_object_name = "snapshots"
+    horizon_days = 7
 
+    def get_queryset(self):
+        self.today = timezone.now().date()
+        return reorder_dashboard_queryset(self.horizon_days, self.today)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['horizon_days'] = self.horizon_days
+        context['today'] = self.today
+        return context
+
+
+class SupplierDashboardView(ListView):
+    """
+    Consumption, critical/low products and lead-time exposure per supplier,
+    with portfolio totals. Every supplier is on one page; the rollups are
+    cached per supplier and computed together on a miss.
+    """
+
+    template_name = "inventory/supplier_dashboard.html"
+    context_object_name = "suppliers"
+
+    # ?sort= values: key on each supplier's rollup, largest first
+    SORT_KEYS = {
+        "exposure": lambda rollup: rollup.exposure,
+        "critical": lambda rollup: (rollup.critical_count, rollup.low_count),
+        "usage": lambda rollup: rollup.daily_usage,
+        "name": None,
+    }
+
+    def get_queryset(self):
+        return Supplier.objects.only("name", "contact_email", "lead_time_days").order_by("name", "id")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        suppliers = list(context['suppliers'])
+        rollups = get_supplier_rollups([supplier.pk for supplier in suppliers])
+        for supplier in suppliers:
+            supplier.rollup = rollups[supplier.pk]
+
+        sort = self.request.GET.get('sort')
+        if sort not in self.SORT_KEYS:
+            sort = "exposure"
+        if self.SORT_KEYS[sort] is not None:
+            # Stable, so ties stay in name order
+            suppliers.sort(key=lambda supplier: self.SORT_KEYS[sort](supplier.rollup), reverse=True)
+        context['suppliers'] = suppliers
+        context['portfolio'] = get_portfolio_rollup()
+        context['current_sort'] = sort
         return context
+
+
+class ConsumptionImportView(PermissionRequiredMixin, View):
+    """
+    POST a CSV or JSON Lines body (or a multipart ``file``) to bulk import
+    consumption logs. The body is streamed, never loaded whole, and must be
+    UTF-8; on a decoding error the batches already written stay imported
+    and the 400 response reports them.
+
+    Authentication is the admin session only, so CSRF protection applies:
+    clients log in and send the ``csrftoken`` cookie value back in the
+    ``X-CSRFToken`` header.
+    """
+
+    permission_required = "inventory.add_consumptionlog"
+    raise_exception = True
+    http_method_names = ["post"]
+
+    def post(self, request, *args, **kwargs):
+        if request.content_type == "multipart/form-data":
+            upload = request.FILES.get("file")
+            if upload is None:
+                return JsonResponse({"error": "Missing 'file' upload"}, status=400)
+            name, content_type, raw_lines = upload.name, upload.content_type, upload
+        else:
+            name, content_type, raw_lines = "", request.content_type, request
+
+        fmt = request.GET.get("format") or guess_format(name, content_type)
+        if fmt not in IMPORT_FORMATS:
+            return JsonResponse({"error": f"Unsupported format: {fmt}"}, status=400)
+        try:
+            batch_size = int(request.GET.get("batch_size", IMPORT_BATCH_SIZE))
+        except ValueError:
+            return JsonResponse({"error": "Invalid batch_size"}, status=400)
+
+        lines = codecs.iterdecode(raw_lines, "utf-8")
+        report = ImportReport()
+        try:
+            import_consumption(
+                lines,
+                fmt,
+                batch_size=max(1, batch_size),
+                update_stock=request.GET.get("update_stock", "1") != "0",
+                report=report,
+            )
+        except UnicodeDecodeError as e:
+            return JsonResponse({"error": f"Body is not valid UTF-8: {e.reason}", **report.as_dict()}, status=400)
+        return JsonResponse(report.as_dict())
+
+
+class ExportView(PermissionRequiredMixin, View):
+    """
+    GET consumption history or forecast snapshots as a streamed CSV or
+    Parquet download, filtered by ``sku`` (repeatable), ``supplier`` and
+    ``start``/``end`` dates: log dates for consumption, depletion dates for
+    forecasts.
+    """
+
+    kind = "consumption"
+    permission_required = "inventory.view_consumptionlog"
+    raise_exception = True
+    http_method_names = ["get"]
+
+    def get(self, request, *args, **kwargs):
+        fmt = request.GET.get("format", "csv")
+        try:
+            filters = ExportFilters.from_query(request.GET)
+            chunks = stream_export(self.kind, fmt, filters)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        if isinstance(request, ASGIRequest):
+            chunks = aiter_export(chunks)
+        response = StreamingHttpResponse(chunks, content_type=EXPORT_CONTENT_TYPES[fmt])
+        filename = export_filename(self.kind, fmt, timezone.localdate())
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+@method_decorator(gzip_page, name="dispatch")
+class ProductAPIView(View):
+    """
+    GET products as JSON (see inventory.api): one by SKU, a batch by
+    ``sku`` (repeatable or comma-separated) or keyset pages (``cursor``),
+    projected to ``fields`` and analysed with the detail page's parameters.
+    Unchanged data is answered with a 304 before any payload is built.
+    """
+
+    http_method_names = ["get"]
+
+    def get(self, request, sku=None):
+        try:
+            fields = parse_fields(request.GET.get("fields"))
+            skus = [sku] if sku is not None else parse_skus(request.GET)
+            params = AnalysisParams.from_query(request.GET, strict=True)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        queryset = api_queryset(fields)
+        if skus:
+            found = {product.sku: product for product in queryset.filter(sku__in=skus)}
+            products = [found[s] for s in skus if s in found]
+            body = {"missing": [s for s in skus if s not in found]}
+            if sku is not None and not products:
+                return JsonResponse({"error": f"Unknown SKU: {sku}"}, status=404)
+        else:
+            paginator = KeysetPaginator(queryset, ("sku", "id"), API_PAGE_SIZE)
+            page = paginator.get_page(request.GET.get("cursor"))
+            products = list(page)
+            body = {"next_cursor": page.next_cursor}
+
+        etag, last_modified = api_validators(
+            products, fields, params, sorted(body.items()), listing=sku is None
+        )
+        last_modified = int(last_modified.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            payloads = product_payloads(products, fields, params)
+            if sku is not None:
+                body = payloads[0]
+            else:
+                body["products"] = payloads
+            response = JsonResponse(body, json_dumps_params=JSON_DUMPS_PARAMS)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+class InstrumentationStatsView(UserPassesTestMixin, View):
+    """p50/p95 timings per view and span since startup (staff only)."""
+
+    raise_exception = True
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        if not instrumentation.is_enabled():
+            raise Http404("Instrumentation is disabled.")
+        return JsonResponse(instrumentation.stats.summary())
@@ -0,0 +1,182 @@
+"""
+Background workers for queued analysis jobs (see inventory.jobs).
+
+A job recomputes the product's forecast snapshot and, for the default
+analysis settings, the detail page analysis and both chart images, which
+views then serve from PrecomputedAnalysis instead of computing them in the
+request. Jobs run in a process pool, so CPU-bound chart renders run in
+parallel and every process has its own database connection.
+"""
+import logging
+import multiprocessing
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+
+import django
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .analytics import AnalysisParams
+from .charts import CHART_KINDS, PRECOMPUTED_CHART_FORMAT, render_chart
+from .forecast_cache import get_analysis
+from .instrumentation import record_cache
+from .jobs import claim_jobs, fail_job, finish_job, requeue_stuck_jobs
+from .models import PrecomputedAnalysis, Product
+from .snapshots import compute_forecast_snapshots
+
+logger = logging.getLogger(__name__)
+
+# Products handed to a worker process per task; forecasts are batched
+JOBS_PER_TASK = 20
+POLL_INTERVAL = 2.0
+
+PRECOMPUTED_FIELDS = [
+    "computed_at",
+    "has_data",
+    "consumption_rmse",
+    "stock_rmse",
+    "days_left",
+    "consumption_chart",
+    "stock_chart",
+    "is_stale",
+]
+
+
+def build_precomputed_analysis(product, now):
+    params = AnalysisParams()
+    analysis = get_analysis(product, params)
+    if analysis is None:
+        return PrecomputedAnalysis(product=product, computed_at=now, has_data=False)
+    return PrecomputedAnalysis(
+        product=product,
+        computed_at=now,
+        has_data=True,
+        consumption_rmse=analysis["consumption_rmse"],
+        stock_rmse=analysis["stock_rmse"],
+        days_left=analysis["days_left"],
+        **{
+            f"{kind}_chart": render_chart(product, analysis, kind, params, PRECOMPUTED_CHART_FORMAT)
+            for kind in CHART_KINDS
+        },
+    )
+
+
+def run_jobs(jobs):
+    """
+    Run claimed ``[(job_id, product_id, generation)]`` jobs. Returns the
+    number that completed; failures are recorded on the job.
+    """
+    products = Product.objects.in_bulk([product_id for _, product_id, _ in jobs])
+    try:
+        compute_forecast_snapshots(list(products))
+    except Exception:
+        logger.exception("Forecast snapshots for %s products failed", len(products))
+        error = traceback.format_exc()
+        for job_id, _, generation in jobs:
+            fail_job(job_id, generation, error)
+        return 0
+
+    now = timezone.now()
+    completed = 0
+    for job_id, product_id, generation in jobs:
+        try:
+            precomputed = build_precomputed_analysis(products[product_id], now)
+            with transaction.atomic():
+                # Requested again while running: store the results as stale,
+                # the job is pending again and will replace them
+                precomputed.is_stale = not finish_job(job_id, generation)
+                PrecomputedAnalysis.objects.bulk_create(
+                    [precomputed],
+                    update_conflicts=True,
+                    unique_fields=["product"],
+                    update_fields=PRECOMPUTED_FIELDS,
+                )
+        except Exception:
+            logger.exception("Analysis job %s for product %s failed", job_id, product_id)
+            fail_job(job_id, generation, traceback.format_exc())
+        else:
+            completed += 1
+    return completed
+
+
+def _run_task(jobs):
+    try:
+        return run_jobs(jobs)
+    finally:
+        connections.close_all()
+
+
+def process_jobs(workers=1, jobs_per_task=JOBS_PER_TASK, poll_interval=POLL_INTERVAL, once=False):
+    """
+    Claim and run queued jobs until interrupted, or with ``once`` until the
+    queue is empty. ``workers=0`` runs them in this process. Returns the
+    number of completed jobs.
+    """
+    if workers < 1:
+        completed = 0
+        while True:
+            requeue_stuck_jobs()
+            jobs = claim_jobs(jobs_per_task)
+            if jobs:
+                completed += run_jobs(jobs)
+            elif once:
+                return completed
+            else:
+                time.sleep(poll_interval)
+
+    # Children open their own connections; don't hand them ours
+    connections.close_all()
+    completed = 0
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=django.setup) as pool:
+        running = set()
+        while True:
+            requeue_stuck_jobs()
+            # Keep one task queued behind each busy process
+            while len(running) < 2 * workers:
+                jobs = claim_jobs(jobs_per_task)
+                if not jobs:
+                    break
+                running.add(pool.submit(_run_task, jobs))
+            if not running:
+                if once:
+                    return completed
+                time.sleep(poll_interval)
+                continue
+            done, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            completed += sum(future.result() for future in done)
+
+
+def precomputed_result(row):
+    if not row.has_data:
+        return None
+    result = {
+        "consumption_rmse": row.consumption_rmse,
+        "stock_rmse": row.stock_rmse,
+        "days_left": row.days_left,
+    }
+    if row.days_left > 0:
+        result["prediction_date"] = timezone.now().date() + timedelta(days=row.days_left)
+        result["days_remaining"] = int(row.days_left)
+    return result
+
+
+def get_detail_analysis(product, params):
+    """
+    The analysis shown on the product detail page: the precomputed one for
+    the default settings while it is fresh, otherwise the cached or newly
+    computed ``analyse_product`` result. Precomputed results have no series
+    or trend lines.
+    """
+    if params == AnalysisParams():
+        row = (
+            PrecomputedAnalysis.objects.filter(product=product, is_stale=False)
+            .only("has_data", "consumption_rmse", "stock_rmse", "days_left")
+            .first()
+        )
+        record_cache("precomputed", row is not None, row is None)
+        if row is not None:
+            return precomputed_result(row)
+    return get_analysis(product, params)
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "inventory.instrumentation.InstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -113,6 +114,32 @@ USE_I18N = True
 USE_TZ = True
 
 
+# Product list search: "contains" (substring) or "prefix" (faster on SQLite
+# for large catalogs)
+INVENTORY_PRODUCT_SEARCH = os.environ.get("INVENTORY_PRODUCT_SEARCH", "contains")
+
+# Per-request query/cache/span timings (Server-Timing header, logs and
+# /instrumentation/stats/). The middleware disables itself when off.
+INVENTORY_INSTRUMENTATION = os.environ.get("INVENTORY_INSTRUMENTATION") == "1"
+
+# Queue forecast/chart recomputation on writes for the run_forecast_workers
+# command; views serve its results and compute inline until they are ready.
+INVENTORY_BACKGROUND_ANALYSIS = os.environ.get("INVENTORY_BACKGROUND_ANALYSIS") == "1"
+
+# Serve the product list, detail and chart pages with async views (for
+# ASGI deployments, see asgi.py).
+INVENTORY_ASYNC_VIEWS = os.environ.get("INVENTORY_ASYNC_VIEWS") == "1"
+
+# Default product detail date window ("30", "90", "365" days up to the last
+# logged day, or "all") and the trailing days forecasts are fitted on.
+INVENTORY_ANALYSIS_WINDOW = os.environ.get("INVENTORY_ANALYSIS_WINDOW", "365")
+INVENTORY_FORECAST_WINDOW_DAYS = int(os.environ.get("INVENTORY_FORECAST_WINDOW_DAYS", "365"))
+
+# Read API (/api/products/): SKUs per batch lookup and products per page
+INVENTORY_API_MAX_SKUS = int(os.environ.get("INVENTORY_API_MAX_SKUS", "100"))
+INVENTORY_API_PAGE_SIZE = int(os.environ.get("INVENTORY_API_PAGE_SIZE", "100"))
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 